@@ -1,3 +1,6 @@
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 
 import bcrypt
@@ -7,25 +10,51 @@ from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
 from backend.config import settings
-from backend.database import get_db
+from backend.database import SessionLocal
 from backend.models import User
 
 security = HTTPBearer(auto_error=False)
 
 
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user, established from a verified token.
+
+    Handlers only need the id and username, so authenticating a request
+    does not load the User row or open a DB session.
+    """
+
+    id: int
+    username: str
+
+
+# user_id -> (username, token_epoch, monotonic time the entry expires)
+_users: dict[int, tuple[str, int, float]] = {}
+_users_lock = threading.Lock()
+
+
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)).decode()
 
 
 def verify_password(password: str, password_hash: str) -> bool:
     return bcrypt.checkpw(password.encode(), password_hash.encode())
 
 
-def create_token(user_id: int, username: str) -> str:
+def needs_rehash(password_hash: str) -> bool:
+    """Whether a hash was made with a cost other than BCRYPT_ROUNDS ("$2b$12$...")."""
+    try:
+        return int(password_hash.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def create_token(user_id: int, username: str, token_epoch: int = 0) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=settings.JWT_EXPIRE_MINUTES)
     payload = {
         "sub": str(user_id),
         "username": username,
+        "epoch": token_epoch,
         "exp": expire,
     }
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
@@ -41,11 +70,50 @@ def decode_token(token: str) -> dict:
         )
 
 
+def _user_state(user_id: int) -> tuple[str, int] | None:
+    """(username, token_epoch) of a user, cached for AUTH_USER_CACHE_TTL seconds."""
+    now = time.monotonic()
+    with _users_lock:
+        entry = _users.get(user_id)
+    if entry is not None and entry[2] > now:
+        return entry[0], entry[1]
+
+    db = SessionLocal()
+    try:
+        row = db.query(User.username, User.token_epoch).filter(User.id == user_id).first()
+    finally:
+        db.close()
+    if row is None:
+        forget_user(user_id)
+        return None
+    state = (row.username, row.token_epoch or 0)
+    with _users_lock:
+        _users[user_id] = (*state, now + settings.AUTH_USER_CACHE_TTL)
+    return state
+
+
+def forget_user(user_id: int):
+    """Drop a user's cached state so the next request reads it again."""
+    with _users_lock:
+        _users.pop(user_id, None)
+
+
+def revoke_tokens(db: Session, user: User):
+    """Invalidate every token issued to the user so far (logout, password change).
+
+    Tokens carry the user's token_epoch; bumping it makes older tokens fail
+    verification, immediately in this process and within
+    AUTH_USER_CACHE_TTL seconds in other workers. Caller commits.
+    """
+    user.token_epoch = (user.token_epoch or 0) + 1
+    db.flush()
+    forget_user(user.id)
+
+
 def get_current_user(
     request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-) -> User:
+) -> Principal:
     token = None
     if credentials:
         token = credentials.credentials
@@ -59,10 +127,17 @@ def get_current_user(
         )
 
     payload = decode_token(token)
-    user = db.query(User).filter(User.id == int(payload["sub"])).first()
-    if not user:
+    user_id = int(payload["sub"])
+    state = _user_state(user_id)
+    if state is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario no encontrado",
         )
-    return user
+    username, token_epoch = state
+    if payload.get("epoch", 0) != token_epoch:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Sesión cerrada, vuelve a iniciar sesión",
+        )
+    return Principal(id=user_id, username=username)
@@ -20,6 +20,12 @@ class Settings:
     JWT_SECRET: str = os.getenv("JWT_SECRET", "change-me-to-a-random-secret")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
     JWT_EXPIRE_MINUTES: int = int(os.getenv("JWT_EXPIRE_MINUTES", "1440"))
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))  # existing hashes are upgraded on login
+    HASH_WORKERS: int = int(os.getenv("HASH_WORKERS", "2"))  # thread pool for bcrypt
+    LOGIN_USER_CONCURRENCY: int = int(os.getenv("LOGIN_USER_CONCURRENCY", "1"))  # in-flight checks per username
+    LOGIN_MAX_ATTEMPTS: int = int(os.getenv("LOGIN_MAX_ATTEMPTS", "10"))  # failed logins per username per window
+    LOGIN_ATTEMPT_WINDOW: float = float(os.getenv("LOGIN_ATTEMPT_WINDOW", "300"))
+    AUTH_USER_CACHE_TTL: float = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))  # seconds a revocation may take to reach other workers
 
     # App credentials (set in Coolify env vars)
     APP_USERNAME: str = os.getenv("APP_USERNAME", "")
@@ -30,11 +36,74 @@ class Settings:
     GOOGLE_CLIENT_SECRET: str = os.getenv("GOOGLE_CLIENT_SECRET", "")
     GOOGLE_REDIRECT_URI: str = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/api/google/callback")
     GOOGLE_TOKEN_ENCRYPTION_KEY: str = os.getenv("GOOGLE_TOKEN_ENCRYPTION_KEY", "")
+    GOOGLE_SERVICE_CACHE_TTL: float = float(os.getenv("GOOGLE_SERVICE_CACHE_TTL", "1800"))
+    GOOGLE_SERVICE_CACHE_SIZE: int = int(os.getenv("GOOGLE_SERVICE_CACHE_SIZE", "64"))
+    GOOGLE_WORKERS: int = int(os.getenv("GOOGLE_WORKERS", "8"))  # thread pool for blocking Google calls
+    GOOGLE_USER_CONCURRENCY: int = int(os.getenv("GOOGLE_USER_CONCURRENCY", "2"))  # in-flight calls per user
+    GOOGLE_REFRESH_LEAD_SECONDS: float = float(os.getenv("GOOGLE_REFRESH_LEAD_SECONDS", "300"))
+    GOOGLE_REFRESH_INTERVAL: float = float(os.getenv("GOOGLE_REFRESH_INTERVAL", "60"))
+    GOOGLE_REFRESH_ACTIVE_SECONDS: float = float(os.getenv("GOOGLE_REFRESH_ACTIVE_SECONDS", "900"))
+    GOOGLE_CREDENTIALS_IDLE_TTL: float = float(os.getenv("GOOGLE_CREDENTIALS_IDLE_TTL", "3600"))
+    CALENDAR_SYNC_INTERVAL: float = float(os.getenv("CALENDAR_SYNC_INTERVAL", "60"))  # local mirror freshness
+    CALENDAR_MIRROR_PAST_DAYS: int = int(os.getenv("CALENDAR_MIRROR_PAST_DAYS", "365"))
+    CALENDAR_MIRROR_FUTURE_DAYS: int = int(os.getenv("CALENDAR_MIRROR_FUTURE_DAYS", "730"))
+    CALENDAR_RETRY_INTERVAL: float = float(os.getenv("CALENDAR_RETRY_INTERVAL", "3600"))  # after a failed full sync
+    GMAIL_SYNC_INTERVAL: float = float(os.getenv("GMAIL_SYNC_INTERVAL", "60"))  # local mail index freshness
+    GMAIL_INDEX_MAX_MESSAGES: int = int(os.getenv("GMAIL_INDEX_MAX_MESSAGES", "500"))  # initial backfill
+    GMAIL_INDEX_MAX_UNREAD: int = int(os.getenv("GMAIL_INDEX_MAX_UNREAD", "1000"))  # unread ones backfilled too
+    GMAIL_INDEX_BODY_CHARS: int = int(os.getenv("GMAIL_INDEX_BODY_CHARS", "20000"))
+    # Gmail/Drive list results: served fresh for TTL, revalidated up to MAX_AGE
+    GOOGLE_CACHE_TTL: float = float(os.getenv("GOOGLE_CACHE_TTL", "30"))
+    GOOGLE_CACHE_MAX_AGE: float = float(os.getenv("GOOGLE_CACHE_MAX_AGE", "600"))
+    GOOGLE_CACHE_SIZE: int = int(os.getenv("GOOGLE_CACHE_SIZE", "512"))
 
     # App
     APP_PORT: int = int(os.getenv("APP_PORT", "8000"))
     DATA_DIR: str = os.getenv("DATA_DIR", "/data")
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:////data/secretaria.db")
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")  # bearer token for /metrics; empty = disabled
+
+    # Database connections
+    DB_ASYNC_ENABLED: bool = os.getenv("DB_ASYNC_ENABLED", "true").lower() in ("1", "true", "yes")
+    ASYNC_DATABASE_URL: str = os.getenv("ASYNC_DATABASE_URL", "")  # derived from DATABASE_URL if empty
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_CONNECT_TIMEOUT: float = float(os.getenv("DB_CONNECT_TIMEOUT", "10"))  # PostgreSQL only
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+    # Background text extraction
+    EXTRACTION_WORKERS: int = int(os.getenv("EXTRACTION_WORKERS", "2"))
+    EXTRACTION_WAIT_SECONDS: float = float(os.getenv("EXTRACTION_WAIT_SECONDS", "15"))
+    JOB_HEARTBEAT_INTERVAL: float = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+    JOB_STALE_SECONDS: float = float(os.getenv("JOB_STALE_SECONDS", "120"))  # running job with no heartbeat is requeued
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))  # fan out larger PDFs
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+    XLSX_MAX_CHARS: int = int(os.getenv("XLSX_MAX_CHARS", "200000"))  # spreadsheet rows kept for indexing
+
+    # Chat context (approximate tokens sent to the LLM per turn)
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "16000"))
+    CONTEXT_MAX_MESSAGES: int = int(os.getenv("CONTEXT_MAX_MESSAGES", "200"))
+    CONTEXT_SUMMARY_CHARS: int = int(os.getenv("CONTEXT_SUMMARY_CHARS", "2000"))
+    RETRIEVAL_TOP_K: int = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+
+    # Outbound HTTP (shared keep-alive pools per upstream host)
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "120"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+
+    # File delivery
+    FILE_CACHE_MAX_AGE: int = int(os.getenv("FILE_CACHE_MAX_AGE", "86400"))  # browser cache for stored uploads
+    THUMBNAIL_QUALITY: int = int(os.getenv("THUMBNAIL_QUALITY", "80"))  # WebP quality of image derivatives
+    THUMBNAIL_WORKERS: int = int(os.getenv("THUMBNAIL_WORKERS", "1"))  # process pool, separate from extraction
+    THUMBNAIL_MAX_PIXELS: int = int(os.getenv("THUMBNAIL_MAX_PIXELS", "50000000"))  # larger images get none
+    FILE_ACCEL_REDIRECT: str = os.getenv("FILE_ACCEL_REDIRECT", "")  # nginx internal location for DATA_DIR, e.g. /_files/
 
     # Upload
     MAX_UPLOAD_SIZE: int = 20 * 1024 * 1024  # 20 MB
@@ -1,16 +1,121 @@
-from sqlalchemy import create_engine
+import logging
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.concurrency import run_in_threadpool
 
 from backend.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    echo=False,
-)
+logger = logging.getLogger(__name__)
+
+SYNC_DRIVERS = {"postgresql": "psycopg"}
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+APPLICATION_NAME = "secretaria"
+
+
+def _is_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+
+def _database_url():
+    """DATABASE_URL with the driver this app ships with made explicit."""
+    raw = settings.DATABASE_URL
+    if raw.startswith("postgres://"):  # Heroku-style scheme
+        raw = "postgresql://" + raw[len("postgres://"):]
+    url = make_url(raw)
+    driver = SYNC_DRIVERS.get(url.drivername)
+    return url.set(drivername=f"{url.drivername}+{driver}") if driver else url
+
+
+def _connect_args(url) -> dict:
+    if _is_sqlite(url):
+        return {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if url.get_driver_name() == "asyncpg":
+        return {
+            "timeout": settings.DB_CONNECT_TIMEOUT,
+            "server_settings": {"application_name": APPLICATION_NAME},
+        }
+    if url.get_backend_name() == "postgresql":
+        return {"connect_timeout": int(settings.DB_CONNECT_TIMEOUT), "application_name": APPLICATION_NAME}
+    return {}
+
+
+def _pool_kwargs(url) -> dict:
+    if _is_sqlite(url) and url.database in (None, "", ":memory:"):
+        return {}  # in-memory SQLite lives in a single connection
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": not _is_sqlite(url),
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a writer commits; NORMAL is durable in WAL
+    # mode except for the last transactions on power loss
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def _create_engine():
+    url = _database_url()
+    sync_engine = create_engine(url, connect_args=_connect_args(url), echo=False, **_pool_kwargs(url))
+    if _is_sqlite(url):
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+    return sync_engine
+
+
+def _async_url():
+    if settings.ASYNC_DATABASE_URL:
+        return make_url(settings.ASYNC_DATABASE_URL)
+    url = _database_url()
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}") if driver else None
+
+
+def _create_async_engine():
+    """Async engine for the configured database, or None if disabled or the driver is missing."""
+    if not settings.DB_ASYNC_ENABLED:
+        return None
+    url = _async_url()
+    if url is None:
+        return None
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        kwargs = _pool_kwargs(url)
+        if _is_sqlite(url) and kwargs:
+            kwargs["poolclass"] = AsyncAdaptedQueuePool  # aiosqlite defaults to NullPool
+        async_engine = create_async_engine(url, connect_args=_connect_args(url), echo=False, **kwargs)
+    except ImportError as e:
+        logger.warning("DB_ASYNC_ENABLED is set but the async driver is missing (%s); "
+                       "using the sync engine", e)
+        return None
+    if _is_sqlite(url):
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return async_engine
+
+
+engine = _create_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = _create_async_engine()
+
+AsyncSessionLocal = None
+if async_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -22,6 +127,41 @@ def get_db():
         db.close()
 
 
+def _run_sync(fn, args, kwargs):
+    db = SessionLocal()
+    try:
+        result = fn(db, *args, **kwargs)
+        db.commit()
+        return result
+    finally:
+        db.close()
+
+
+async def run_in_session(fn, *args, **kwargs):
+    """Run `fn(session, *args, **kwargs)` in a new session and commit, without blocking the loop.
+
+    Uses the async engine when available (fn runs on the loop through
+    AsyncSession.run_sync, with I/O awaited by the driver); otherwise fn runs
+    with a sync session on the threadpool.
+    """
+    if AsyncSessionLocal is None:
+        return await run_in_threadpool(_run_sync, fn, args, kwargs)
+    async with AsyncSessionLocal() as session:
+        result = await session.run_sync(fn, *args, **kwargs)
+        await session.commit()
+        return result
+
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+
+
 def init_db():
     import backend.models  # noqa: F401 — registers all models
-    Base.metadata.create_all(bind=engine)
+    from backend.migrations import upgrade
+    upgrade(engine)
+
+    from backend.services.search_index import init_search_index
+    init_search_index(engine)
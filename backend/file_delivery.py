@@ -0,0 +1,102 @@
+"""HTTP delivery of stored files.
+
+`send_file` builds the response for a file the caller has already
+authorised:
+
+- ETag: the caller's digest when the content behind the URL never changes
+  (the sha256 of blob-store files), otherwise mtime+size as nginx does.
+  A matching If-None-Match answers 304 without touching the file.
+- Cache-Control: private (responses are per user); files with a digest are
+  also cacheable for FILE_CACHE_MAX_AGE seconds, others must revalidate.
+- Range / If-Range requests are answered with 206 by FileResponse.
+- Bodies are sent with the ASGI pathsend extension (zero-copy sendfile)
+  when the server offers it, else streamed in chunks.
+- With FILE_ACCEL_REDIRECT set, files under DATA_DIR are handed to nginx
+  with an X-Accel-Redirect header instead, so nginx does the transfer,
+  Range handling and sendfile. The prefix must map to an `internal`
+  location aliased to DATA_DIR, e.g.
+
+      location /_files/ { internal; alias /data/; }
+"""
+
+import os
+from mimetypes import guess_type
+from urllib.parse import quote
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from backend.config import settings
+
+
+class _FileResponse(FileResponse):
+    """FileResponse that uses the pathsend extension for full-body responses."""
+
+    async def _handle_simple(self, send: Send, send_header_only: bool) -> None:
+        if send_header_only or not self._pathsend:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self._pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _content_disposition(filename: str, inline: bool) -> str:
+    kind = "inline" if inline else "attachment"
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{kind}; filename*=utf-8''{quoted}"
+    return f'{kind}; filename="{filename}"'
+
+
+def _accel_path(path: str) -> str | None:
+    root = os.path.realpath(settings.DATA_DIR)
+    real = os.path.realpath(path)
+    if os.path.commonpath([root, real]) != root:
+        return None
+    return settings.FILE_ACCEL_REDIRECT.rstrip("/") + "/" + quote(os.path.relpath(real, root))
+
+
+def send_file(
+    request: Request,
+    path: str,
+    filename: str,
+    media_type: str | None,
+    digest: str | None = None,
+    inline: bool = False,
+) -> Response:
+    """Response for a stored file. Raises FileNotFoundError if it is missing on disk."""
+    media_type = media_type or guess_type(filename)[0] or "application/octet-stream"
+    headers = {"Content-Disposition": _content_disposition(filename, inline)}
+    if digest:
+        etag = f'"{digest}"'
+        headers["Cache-Control"] = f"private, max-age={settings.FILE_CACHE_MAX_AGE}"
+        if _etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers={"ETag": etag, **headers})
+        stat_result = os.stat(path)
+    else:
+        stat_result = os.stat(path)
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        headers["Cache-Control"] = "private, no-cache"
+        if _etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers={"ETag": etag, **headers})
+    headers["ETag"] = etag
+
+    if settings.FILE_ACCEL_REDIRECT:
+        accel = _accel_path(path)
+        if accel:
+            headers["X-Accel-Redirect"] = accel
+            return Response(media_type=media_type, headers=headers)
+
+    return _FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
@@ -1,14 +1,19 @@
 import os
+import secrets
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
-from backend.auth import hash_password, verify_password
+from backend.auth import hash_password, needs_rehash, revoke_tokens, verify_password
 from backend.config import settings
-from backend.database import init_db, SessionLocal
+from backend.database import dispose_engines, init_db, SessionLocal
 from backend.models import User
+from backend.pagination import NEXT_CURSOR_HEADER
+from backend.services import google_async, http_client, jobs, password_hashing
+from backend.services.metrics import render_metrics
 from backend.routers import auth as auth_router
 from backend.routers import chat as chat_router
 from backend.routers import upload as upload_router
@@ -16,18 +21,34 @@ from backend.routers import documents as documents_router
 from backend.routers import telegram as telegram_router
 from backend.routers import files as files_router
 from backend.routers import google as google_router
+from backend.routers import search as search_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Create data sub-directories
-    for subdir in ["documentos", "imagenes", "generados"]:
+    for subdir in ["documentos", "imagenes", "generados", "tmp"]:
         os.makedirs(os.path.join(settings.DATA_DIR, subdir), exist_ok=True)
     # Initialize database tables
     init_db()
     # Auto-create/update admin user from env vars
     _ensure_admin_user()
-    yield
+    # Shared outbound HTTP pools (LLM providers, Telegram, Google OAuth)
+    http_client.init_clients()
+    # Background text extraction (process pool)
+    jobs.start()
+    # Blocking Google API calls (thread pool)
+    google_async.start()
+    # Password hashing for logins (thread pool)
+    password_hashing.start()
+    try:
+        yield
+    finally:
+        await jobs.shutdown()
+        await google_async.shutdown()
+        await password_hashing.shutdown()
+        await http_client.close_clients()
+        await dispose_engines()
 
 
 def _ensure_admin_user():
@@ -39,6 +60,10 @@ def _ensure_admin_user():
         user = db.query(User).filter(User.username == settings.APP_USERNAME).first()
         if user:
             if not verify_password(settings.APP_PASSWORD, user.password_hash):
+                user.password_hash = hash_password(settings.APP_PASSWORD)
+                revoke_tokens(db, user)
+                db.commit()
+            elif needs_rehash(user.password_hash):
                 user.password_hash = hash_password(settings.APP_PASSWORD)
                 db.commit()
         else:
@@ -64,11 +89,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "http_pools": http_client.pool_stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    """Prometheus scrape endpoint, for requests bearing METRICS_TOKEN."""
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+    if not secrets.compare_digest(request.headers.get("authorization", "").encode(), expected):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 # Routers
@@ -79,6 +116,7 @@ app.include_router(documents_router.router)
 app.include_router(telegram_router.router)
 app.include_router(files_router.router)
 app.include_router(google_router.router)
+app.include_router(search_router.router)
 
 # Static frontend files — must be last (catches all unmatched paths)
 frontend_dir = os.path.join(os.path.dirname(__file__), "..", "frontend")
@@ -0,0 +1,86 @@
+"""Maintenance commands.
+
+Usage:
+    python -m backend.manage gc [--dry-run]
+    python -m backend.manage migrate [--status]
+    python -m backend.manage check-plans
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from backend.database import SessionLocal, engine, init_db
+
+
+def cmd_gc(args):
+    from backend.services.blob_store import collect_garbage
+
+    db = SessionLocal()
+    try:
+        stats = collect_garbage(db, dry_run=args.dry_run)
+    finally:
+        db.close()
+    print(json.dumps(stats, indent=2))
+
+
+def cmd_migrate(args):
+    from backend import migrations
+    import backend.models  # noqa: F401 — registers all models
+
+    if not args.status:
+        applied = migrations.upgrade(engine)
+        print(f"Applied migrations: {applied or 'none'}")
+    state = migrations.status(engine)
+    print(json.dumps(state, indent=2))
+    if state["pending"] or state["missing_indexes"]:
+        sys.exit(1)
+
+
+def cmd_check_plans(args):
+    from backend.query_plans import check
+
+    db = SessionLocal()
+    try:
+        results = check(db)
+    finally:
+        db.close()
+    failed = {name: r["full_scans"] for name, r in results.items() if r["full_scans"]}
+    if args.verbose:
+        print(json.dumps(results, indent=2))
+    for name in results:
+        if name in failed:
+            print(f"FAIL {name}: full scan of {', '.join(failed[name])}")
+        else:
+            print(f"ok   {name}")
+    if failed:
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.manage")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gc = sub.add_parser("gc", help="Delete unreferenced upload blobs and stale temp files")
+    gc.add_argument("--dry-run", action="store_true", help="Report what would be removed")
+    gc.set_defaults(func=cmd_gc)
+
+    migrate = sub.add_parser("migrate", help="Apply pending schema migrations")
+    migrate.add_argument("--status", action="store_true",
+                         help="Only report pending migrations and missing indexes (exit 1 if any)")
+    migrate.set_defaults(func=cmd_migrate, init_db=False)
+
+    plans = sub.add_parser("check-plans", help="EXPLAIN the hot queries and fail on full table scans")
+    plans.add_argument("-v", "--verbose", action="store_true", help="Print every query plan")
+    plans.set_defaults(func=cmd_check_plans)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    if getattr(args, "init_db", True):
+        init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
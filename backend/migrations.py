@@ -0,0 +1,226 @@
+"""Versioned schema migrations.
+
+Migrations are plain functions registered with `@migration(version, name)`
+and applied in order, each in its own transaction, by `upgrade`; applied
+versions are recorded in `schema_migrations`. On PostgreSQL the upgrade
+holds an advisory lock, so several workers or replicas starting at once
+apply each migration exactly once.
+
+Version 1 creates the schema with `create_all`, which also brings databases
+created before versioning existed up to date. Because a fresh database gets
+the current models from version 1, later migrations must be idempotent: use
+`add_column` and `create_index`, which read the definition from the models
+and skip objects that already exist.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, Text, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+
+from backend.database import Base
+
+logger = logging.getLogger(__name__)
+
+ADVISORY_LOCK_KEY = 0x5EC7E7A1  # arbitrary, shared by all workers of this app
+
+_version_table = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", Text, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = []
+
+
+def migration(version: int, name: str):
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+# ── Helpers ──────────────────────────────────────────────────────
+
+
+def _column_ddl(conn: Connection, column) -> str:
+    ddl = f"{column.name} {column.type.compile(dialect=conn.dialect)}"
+    default = None
+    if column.server_default is not None:
+        default = str(column.server_default.arg)
+    elif column.default is not None and column.default.is_scalar:
+        default = repr(column.default.arg) if isinstance(column.default.arg, str) else str(column.default.arg)
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+    if not column.nullable:
+        if default is None:
+            raise ValueError(f"Cannot add NOT NULL column {column} without a default")
+        ddl += " NOT NULL"
+    return ddl
+
+
+def add_column(conn: Connection, table_name: str, column_name: str):
+    """Add a column as declared in the models, unless it already exists."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = Base.metadata.tables[table_name].c[column_name]
+    conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {_column_ddl(conn, column)}"))
+
+
+def create_index(conn: Connection, table_name: str, index_name: str):
+    """Create an index as declared in the models, unless it already exists."""
+    if index_name in {i["name"] for i in inspect(conn).get_indexes(table_name)}:
+        return
+    table = Base.metadata.tables[table_name]
+    index = next(i for i in table.indexes if i.name == index_name)
+    conn.execute(CreateIndex(index))
+
+
+def missing_indexes(conn: Connection) -> list[str]:
+    """Indexes declared in the models that the database does not have."""
+    inspector = inspect(conn)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        missing.extend(i.name for i in table.indexes if i.name not in existing)
+    return sorted(missing)
+
+
+# ── Migrations ───────────────────────────────────────────────────
+
+
+@migration(1, "initial schema")
+def _initial_schema(conn: Connection):
+    Base.metadata.create_all(conn)
+    # Databases created by create_all before versioning: create_all skips
+    # existing tables, so add the nullable columns and indexes added since
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                add_column(conn, table.name, column.name)
+        for index in table.indexes:
+            create_index(conn, table.name, index.name)
+
+
+@migration(2, "full-text search index")
+def _search_index(conn: Connection):
+    from backend.services.search_index import create_search_index
+    create_search_index(conn)
+
+
+@migration(3, "composite indexes for hot queries")
+def _hot_query_indexes(conn: Connection):
+    for table_name, index_name in [
+        ("conversations", "ix_conversations_user_updated"),
+        ("messages", "ix_messages_conversation_created"),
+        ("files", "ix_files_conversation_created"),
+        ("files", "ix_files_message"),
+        ("telegram_contacts", "ix_telegram_contacts_user_created"),
+        ("telegram_sends", "ix_telegram_sends_contact"),
+        ("telegram_sends", "ix_telegram_sends_message"),
+    ]:
+        create_index(conn, table_name, index_name)
+
+
+@migration(4, "token revocation epoch")
+def _token_epoch(conn: Connection):
+    add_column(conn, "users", "token_epoch")
+
+
+@migration(5, "pdf page offsets")
+def _page_offsets(conn: Connection):
+    add_column(conn, "blobs", "page_offsets")
+    add_column(conn, "search_chunks", "page")
+
+
+@migration(6, "calendar mirror window")
+def _calendar_window(conn: Connection):
+    for column_name in ("window_start", "window_end", "sync_error"):
+        add_column(conn, "calendar_sync_state", column_name)
+
+
+@migration(7, "gmail index completeness")
+def _gmail_complete(conn: Connection):
+    add_column(conn, "gmail_sync_state", "complete")
+
+
+@migration(8, "extraction job claims")
+def _job_claims(conn: Connection):
+    add_column(conn, "extraction_jobs", "worker")
+    add_column(conn, "extraction_jobs", "heartbeat_at")
+
+
+@migration(9, "gmail unread backfill")
+def _gmail_unread_complete(conn: Connection):
+    add_column(conn, "gmail_sync_state", "unread_complete")
+
+
+# ── Runner ───────────────────────────────────────────────────────
+
+
+def _applied(conn: Connection) -> set[int]:
+    _version_table.create(conn, checkfirst=True)
+    return set(conn.execute(select(_version_table.c.version)).scalars())
+
+
+def upgrade(engine: Engine) -> list[int]:
+    """Apply pending migrations. Returns the versions applied.
+
+    Afterwards every index declared in the models must exist; if one does
+    not, a migration is missing its `create_index` and RuntimeError is raised.
+    """
+    applied_now = []
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            conn.commit()
+        try:
+            with conn.begin():
+                applied = _applied(conn)
+            for version, name, fn in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info("Applying migration %s: %s", version, name)
+                with conn.begin():
+                    fn(conn)
+                    conn.execute(_version_table.insert().values(
+                        version=version,
+                        name=name,
+                        applied_at=datetime.now(timezone.utc).replace(tzinfo=None),
+                    ))
+                applied_now.append(version)
+            missing = missing_indexes(conn)
+            conn.commit()
+            if missing:
+                raise RuntimeError(f"Indexes missing after migrations: {', '.join(missing)}")
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                conn.commit()
+    return applied_now
+
+
+def status(engine: Engine) -> dict:
+    """Applied and pending versions, and model indexes missing from the database."""
+    with engine.connect() as conn:
+        applied = _applied(conn)
+        conn.commit()
+        return {
+            "dialect": conn.dialect.name,
+            "current": max(applied, default=0),
+            "pending": [v for v, _, _ in MIGRATIONS if v not in applied],
+            "missing_indexes": missing_indexes(conn),
+        }
@@ -1,6 +1,9 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, LargeBinary
+from sqlalchemy import (
+    BigInteger, Column, Integer, Text, DateTime, ForeignKey, Index, LargeBinary, UniqueConstraint,
+)
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship
 
 from backend.database import Base
@@ -10,14 +13,31 @@ def utcnow():
     return datetime.now(timezone.utc)
 
 
+class UTCDateTime(TypeDecorator):
+    """DateTime stored as naive UTC; aware values are converted on the way in.
+
+    SQLite drops the offset silently, but PostgreSQL drivers reject aware
+    values for `timestamp without time zone` columns.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
 class User(Base):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True)
     username = Column(Text, unique=True, nullable=False, index=True)
     password_hash = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=utcnow)
-    last_login = Column(DateTime, nullable=True)
+    created_at = Column(UTCDateTime, default=utcnow)
+    last_login = Column(UTCDateTime, nullable=True)
+    token_epoch = Column(Integer, nullable=False, default=0)  # bumped to revoke issued tokens
 
     conversations = relationship("Conversation", back_populates="user")
     telegram_contacts = relationship("TelegramContact", back_populates="user")
@@ -26,12 +46,16 @@ class User(Base):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # list_conversations: a user's conversations, most recently updated first
+        Index("ix_conversations_user_updated", "user_id", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(Text, default="Nueva conversación")
-    created_at = Column(DateTime, default=utcnow)
-    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
+    created_at = Column(UTCDateTime, default=utcnow)
+    updated_at = Column(UTCDateTime, default=utcnow, onupdate=utcnow)
 
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", order_by="Message.created_at")
@@ -40,13 +64,19 @@ class Conversation(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # get_messages, chat history batches and message counts per conversation
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(Text, nullable=False)  # "user" | "assistant" | "system"
     content = Column(Text, nullable=False)
     model_used = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=utcnow)
+    token_count = Column(Integer, nullable=True)  # cached approximate token count of content
+    context_refs = Column(Text, nullable=True)  # JSON list of search_chunks ids retrieved for this turn
+    created_at = Column(UTCDateTime, default=utcnow)
 
     conversation = relationship("Conversation", back_populates="messages")
     files = relationship("File", back_populates="message")
@@ -55,6 +85,12 @@ class Message(Base):
 
 class File(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        # list_all_files and conversation uploads: files per conversation, newest first
+        Index("ix_files_conversation_created", "conversation_id", "created_at"),
+        # Message.files loads
+        Index("ix_files_message", "message_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True)
@@ -64,8 +100,12 @@ class File(Base):
     file_type = Column(Text, nullable=True)
     mime_type = Column(Text, nullable=True)
     size_bytes = Column(Integer, nullable=True)
+    sha256 = Column(Text, nullable=True, index=True)  # content hash; key into `blobs` for uploads
     extracted_text = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=utcnow)
+    token_count = Column(Integer, nullable=True)  # cached approximate token count of extracted_text
+    summary = Column(Text, nullable=True)  # cached short excerpt used when the full text doesn't fit
+    extraction_status = Column(Text, nullable=True)  # "pending" | "done" | "error"; None for images
+    created_at = Column(UTCDateTime, default=utcnow)
 
     conversation = relationship("Conversation", back_populates="files")
     message = relationship("Message", back_populates="files")
@@ -73,12 +113,15 @@ class File(Base):
 
 class TelegramContact(Base):
     __tablename__ = "telegram_contacts"
+    __table_args__ = (
+        Index("ix_telegram_contacts_user_created", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     name = Column(Text, nullable=False)
     chat_id = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=utcnow)
+    created_at = Column(UTCDateTime, default=utcnow)
 
     user = relationship("User", back_populates="telegram_contacts")
     sends = relationship("TelegramSend", back_populates="contact")
@@ -86,12 +129,17 @@ class TelegramContact(Base):
 
 class TelegramSend(Base):
     __tablename__ = "telegram_sends"
+    __table_args__ = (
+        # send_history: sends per contact, newest first
+        Index("ix_telegram_sends_contact", "contact_id", "id"),
+        Index("ix_telegram_sends_message", "message_id"),
+    )
 
     id = Column(Integer, primary_key=True)
     message_id = Column(Integer, ForeignKey("messages.id"), nullable=False)
     contact_id = Column(Integer, ForeignKey("telegram_contacts.id"), nullable=False)
     status = Column(Text, default="pending")
-    sent_at = Column(DateTime, nullable=True)
+    sent_at = Column(UTCDateTime, nullable=True)
 
     message = relationship("Message", back_populates="telegram_sends")
     contact = relationship("TelegramContact", back_populates="sends")
@@ -104,7 +152,121 @@ class GoogleToken(Base):
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
     encrypted_token = Column(LargeBinary, nullable=False)
     scopes = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=utcnow)
-    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow)
+    created_at = Column(UTCDateTime, default=utcnow)
+    updated_at = Column(UTCDateTime, default=utcnow, onupdate=utcnow)
 
     user = relationship("User", back_populates="google_token")
+
+
+class Blob(Base):
+    """Content-addressed upload stored once under DATA_DIR/blobs, shared by File rows."""
+
+    __tablename__ = "blobs"
+
+    sha256 = Column(Text, primary_key=True)
+    size_bytes = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # File rows pointing at this blob
+    extracted_text = Column(Text, nullable=True)  # cached full extraction; None until extracted
+    page_offsets = Column(Text, nullable=True)  # PDFs: space-separated start of each page in extracted_text
+    created_at = Column(UTCDateTime, default=utcnow)
+
+
+class ExtractionJob(Base):
+    __tablename__ = "extraction_jobs"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(Integer, ForeignKey("files.id"), nullable=False, index=True)
+    status = Column(Text, nullable=False, default="pending")  # pending | running | done | error
+    progress = Column(Integer, nullable=False, default=0)  # 0-100
+    error = Column(Text, nullable=True)
+    created_at = Column(UTCDateTime, default=utcnow)
+    started_at = Column(UTCDateTime, nullable=True)
+    finished_at = Column(UTCDateTime, nullable=True)
+    worker = Column(Text, nullable=True)  # host:pid of the process that claimed the job
+    heartbeat_at = Column(UTCDateTime, nullable=True)  # refreshed while running
+
+    file = relationship("File")
+
+
+class SearchChunk(Base):
+    """Paragraph-sized slice of a message or an extracted file, for full-text search."""
+
+    __tablename__ = "search_chunks"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=True, index=True)
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=True, index=True)
+    file_id = Column(Integer, ForeignKey("files.id"), nullable=True, index=True)
+    chunk_index = Column(Integer, nullable=False, default=0)
+    page = Column(Integer, nullable=True)  # 1-based source page, for PDFs
+    content = Column(Text, nullable=False)
+
+
+class CalendarSyncState(Base):
+    """Incremental sync position of a user's mirrored primary calendar."""
+
+    __tablename__ = "calendar_sync_state"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    sync_token = Column(Text, nullable=True)  # Calendar API nextSyncToken
+    last_synced_at = Column(UTCDateTime, nullable=True)  # None forces a sync on next read
+    full_synced_at = Column(UTCDateTime, nullable=True)
+    window_start = Column(UTCDateTime, nullable=True)  # range covered by the last full sync
+    window_end = Column(UTCDateTime, nullable=True)
+    sync_error = Column(Text, nullable=True)  # set when a sync could not complete
+
+
+class CalendarEvent(Base):
+    """Local mirror of one event (single instance) of a user's primary calendar."""
+
+    __tablename__ = "calendar_events"
+    __table_args__ = (UniqueConstraint("user_id", "event_id"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    event_id = Column(Text, nullable=False)
+    summary = Column(Text, nullable=True)
+    description = Column(Text, nullable=True)
+    location = Column(Text, nullable=True)
+    start = Column(Text, nullable=True)  # as returned by the API (dateTime or date)
+    end = Column(Text, nullable=True)
+    start_at = Column(UTCDateTime, nullable=True, index=True)  # naive UTC, for range queries
+    end_at = Column(UTCDateTime, nullable=True)
+    html_link = Column(Text, nullable=True)
+    attendees = Column(Text, nullable=True)  # JSON list of {email, name}
+    updated = Column(Text, nullable=True)
+
+
+class GmailSyncState(Base):
+    """Incremental sync position (Gmail historyId) of a user's local mail index."""
+
+    __tablename__ = "gmail_sync_state"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    history_id = Column(Text, nullable=True)
+    last_synced_at = Column(UTCDateTime, nullable=True)  # None forces a sync on next read
+    full_synced_at = Column(UTCDateTime, nullable=True)
+    complete = Column(Integer, nullable=False, default=0)  # 1 when the backfill reached the oldest message
+    unread_complete = Column(Integer, nullable=False, default=0)  # 1 when every unread message was backfilled
+
+
+class GmailMessage(Base):
+    """Locally indexed Gmail message: headers, snippet, labels and plain-text body."""
+
+    __tablename__ = "gmail_messages"
+    __table_args__ = (UniqueConstraint("user_id", "message_id"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    message_id = Column(Text, nullable=False)
+    thread_id = Column(Text, nullable=True)
+    sender = Column(Text, nullable=True)
+    recipients = Column(Text, nullable=True)
+    subject = Column(Text, nullable=True)
+    date = Column(Text, nullable=True)  # Date header as sent
+    internal_date = Column(BigInteger, nullable=True, index=True)  # ms since epoch, for ordering
+    snippet = Column(Text, nullable=True)
+    labels = Column(Text, nullable=True)  # space-separated label ids
+    unread = Column(Integer, nullable=False, default=0)
+    body = Column(Text, nullable=True)
@@ -0,0 +1,70 @@
+"""Keyset pagination for list endpoints.
+
+Lists are ordered on a (timestamp, id) key and paged with an opaque cursor
+that encodes the key of the last row returned, so each page is an index
+range scan no matter how deep the client scrolls (unlike OFFSET). Endpoints
+keep returning a plain JSON list; the cursor for the next page, if there is
+one, is sent in the `X-Next-Cursor` response header.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """Query parameters shared by paginated endpoints (use as a dependency)."""
+
+    def __init__(
+        self,
+        cursor: str | None = Query(None, description="Opaque cursor from X-Next-Cursor"),
+        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+def encode_cursor(ts: datetime | None, row_id: int) -> str:
+    raw = json.dumps([ts.isoformat() if ts else None, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, row_id = json.loads(raw)
+        return (datetime.fromisoformat(ts) if ts else None), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def paginate(query, ts_col, id_col, page: PageParams, response: Response, descending: bool = True) -> list:
+    """Apply keyset ordering/filtering to `query` and return one page.
+
+    `ts_col` may be None to page on the id alone.
+    """
+    if page.cursor:
+        ts, row_id = decode_cursor(page.cursor)
+        after_id = id_col < row_id if descending else id_col > row_id
+        if ts_col is None:
+            query = query.filter(after_id)
+        else:
+            after_ts = ts_col < ts if descending else ts_col > ts
+            query = query.filter(or_(after_ts, and_(ts_col == ts, after_id)))
+
+    order = [c.desc() if descending else c.asc() for c in (ts_col, id_col) if c is not None]
+    rows = query.order_by(*order).limit(page.limit + 1).all()
+
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        last = rows[-1]
+        ts_value = getattr(last, ts_col.key) if ts_col is not None else None
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(ts_value, getattr(last, id_col.key))
+    return rows
@@ -0,0 +1,160 @@
+"""Query-plan checks for the hot queries.
+
+Each entry in HOT_QUERIES mirrors the shape of a query the API runs on
+every page load (same filters, joins and ordering). `check` asks the
+database to EXPLAIN each of them and reports any full table scan, so a
+dropped index or a query rewritten around one is caught before it reaches
+production. On SQLite this is EXPLAIN QUERY PLAN; on PostgreSQL sequential
+scans are disabled for the check, since on small tables the planner would
+otherwise prefer them even when a usable index exists.
+
+Run with `python -m backend.manage check-plans`.
+"""
+
+import re
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from backend.models import Conversation, File, Message, TelegramContact, TelegramSend
+from backend.pagination import DEFAULT_LIMIT
+
+USER_ID = 1
+CONV_ID = 1
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def _list_conversations():
+    return (
+        select(Conversation)
+        .where(Conversation.user_id == USER_ID)
+        .order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+        .limit(DEFAULT_LIMIT + 1)
+    )
+
+
+def _get_messages():
+    return (
+        select(Message)
+        .where(Message.conversation_id == CONV_ID)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(DEFAULT_LIMIT + 1)
+    )
+
+
+def _history_batch():
+    before = datetime(2000, 1, 1)
+    return (
+        select(Message)
+        .where(
+            Message.conversation_id == CONV_ID,
+            or_(Message.created_at < before, and_(Message.created_at == before, Message.id < 1)),
+        )
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(20)
+    )
+
+
+def _message_count():
+    return select(func.count(Message.id)).where(Message.conversation_id == CONV_ID)
+
+
+def _list_all_files():
+    return (
+        select(File)
+        .join(File.conversation)
+        .where(Conversation.user_id == USER_ID)
+        .order_by(File.created_at.desc(), File.id.desc())
+        .limit(DEFAULT_LIMIT + 1)
+    )
+
+
+def _conversation_files():
+    return (
+        select(File)
+        .where(File.conversation_id == CONV_ID)
+        .order_by(File.created_at.desc(), File.id.desc())
+        .limit(DEFAULT_LIMIT + 1)
+    )
+
+
+def _message_files():
+    return select(File).where(File.message_id.in_([1, 2, 3]))
+
+
+def _list_contacts():
+    return (
+        select(TelegramContact)
+        .where(TelegramContact.user_id == USER_ID)
+        .order_by(TelegramContact.created_at.desc())
+    )
+
+
+def _send_history():
+    return (
+        select(TelegramSend)
+        .join(TelegramSend.contact)
+        .where(TelegramContact.user_id == USER_ID)
+        .order_by(TelegramSend.id.desc())
+        .limit(DEFAULT_LIMIT + 1)
+    )
+
+
+HOT_QUERIES = {
+    "list_conversations": _list_conversations,
+    "get_messages": _get_messages,
+    "history_batch": _history_batch,
+    "message_count": _message_count,
+    "list_all_files": _list_all_files,
+    "conversation_files": _conversation_files,
+    "message_files": _message_files,
+    "list_contacts": _list_contacts,
+    "send_history": _send_history,
+}
+
+# "SCAN messages" is a full scan; "SCAN messages USING INDEX ..." is not
+_SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+_PG_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def explain(db: Session, statement) -> list[str]:
+    rows = db.execute(_Explain(statement)).all()
+    if db.bind.dialect.name == "sqlite":
+        return [r[-1] for r in rows]
+    return [r[0] for r in rows]
+
+
+def full_scans(dialect: str, plan: list[str]) -> list[str]:
+    """Tables read with a full scan in a plan."""
+    pattern = _SQLITE_FULL_SCAN if dialect == "sqlite" else _PG_FULL_SCAN
+    return [m.group(1) for line in plan if (m := pattern.search(line.strip()))]
+
+
+def check(db: Session) -> dict:
+    """EXPLAIN every hot query; returns {name: {"plan": [...], "full_scans": [...]}}."""
+    dialect = db.bind.dialect.name
+    results = {}
+    try:
+        if dialect == "postgresql":
+            db.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, build in HOT_QUERIES.items():
+            plan = explain(db, build())
+            results[name] = {"plan": plan, "full_scans": full_scans(dialect, plan)}
+    finally:
+        db.rollback()
+    return results
@@ -1,12 +1,14 @@
+import math
 from datetime import datetime, timezone
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, field_validator
 from sqlalchemy.orm import Session
 
-from backend.auth import verify_password, create_token
-from backend.database import get_db
+from backend.auth import Principal, create_token, get_current_user, needs_rehash, revoke_tokens
+from backend.database import get_db, run_in_session
 from backend.models import User
+from backend.services import password_hashing
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -38,17 +40,55 @@ class AuthResponse(BaseModel):
 
 
 
+def _find_user(db: Session, username: str):
+    return (
+        db.query(User.id, User.username, User.password_hash, User.token_epoch)
+        .filter(User.username == username)
+        .first()
+    )
+
+
+def _record_login(db: Session, user_id: int, new_hash: str | None):
+    user = db.get(User, user_id)
+    user.last_login = datetime.now(timezone.utc)
+    if new_hash:
+        user.password_hash = new_hash
+
+
 @router.post("/login", response_model=AuthResponse)
-def login(body: AuthRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == body.username).first()
-    if not user or not verify_password(body.password, user.password_hash):
+async def login(body: AuthRequest):
+    user = await run_in_session(_find_user, body.username)
+    try:
+        ok = user is not None and await password_hashing.verify(
+            user.username, body.password, user.password_hash
+        )
+    except password_hashing.TooManyAttempts as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos fallidos, espera unos minutos",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    if not ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario o contraseña incorrectos",
         )
 
-    user.last_login = datetime.now(timezone.utc)
-    db.commit()
+    # Upgrade hashes made with an older BCRYPT_ROUNDS while we have the password
+    new_hash = None
+    if needs_rehash(user.password_hash):
+        new_hash = await password_hashing.compute_hash(body.password)
+    await run_in_session(_record_login, user.id, new_hash)
 
-    token = create_token(user.id, user.username)
+    token = create_token(user.id, user.username, user.token_epoch)
     return AuthResponse(token=token, user_id=user.id, username=user.username)
+
+
+@router.post("/logout")
+def logout(user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Revoke every token issued to the user, including the one used here."""
+    row = db.get(User, user.id)
+    if row:
+        revoke_tokens(db, row)
+        db.commit()
+    return {"ok": True}
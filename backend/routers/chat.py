@@ -1,16 +1,21 @@
 import asyncio
+import json
+import logging
 import os
 import re
+import time
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, selectinload
 
-from backend.auth import get_current_user
-from backend.database import get_db
-from backend.models import User, Conversation, Message, File
+from backend.auth import Principal, get_current_user
+from backend.database import get_db, run_in_session
+from backend.pagination import PageParams, paginate
+from backend.models import Conversation, Message, File, ExtractionJob, TelegramSend
 from backend.services.minimax_ai import chat_completion_stream, SYSTEM_PROMPT
 from backend.services.perplexity import search_completion_stream, SEARCH_SYSTEM_PROMPT
 from backend.services.doc_generator import generate_docx, generate_txt, DOC_SYSTEM_PROMPT
@@ -20,12 +25,15 @@ from backend.services.google_actions import (
     execute_action,
     format_action_context,
 )
-from backend.routers.google import get_valid_credentials
+from backend.services.context_builder import ChatContext, build_context
+from backend.services import blob_store, google_async, jobs, search_index
+from backend.services.metrics import CONTEXT_TOKENS, RequestTimer, record_stream
+from backend.services.tokens import count_tokens
 from backend.config import settings
 
-router = APIRouter(prefix="/api/chat", tags=["chat"])
+logger = logging.getLogger(__name__)
 
-MAX_HISTORY = 50  # max messages sent to the AI
+router = APIRouter(prefix="/api/chat", tags=["chat"])
 
 
 # --- Schemas ---
@@ -83,21 +91,20 @@ class MessageCreate(BaseModel):
 
 @router.get("/conversations", response_model=list[ConversationOut])
 def list_conversations(
-    user: User = Depends(get_current_user),
+    response: Response,
+    page: PageParams = Depends(),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    return (
-        db.query(Conversation)
-        .filter(Conversation.user_id == user.id)
-        .order_by(Conversation.updated_at.desc())
-        .all()
-    )
+    """The user's conversations, most recently updated first (paginated)."""
+    query = db.query(Conversation).filter(Conversation.user_id == user.id)
+    return paginate(query, Conversation.updated_at, Conversation.id, page, response)
 
 
 @router.post("/conversations", response_model=ConversationOut, status_code=status.HTTP_201_CREATED)
 def create_conversation(
     body: ConversationCreate,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     conv = Conversation(
@@ -113,7 +120,7 @@ def create_conversation(
 @router.delete("/conversations/{conv_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_conversation(
     conv_id: int,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     conv = (
@@ -124,17 +131,24 @@ def delete_conversation(
     if not conv:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
 
-    # Delete files from disk
+    # Release uploaded content (blobs are reclaimed by GC) and remove other files
     files = db.query(File).filter(File.conversation_id == conv_id).all()
     for f in files:
-        if f.filepath and os.path.exists(f.filepath):
-            try:
-                os.remove(f.filepath)
-            except OSError:
-                pass
+        blob_store.release(db, f)
 
-    # Delete DB records: files, messages, then conversation
+    # Delete DB records children first (PostgreSQL enforces the foreign keys):
+    # search chunks, jobs, files, telegram sends, messages, then conversation
+    search_index.remove_conversation(db, conv_id)
+    file_ids = [f.id for f in files]
+    if file_ids:
+        db.query(ExtractionJob).filter(ExtractionJob.file_id.in_(file_ids)).delete(
+            synchronize_session=False
+        )
     db.query(File).filter(File.conversation_id == conv_id).delete()
+    message_ids = db.query(Message.id).filter(Message.conversation_id == conv_id).scalar_subquery()
+    db.query(TelegramSend).filter(TelegramSend.message_id.in_(message_ids)).delete(
+        synchronize_session=False
+    )
     db.query(Message).filter(Message.conversation_id == conv_id).delete()
     db.delete(conv)
     db.commit()
@@ -144,7 +158,7 @@ def delete_conversation(
 def rename_conversation(
     conv_id: int,
     body: ConversationRename,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     conv = (
@@ -166,7 +180,9 @@ def rename_conversation(
 @router.get("/conversations/{conv_id}/messages", response_model=list[MessageOut])
 def get_messages(
     conv_id: int,
-    user: User = Depends(get_current_user),
+    response: Response,
+    page: PageParams = Depends(),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     conv = (
@@ -177,98 +193,35 @@ def get_messages(
     if not conv:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
 
-    messages = (
+    # Pages go back in time from the newest message; each page is returned
+    # in chronological order
+    query = (
         db.query(Message)
-        .options(joinedload(Message.files))
+        .options(selectinload(Message.files))
         .filter(Message.conversation_id == conv_id)
-        .order_by(Message.created_at)
-        .all()
     )
-    return messages
+    messages = paginate(query, Message.created_at, Message.id, page, response)
+    return messages[::-1]
 
 
 @router.post("/conversations/{conv_id}/messages")
 async def send_message(
     conv_id: int,
     body: MessageCreate,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_user),
 ):
-    conv = (
-        db.query(Conversation)
-        .filter(Conversation.id == conv_id, Conversation.user_id == user.id)
-        .first()
-    )
-    if not conv:
-        raise HTTPException(status_code=404, detail="Conversación no encontrada")
-
+    timer = RequestTimer()
     content = body.content.strip()
     file_ids = body.file_ids or []
-
-    # Must have content or files
-    if not content and not file_ids:
-        raise HTTPException(status_code=400, detail="Mensaje vacío")
-
-    # Build file context for AI
-    file_context_parts = []
-    attached_files = []
-    if file_ids:
-        attached_files = (
-            db.query(File)
-            .filter(File.id.in_(file_ids), File.conversation_id == conv_id)
-            .all()
-        )
-        for f in attached_files:
-            if f.extracted_text:
-                file_context_parts.append(
-                    f"[Archivo adjunto: {f.filename}]\n{f.extracted_text}"
-                )
-            else:
-                file_context_parts.append(f"[Archivo adjunto: {f.filename} ({f.file_type})]")
-
-    # Build the display content (what gets saved)
-    display_content = content or "[Archivo adjunto]"
-
-    # Build the AI content (with extracted text injected)
-    if file_context_parts:
-        ai_content = "\n\n".join(file_context_parts)
-        if content:
-            ai_content += f"\n\n{content}"
-    else:
-        ai_content = content
-
-    # Save user message
-    user_msg = Message(
-        conversation_id=conv_id,
-        role="user",
-        content=display_content,
+    user_id = user.id
+    user_msg_id, attached_files = await run_in_session(
+        _save_user_message, conv_id, user_id, content, file_ids
     )
-    db.add(user_msg)
-    db.flush()  # get user_msg.id
-
-    # Link files to this message
-    for f in attached_files:
-        f.message_id = user_msg.id
-
-    conv.updated_at = datetime.now(timezone.utc)
-    db.commit()
-
-    user_msg_id = user_msg.id
-
-    # Auto-title on first user message
-    msg_count = db.query(Message).filter(Message.conversation_id == conv_id).count()
-    if msg_count == 1:
-        title_text = content or (attached_files[0].filename if attached_files else "Archivo")
-        title = title_text[:50].strip()
-        if len(title_text) > 50:
-            title += "..."
-        conv.title = title
-        db.commit()
 
     # --- File-only shortcut: confirm receipt, don't call AI ---
     file_only = bool(file_ids) and not content
     if file_only:
-        filenames = ", ".join(f"**{f.filename}**" for f in attached_files)
+        filenames = ", ".join(f"**{f['filename']}**" for f in attached_files)
         confirm_text = (
             f"Archivo recibido: {filenames}. "
             "Estoy listo para trabajar con este documento. Decime qué necesitás."
@@ -279,24 +232,10 @@ async def send_message(
             safe = confirm_text.replace('\n', '\\n')
             yield f"data: {safe}\n\n"
 
-            from backend.database import SessionLocal
-            save_db = SessionLocal()
-            try:
-                assistant_msg = Message(
-                    conversation_id=conv_id,
-                    role="assistant",
-                    content=confirm_text,
-                    model_used="system",
-                )
-                save_db.add(assistant_msg)
-                save_db.flush()
-                yield f"data: [MSG_ID:{assistant_msg.id}]\n\n"
-                save_db.query(Conversation).filter(Conversation.id == conv_id).update(
-                    {"updated_at": datetime.now(timezone.utc)}
-                )
-                save_db.commit()
-            finally:
-                save_db.close()
+            msg_id, _ = await run_in_session(
+                _save_assistant_response, conv_id, user_id, confirm_text, "system", None
+            )
+            yield f"data: [MSG_ID:{msg_id}]\n\n"
 
             yield "data: [DONE]\n\n"
 
@@ -310,17 +249,6 @@ async def send_message(
             },
         )
 
-    # Build message history for the AI
-    recent = (
-        db.query(Message)
-        .options(joinedload(Message.files))
-        .filter(Message.conversation_id == conv_id)
-        .order_by(Message.created_at.desc())
-        .limit(MAX_HISTORY)
-        .all()
-    )
-    recent.reverse()
-
     use_search = body.use_search
     generate_doc = body.generate_doc
     doc_format = body.doc_format if body.doc_format in ("docx", "txt") else "docx"
@@ -330,31 +258,35 @@ async def send_message(
         system_prompt = SEARCH_SYSTEM_PROMPT
     else:
         system_prompt = SYSTEM_PROMPT
-    ai_messages = [{"role": "system", "content": system_prompt}]
-    for m in recent:
-        msg_content = m.content
-        # For the current user message, use the AI content with file context
-        if m.id == user_msg_id:
-            msg_content = ai_content
-        # For older user messages with file attachments, enrich with extracted text
-        elif m.role == "user" and m.files:
-            file_parts = []
-            for f in m.files:
-                if f.extracted_text:
-                    file_parts.append(f"[Archivo adjunto: {f.filename}]\n{f.extracted_text}")
-            if file_parts:
-                msg_content = "\n\n".join(file_parts) + "\n\n" + m.content
-        ai_messages.append({"role": m.role, "content": msg_content})
+
+    # Give pending text extractions a chance to finish; skip them otherwise
+    pending = [f["id"] for f in attached_files if f["extraction_status"] == "pending"]
+    if pending:
+        with timer.span("extraction_wait"):
+            await jobs.wait_for_files(pending)
+
+    # Build message history for the AI within the token budget
+    with timer.span("history_query"):
+        context = await run_in_session(
+            _build_context, conv_id, system_prompt, user_msg_id, content, file_ids
+        )
+    ai_messages = context.messages
+    CONTEXT_TOKENS.observe(context.tokens)
 
     # --- Google Actions: detect intent and execute if applicable ---
     google_action_result = None
     if content and not use_search and not generate_doc:
         if has_google_keywords(content):
-            creds = get_valid_credentials(db, user.id)
+            with timer.span("google_credentials"):
+                creds = await google_async.get_credentials(user_id)
             if creds:
-                intent = await detect_intent(content)
+                with timer.span("detect_intent"):
+                    intent = await detect_intent(content)
                 if intent:
-                    google_action_result = execute_action(intent, creds)
+                    with timer.span("google_action"):
+                        google_action_result = await google_async.run(
+                            user_id, execute_action, intent, creds, user_id
+                        )
                     if google_action_result:
                         ctx = format_action_context(google_action_result)
                         if ctx:
@@ -387,6 +319,9 @@ async def send_message(
         # Emit user message ID so frontend can set data-msg-id on user bubble
         yield f"data: [USER_MSG_ID:{user_msg_id}]\n\n"
 
+        # Report the prompt size for this turn
+        yield f"data: [CONTEXT:{json.dumps(context.report())}]\n\n"
+
         # Emit Google action result if any (before AI stream)
         if google_action_result:
             import json as _ga_json
@@ -394,71 +329,45 @@ async def send_message(
             yield f"data: [GOOGLE_ACTION:{safe_ga}]\n\n"
 
         full_response = ""
-        async for chunk in stream_fn(ai_messages):
+        chunk_count = 0
+        stream_start = time.perf_counter()
+        async for chunk in stream_fn(ai_messages, timer=timer):
+            if chunk_count == 0:
+                timer.mark("first_chunk")
+            chunk_count += 1
             full_response += chunk
             safe_chunk = chunk.replace('\n', '\\n')
             yield f"data: {safe_chunk}\n\n"
+        record_stream(
+            model_label,
+            count_tokens(full_response),
+            chunk_count,
+            time.perf_counter() - stream_start,
+        )
 
         # Clean any residual <think> blocks before saving/generating
         clean_response = re.sub(r'<think>[\s\S]*?</think>', '', full_response).strip()
 
-        # Save assistant response in a new DB session
-        from backend.database import SessionLocal
-        import json as _json
-        save_db = SessionLocal()
-        try:
-            assistant_msg = Message(
-                conversation_id=conv_id,
-                role="assistant",
-                content=clean_response,
-                model_used=model_label,
-            )
-            save_db.add(assistant_msg)
-            save_db.flush()
-
-            # Send message ID so frontend can enable forward button
-            yield f"data: [MSG_ID:{assistant_msg.id}]\n\n"
-
-            # Generate document if in document mode
-            if generate_doc and clean_response:
-                save_dir = os.path.join(settings.DATA_DIR, "generados")
-                title = content[:60] if content else "Documento"
-
-                if doc_format == "txt":
-                    filepath, filename = generate_txt(clean_response, title, save_dir)
-                    mime = "text/plain"
-                else:
-                    filepath, filename = generate_docx(clean_response, title, save_dir)
-                    mime = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-
-                size = os.path.getsize(filepath)
-
-                doc_file = File(
-                    conversation_id=conv_id,
-                    message_id=assistant_msg.id,
-                    filename=filename,
-                    filepath=filepath,
-                    file_type="document",
-                    mime_type=mime,
-                    size_bytes=size,
-                )
-                save_db.add(doc_file)
-                save_db.flush()
-
-                file_info = _json.dumps({
-                    "id": doc_file.id,
-                    "filename": doc_file.filename,
-                    "size_bytes": doc_file.size_bytes,
-                })
-                yield f"data: [FILE:{file_info}]\n\n"
-
-            save_db.query(Conversation).filter(Conversation.id == conv_id).update(
-                {"updated_at": datetime.now(timezone.utc)}
+        # Generate document if in document mode
+        doc = None
+        if generate_doc and clean_response:
+            title = content[:60] if content else "Documento"
+            with timer.span("generate_doc"):
+                doc = await run_in_threadpool(_generate_document, clean_response, title, doc_format)
+
+        # Save assistant response in a new DB session, off the event loop
+        with timer.span("save_response"):
+            msg_id, file_info = await run_in_session(
+                _save_assistant_response, conv_id, user_id, clean_response, model_label, doc
             )
-            save_db.commit()
-        finally:
-            save_db.close()
 
+        # Send message ID so frontend can enable forward button
+        yield f"data: [MSG_ID:{msg_id}]\n\n"
+        if file_info:
+            yield f"data: [FILE:{json.dumps(file_info)}]\n\n"
+
+        timer.mark("total")
+        logger.info("chat conv=%s model=%s %s", conv_id, model_label, timer.summary())
         yield "data: [DONE]\n\n"
 
     return StreamingResponse(
@@ -470,3 +379,148 @@ async def send_message(
             "X-Accel-Buffering": "no",
         },
     )
+
+
+def _save_user_message(
+    db: Session,
+    conv_id: int,
+    user_id: int,
+    content: str,
+    file_ids: list[int],
+) -> tuple[int, list[dict]]:
+    """Store the user's message and link its files. Returns (message id, attached files)."""
+    conv = (
+        db.query(Conversation)
+        .filter(Conversation.id == conv_id, Conversation.user_id == user_id)
+        .first()
+    )
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversación no encontrada")
+
+    # Must have content or files
+    if not content and not file_ids:
+        raise HTTPException(status_code=400, detail="Mensaje vacío")
+
+    attached_files = []
+    if file_ids:
+        attached_files = (
+            db.query(File)
+            .filter(File.id.in_(file_ids), File.conversation_id == conv_id)
+            .all()
+        )
+
+    # Build the display content (what gets saved)
+    display_content = content or "[Archivo adjunto]"
+
+    user_msg = Message(
+        conversation_id=conv_id,
+        role="user",
+        content=display_content,
+        token_count=count_tokens(display_content),
+    )
+    db.add(user_msg)
+    db.flush()  # get user_msg.id
+
+    # Link files to this message
+    for f in attached_files:
+        f.message_id = user_msg.id
+    search_index.index_message(db, user_msg, user_id)
+    conv.updated_at = datetime.now(timezone.utc)
+
+    # Auto-title on first user message
+    msg_count = db.query(Message).filter(Message.conversation_id == conv_id).count()
+    if msg_count == 1:
+        title_text = content or (attached_files[0].filename if attached_files else "Archivo")
+        title = title_text[:50].strip()
+        if len(title_text) > 50:
+            title += "..."
+        conv.title = title
+
+    files = [
+        {"id": f.id, "filename": f.filename, "extraction_status": f.extraction_status}
+        for f in attached_files
+    ]
+    return user_msg.id, files
+
+
+def _build_context(
+    db: Session,
+    conv_id: int,
+    system_prompt: str,
+    user_msg_id: int,
+    content: str,
+    file_ids: list[int],
+) -> ChatContext:
+    """Build the prompt, recording the retrieved chunk ids on the user's message.
+
+    The caller's commit also persists the token counts and summaries cached
+    while building it.
+    """
+    user_msg = db.get(Message, user_msg_id)
+    attached_files = []
+    if file_ids:
+        attached_files = (
+            db.query(File)
+            .filter(File.id.in_(file_ids), File.conversation_id == conv_id)
+            .all()
+        )
+    context = build_context(db, conv_id, system_prompt, user_msg, content, attached_files)
+    if context.chunk_ids:
+        user_msg.context_refs = json.dumps(context.chunk_ids)
+    return context
+
+
+def _generate_document(text: str, title: str, doc_format: str) -> tuple[str, str, str]:
+    """Write the generated document; returns (filepath, filename, mime type)."""
+    save_dir = os.path.join(settings.DATA_DIR, "generados")
+    if doc_format == "txt":
+        filepath, filename = generate_txt(text, title, save_dir)
+        return filepath, filename, "text/plain"
+    filepath, filename = generate_docx(text, title, save_dir)
+    return filepath, filename, "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _save_assistant_response(
+    db: Session,
+    conv_id: int,
+    user_id: int,
+    content: str,
+    model_label: str,
+    doc: tuple[str, str, str] | None,
+) -> tuple[int, dict | None]:
+    """Store the assistant message (and generated document). Returns (message id, file info)."""
+    assistant_msg = Message(
+        conversation_id=conv_id,
+        role="assistant",
+        content=content,
+        model_used=model_label,
+        token_count=count_tokens(content),
+    )
+    db.add(assistant_msg)
+    db.flush()
+    search_index.index_message(db, assistant_msg, user_id)
+
+    file_info = None
+    if doc is not None:
+        filepath, filename, mime = doc
+        doc_file = File(
+            conversation_id=conv_id,
+            message_id=assistant_msg.id,
+            filename=filename,
+            filepath=filepath,
+            file_type="document",
+            mime_type=mime,
+            size_bytes=os.path.getsize(filepath),
+        )
+        db.add(doc_file)
+        db.flush()
+        file_info = {
+            "id": doc_file.id,
+            "filename": doc_file.filename,
+            "size_bytes": doc_file.size_bytes,
+        }
+
+    db.query(Conversation).filter(Conversation.id == conv_id).update(
+        {"updated_at": datetime.now(timezone.utc)}
+    )
+    return assistant_msg.id, file_info
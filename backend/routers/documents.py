@@ -1,15 +1,16 @@
 import os
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
 
-from backend.auth import get_current_user
+from backend.auth import Principal, get_current_user
 from backend.config import settings
 from backend.database import get_db
-from backend.models import User, File, Message
+from backend.file_delivery import send_file
+from backend.pagination import PageParams, paginate
+from backend.models import Conversation, File, Message
 from backend.services.doc_generator import generate_docx, generate_txt
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
@@ -27,43 +28,47 @@ class DocumentOut(BaseModel):
 
 @router.get("", response_model=list[DocumentOut])
 def list_documents(
-    user: User = Depends(get_current_user),
+    response: Response,
+    page: PageParams = Depends(),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """List generated documents for the current user."""
-    docs = (
+    """List generated documents for the current user, newest first (paginated)."""
+    query = (
         db.query(File)
         .join(File.conversation)
         .filter(
-            File.conversation.has(user_id=user.id),
+            Conversation.user_id == user.id,
             File.filepath.contains("/generados/"),
         )
-        .order_by(File.created_at.desc())
-        .all()
     )
-    return docs
+    return paginate(query, File.created_at, File.id, page, response)
 
 
 @router.get("/{file_id}")
 def download_document(
     file_id: int,
-    user: User = Depends(get_current_user),
+    request: Request,
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Download a generated document."""
     f = (
         db.query(File)
-        .filter(File.id == file_id)
+        .options(defer(File.extracted_text))
+        .join(Conversation)
+        .filter(File.id == file_id, Conversation.user_id == user.id)
         .first()
     )
     if not f:
         raise HTTPException(status_code=404, detail="Documento no encontrado")
 
-    # Verify ownership
-    if not f.conversation or f.conversation.user_id != user.id:
-        raise HTTPException(status_code=404, detail="Documento no encontrado")
+    if f.filepath:
+        try:
+            return send_file(request, f.filepath, f.filename, f.mime_type, digest=f.sha256)
+        except FileNotFoundError:
+            pass
 
-    if not f.filepath or not os.path.exists(f.filepath):
         # Attempt to regenerate from message content
         if f.message_id:
             msg = db.query(Message).filter(Message.id == f.message_id).first()
@@ -76,13 +81,6 @@ def download_document(
                     temp_path, _ = generate_docx(msg.content, "", save_dir)
                 os.makedirs(os.path.dirname(f.filepath), exist_ok=True)
                 os.replace(temp_path, f.filepath)
-        # If still missing after regen attempt, return error
-        if not f.filepath or not os.path.exists(f.filepath):
-            raise HTTPException(status_code=404, detail="Archivo no encontrado en disco")
+                return send_file(request, f.filepath, f.filename, f.mime_type, digest=f.sha256)
 
-    mime = f.mime_type or "application/octet-stream"
-    return FileResponse(
-        path=f.filepath,
-        filename=f.filename,
-        media_type=mime,
-    )
+    raise HTTPException(status_code=404, detail="Archivo no encontrado en disco")
@@ -1,13 +1,15 @@
 import os
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
 from datetime import datetime
 from sqlalchemy.orm import Session
 
-from backend.auth import get_current_user
+from backend.auth import Principal, get_current_user
 from backend.database import get_db
-from backend.models import User, File
+from backend.pagination import PageParams, paginate
+from backend.models import Conversation, File, ExtractionJob
+from backend.services import blob_store, search_index
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 
@@ -29,17 +31,14 @@ class FileExplorerItem(BaseModel):
 
 @router.get("", response_model=list[FileExplorerItem])
 def list_all_files(
-    user: User = Depends(get_current_user),
+    response: Response,
+    page: PageParams = Depends(),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    """List all files for the current user across all conversations."""
-    files = (
-        db.query(File)
-        .join(File.conversation)
-        .filter(File.conversation.has(user_id=user.id))
-        .order_by(File.created_at.desc())
-        .all()
-    )
+    """List the current user's files across all conversations, newest first (paginated)."""
+    query = db.query(File).join(File.conversation).filter(Conversation.user_id == user.id)
+    files = paginate(query, File.created_at, File.id, page, response)
     result = []
     for f in files:
         if not f.filepath:
@@ -72,7 +71,7 @@ def list_all_files(
 @router.delete("/{file_id}")
 def delete_file(
     file_id: int,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Delete a file owned by the current user."""
@@ -84,8 +83,9 @@ def delete_file(
     )
     if not file:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-    if file.filepath and os.path.exists(file.filepath):
-        os.remove(file.filepath)
+    blob_store.release(db, file)
+    search_index.remove_file(db, file.id)
+    db.query(ExtractionJob).filter(ExtractionJob.file_id == file.id).delete(synchronize_session=False)
     db.delete(file)
     db.commit()
     return {"ok": True}
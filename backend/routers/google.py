@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
@@ -7,27 +8,34 @@ from sqlalchemy.orm import Session
 
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request as GoogleRequest
-import httpx
 
 from backend.auth import get_current_user
 from backend.config import settings
-from backend.database import get_db
-from backend.services.google_auth import get_stored_token, store_token, delete_token
+from backend.database import get_db, run_in_session
+from backend.services.google_auth import (
+    get_stored_token,
+    store_token,
+    delete_token,
+    credentials_to_dict,
+    dict_to_credentials,
+)
+from backend.services import (
+    calendar_mirror,
+    gmail_index,
+    google_async,
+    google_cache,
+    google_credentials,
+    google_services,
+)
+from backend.services.http_client import get_client
 from backend.services.google_calendar import (
-    list_events,
     get_event,
     create_event,
     delete_event,
 )
-from backend.services.google_gmail import (
-    list_messages,
-    get_message,
-    send_message,
-)
+from backend.services.google_gmail import send_message
 from backend.services.google_drive import (
     list_files as drive_list_files,
-    list_recent as drive_list_recent,
     get_file as drive_get_file,
     download_file as drive_download_file,
     upload_file as drive_upload_file,
@@ -38,8 +46,12 @@ from backend.services.google_contacts import (
     search_contacts as contacts_search,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/google", tags=["google"])
 
+REVOKE_URL = "https://oauth2.googleapis.com/revoke"
+
 SCOPES = [
     "https://www.googleapis.com/auth/calendar",
     "https://www.googleapis.com/auth/gmail.modify",
@@ -63,40 +75,6 @@ def _build_flow(redirect_uri: str | None = None) -> Flow:
     return flow
 
 
-def _credentials_to_dict(creds: Credentials) -> dict:
-    return {
-        "token": creds.token,
-        "refresh_token": creds.refresh_token,
-        "token_uri": creds.token_uri,
-        "client_id": creds.client_id,
-        "client_secret": creds.client_secret,
-        "scopes": list(creds.scopes) if creds.scopes else [],
-    }
-
-
-def _dict_to_credentials(data: dict) -> Credentials:
-    return Credentials(
-        token=data.get("token"),
-        refresh_token=data.get("refresh_token"),
-        token_uri=data.get("token_uri"),
-        client_id=data.get("client_id"),
-        client_secret=data.get("client_secret"),
-        scopes=data.get("scopes"),
-    )
-
-
-def get_valid_credentials(db: Session, user_id: int) -> Credentials | None:
-    """Return valid Google credentials for user, refreshing if expired."""
-    token_data = get_stored_token(db, user_id)
-    if not token_data:
-        return None
-    creds = _dict_to_credentials(token_data)
-    if creds.expired and creds.refresh_token:
-        creds.refresh(GoogleRequest())
-        store_token(db, user_id, _credentials_to_dict(creds), " ".join(creds.scopes or []))
-    return creds
-
-
 @router.get("/status")
 def google_status(user=Depends(get_current_user), db: Session = Depends(get_db)):
     token_data = get_stored_token(db, user.id)
@@ -136,72 +114,96 @@ def google_callback(request: Request, code: str = "", state: str = "", error: st
         flow = _build_flow()
         flow.fetch_token(code=code)
         creds = flow.credentials
-        token_data = _credentials_to_dict(creds)
+        token_data = credentials_to_dict(creds)
         scopes_str = " ".join(creds.scopes) if creds.scopes else ""
         store_token(db, user_id, token_data, scopes_str)
+        google_credentials.invalidate(user_id)
     except Exception:
         return RedirectResponse(url="/?google_error=token_exchange_failed")
 
     return RedirectResponse(url="/?google_connected=true")
 
 
+def _forget_google(db: Session, user_id: int) -> bool:
+    calendar_mirror.purge(db, user_id)
+    gmail_index.purge(db, user_id)
+    return delete_token(db, user_id)
+
+
 @router.post("/disconnect")
-def google_disconnect(user=Depends(get_current_user), db: Session = Depends(get_db)):
+async def google_disconnect(user=Depends(get_current_user)):
     # Try to revoke token at Google (best-effort)
-    token_data = get_stored_token(db, user.id)
+    token_data = await run_in_session(get_stored_token, user.id)
+    if token_data:
+        google_services.invalidate(dict_to_credentials(token_data))
     if token_data and token_data.get("token"):
         try:
-            httpx.post(
-                "https://oauth2.googleapis.com/revoke",
+            resp = await get_client("google").post(
+                REVOKE_URL,
                 params={"token": token_data["token"]},
                 headers={"Content-Type": "application/x-www-form-urlencoded"},
                 timeout=5,
             )
-        except Exception:
-            pass  # best-effort revocation
-
-    deleted = delete_token(db, user.id)
+            if resp.status_code != 200:
+                logger.warning(
+                    "Google token revocation for user %s returned %s", user.id, resp.status_code
+                )
+        except Exception as e:
+            # Best-effort: the local token is deleted either way
+            logger.warning("Google token revocation for user %s failed: %s", user.id, e)
+
+    deleted = await run_in_session(_forget_google, user.id)
+    google_cache.invalidate(user.id)
+    google_credentials.invalidate(user.id)
     return {"ok": deleted}
 
 
 # ── Calendar endpoints ────────────────────────────────────────────
 
 
-def _require_google(db: Session, user_id: int) -> Credentials:
-    creds = get_valid_credentials(db, user_id)
+async def _require_google(user_id: int) -> Credentials:
+    creds = await google_async.get_credentials(user_id)
     if not creds:
         raise HTTPException(status_code=400, detail="Google no conectado")
     return creds
 
 
 @router.get("/calendar/events")
-def calendar_events_range(
+async def calendar_events_range(
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
     time_min: str | None = None,
     time_max: str | None = None,
-    max_results: int = 50,
+    max_results: int | None = None,
 ):
-    creds = _require_google(db, user.id)
-    return list_events(creds, time_min=time_min, time_max=time_max, max_results=max_results)
+    creds = await _require_google(user.id)
+    return await google_async.run(
+        user.id, calendar_mirror.list_events, user.id, creds,
+        time_min=time_min, time_max=time_max, max_results=max_results,
+    )
 
 
 @router.get("/calendar/events/today")
-def calendar_events_today(user=Depends(get_current_user), db: Session = Depends(get_db)):
-    creds = _require_google(db, user.id)
+async def calendar_events_today(user=Depends(get_current_user)):
+    creds = await _require_google(user.id)
     now = datetime.now(timezone.utc)
     start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     end = start + timedelta(days=1)
-    return list_events(creds, time_min=start.isoformat(), time_max=end.isoformat())
+    return await google_async.run(
+        user.id, calendar_mirror.list_events, user.id, creds,
+        time_min=start.isoformat(), time_max=end.isoformat(),
+    )
 
 
 @router.get("/calendar/events/week")
-def calendar_events_week(user=Depends(get_current_user), db: Session = Depends(get_db)):
-    creds = _require_google(db, user.id)
+async def calendar_events_week(user=Depends(get_current_user)):
+    creds = await _require_google(user.id)
     now = datetime.now(timezone.utc)
     start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     end = start + timedelta(days=7)
-    return list_events(creds, time_min=start.isoformat(), time_max=end.isoformat())
+    return await google_async.run(
+        user.id, calendar_mirror.list_events, user.id, creds,
+        time_min=start.isoformat(), time_max=end.isoformat(),
+    )
 
 
 class CreateEventBody(BaseModel):
@@ -214,13 +216,14 @@ class CreateEventBody(BaseModel):
 
 
 @router.post("/calendar/events")
-def calendar_create_event(
+async def calendar_create_event(
     body: CreateEventBody,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    creds = _require_google(db, user.id)
-    return create_event(
+    creds = await _require_google(user.id)
+    event = await google_async.run(
+        user.id,
+        create_event,
         creds,
         summary=body.summary,
         start=body.start,
@@ -229,16 +232,18 @@ def calendar_create_event(
         location=body.location,
         attendees=body.attendees,
     )
+    await google_async.run(user.id, calendar_mirror.mark_stale, user.id)
+    return event
 
 
 @router.delete("/calendar/events/{event_id}")
-def calendar_delete_event(
+async def calendar_delete_event(
     event_id: str,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    creds = _require_google(db, user.id)
-    delete_event(creds, event_id)
+    creds = await _require_google(user.id)
+    await google_async.run(user.id, delete_event, creds, event_id)
+    await google_async.run(user.id, calendar_mirror.mark_stale, user.id)
     return {"ok": True}
 
 
@@ -246,34 +251,40 @@ def calendar_delete_event(
 
 
 @router.get("/gmail/messages")
-def gmail_list_messages(
+async def gmail_list_messages(
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
     q: str = "",
     max: int = 20,
 ):
-    creds = _require_google(db, user.id)
-    return list_messages(creds, query=q, max_results=max)
+    creds = await _require_google(user.id)
+    return await google_async.run(user.id, gmail_index.messages, user.id, creds, q, max_results=max)
 
 
 @router.get("/gmail/messages/unread")
-def gmail_unread_messages(
+async def gmail_unread_messages(
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
     max: int = 20,
 ):
-    creds = _require_google(db, user.id)
-    return list_messages(creds, query="is:unread", max_results=max)
+    creds = await _require_google(user.id)
+    return await google_async.run(
+        user.id, gmail_index.messages, user.id, creds, "is:unread", max_results=max
+    )
+
+
+@router.get("/gmail/unread-count")
+async def gmail_unread_count(user=Depends(get_current_user)):
+    creds = await _require_google(user.id)
+    count = await google_async.run(user.id, gmail_index.unread_count, user.id, creds)
+    return {"unread": count}
 
 
 @router.get("/gmail/messages/{message_id}")
-def gmail_get_message(
+async def gmail_get_message(
     message_id: str,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    creds = _require_google(db, user.id)
-    return get_message(creds, message_id)
+    creds = await _require_google(user.id)
+    return await google_async.run(user.id, gmail_index.get_message, user.id, creds, message_id)
 
 
 class SendEmailBody(BaseModel):
@@ -285,13 +296,14 @@ class SendEmailBody(BaseModel):
 
 
 @router.post("/gmail/send")
-def gmail_send_message(
+async def gmail_send_message(
     data: SendEmailBody,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    creds = _require_google(db, user.id)
-    return send_message(
+    creds = await _require_google(user.id)
+    result = await google_async.run(
+        user.id,
+        send_message,
         creds,
         to=data.to,
         subject=data.subject,
@@ -299,51 +311,54 @@ def gmail_send_message(
         cc=data.cc,
         bcc=data.bcc,
     )
+    google_cache.invalidate(user.id, "gmail")
+    await google_async.run(user.id, gmail_index.mark_stale, user.id)
+    return result
 
 
 # ── Drive endpoints ──────────────────────────────────────────────
 
 
 @router.get("/drive/files")
-def drive_files(
+async def drive_files(
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
     q: str = "",
     folder: str = "",
     max: int = 30,
 ):
-    creds = _require_google(db, user.id)
-    return drive_list_files(creds, query=q, folder_id=folder or None, max_results=max)
+    creds = await _require_google(user.id)
+    return await google_async.run(
+        user.id, drive_list_files, creds, query=q, folder_id=folder or None, max_results=max
+    )
 
 
 @router.get("/drive/files/recent")
-def drive_files_recent(
+async def drive_files_recent(
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
     max: int = 20,
 ):
-    creds = _require_google(db, user.id)
-    return drive_list_recent(creds, max_results=max)
+    creds = await _require_google(user.id)
+    return await google_async.run(user.id, google_cache.drive_recent, user.id, creds, max_results=max)
 
 
 @router.get("/drive/files/{file_id}")
-def drive_file_meta(
+async def drive_file_meta(
     file_id: str,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    creds = _require_google(db, user.id)
-    return drive_get_file(creds, file_id)
+    creds = await _require_google(user.id)
+    return await google_async.run(user.id, drive_get_file, creds, file_id)
 
 
 @router.get("/drive/files/{file_id}/download")
-def drive_file_download(
+async def drive_file_download(
     file_id: str,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    creds = _require_google(db, user.id)
-    content, filename, mime_type = drive_download_file(creds, file_id)
+    creds = await _require_google(user.id)
+    content, filename, mime_type = await google_async.run(
+        user.id, drive_download_file, creds, file_id
+    )
     return Response(
         content=content,
         media_type=mime_type,
@@ -356,18 +371,20 @@ async def drive_file_upload(
     file: UploadFile = File(...),
     folder: str = "",
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    creds = _require_google(db, user.id)
+    creds = await _require_google(user.id)
     content = await file.read()
     mime = file.content_type or "application/octet-stream"
-    result = drive_upload_file(
+    result = await google_async.run(
+        user.id,
+        drive_upload_file,
         creds,
         filename=file.filename or "upload",
         content=content,
         mime_type=mime,
         folder_id=folder or None,
     )
+    google_cache.invalidate(user.id, "drive")
     return result
 
 
@@ -375,32 +392,29 @@ async def drive_file_upload(
 
 
 @router.get("/contacts")
-def google_contacts(
+async def google_contacts(
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
     q: str = "",
     max: int = 50,
 ):
-    creds = _require_google(db, user.id)
-    return contacts_list(creds, query=q, max_results=max)
+    creds = await _require_google(user.id)
+    return await google_async.run(user.id, contacts_list, creds, query=q, max_results=max)
 
 
 @router.get("/contacts/search")
-def google_contacts_search(
+async def google_contacts_search(
     q: str,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
     max: int = 20,
 ):
-    creds = _require_google(db, user.id)
-    return contacts_search(creds, query=q, max_results=max)
+    creds = await _require_google(user.id)
+    return await google_async.run(user.id, contacts_search, creds, query=q, max_results=max)
 
 
 @router.get("/contacts/{contact_id:path}")
-def google_contact_detail(
+async def google_contact_detail(
     contact_id: str,
     user=Depends(get_current_user),
-    db: Session = Depends(get_db),
 ):
-    creds = _require_google(db, user.id)
-    return contacts_get(creds, contact_id)
+    creds = await _require_google(user.id)
+    return await google_async.run(user.id, contacts_get, creds, contact_id)
@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from backend.auth import Principal, get_current_user
+from backend.database import get_db
+from backend.models import Conversation, File
+from backend.services.search_index import search
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+class SearchResult(BaseModel):
+    conversation_id: int | None
+    conversation_title: str | None = None
+    message_id: int | None = None
+    file_id: int | None = None
+    filename: str | None = None
+    page: int | None = None
+    snippet: str
+    score: float
+
+
+@router.get("", response_model=list[SearchResult])
+def search_all(
+    q: str,
+    conversation_id: int | None = None,
+    limit: int = 20,
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Full-text search over the user's messages and uploaded documents."""
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Búsqueda vacía")
+    limit = max(1, min(limit, 100))
+
+    hits = search(db, user.id, q, limit=limit, conversation_id=conversation_id)
+
+    conv_ids = {h["conversation_id"] for h in hits if h["conversation_id"]}
+    file_ids = {h["file_id"] for h in hits if h["file_id"]}
+    titles = dict(
+        db.query(Conversation.id, Conversation.title).filter(Conversation.id.in_(conv_ids)).all()
+    ) if conv_ids else {}
+    filenames = dict(
+        db.query(File.id, File.filename).filter(File.id.in_(file_ids)).all()
+    ) if file_ids else {}
+
+    return [
+        SearchResult(
+            **h,
+            conversation_title=titles.get(h["conversation_id"]),
+            filename=filenames.get(h["file_id"]),
+        )
+        for h in hits
+    ]
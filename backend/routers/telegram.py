@@ -2,14 +2,15 @@ import os
 import re
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
 from sqlalchemy.orm import Session, joinedload
 
-from backend.auth import get_current_user
+from backend.auth import Principal, get_current_user
 from backend.config import settings
 from backend.database import get_db
-from backend.models import User, Conversation, Message, File, TelegramContact, TelegramSend
+from backend.pagination import PageParams, paginate
+from backend.models import Conversation, Message, File, TelegramContact, TelegramSend
 from backend.services import telegram_bot
 
 router = APIRouter(prefix="/api/telegram", tags=["telegram"])
@@ -84,7 +85,7 @@ async def bot_status():
 
 @router.get("/contacts", response_model=list[ContactOut])
 def list_contacts(
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     return (
@@ -98,7 +99,7 @@ def list_contacts(
 @router.post("/contacts", response_model=ContactOut, status_code=201)
 def create_contact(
     body: ContactCreate,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     name = body.name.strip()
@@ -120,7 +121,7 @@ def create_contact(
 @router.delete("/contacts/{contact_id}", status_code=204)
 def delete_contact(
     contact_id: int,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     contact = (
@@ -141,7 +142,7 @@ def delete_contact(
 @router.post("/send", response_model=SendResult)
 async def forward_message(
     body: SendRequest,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Forward an assistant message (text + files) to a Telegram contact."""
@@ -245,7 +246,7 @@ def split_telegram_text(text: str, max_len: int = 4096) -> list[str]:
 @router.post("/send-bulk", response_model=SendResult)
 async def forward_bulk(
     body: SendBulkRequest,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Forward multiple messages (text + files) to a Telegram contact."""
@@ -352,17 +353,13 @@ async def forward_bulk(
 
 @router.get("/history")
 def send_history(
-    user: User = Depends(get_current_user),
+    response: Response,
+    page: PageParams = Depends(),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    sends = (
-        db.query(TelegramSend)
-        .join(TelegramSend.contact)
-        .filter(TelegramContact.user_id == user.id)
-        .order_by(TelegramSend.id.desc())
-        .limit(50)
-        .all()
-    )
+    query = db.query(TelegramSend).join(TelegramSend.contact).filter(TelegramContact.user_id == user.id)
+    sends = paginate(query, None, TelegramSend.id, page, response)
     return [
         {
             "id": s.id,
@@ -1,22 +1,24 @@
 import os
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, status
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
 from datetime import datetime
 
-from backend.auth import get_current_user
+from backend.auth import Principal, get_current_user
 from backend.config import settings
-from backend.database import get_db
-from backend.models import User, Conversation, File
+from backend.database import get_db, run_in_session
+from backend.file_delivery import send_file
+from backend.pagination import PageParams, paginate
+from backend.models import Conversation, File, ExtractionJob
 from backend.services.file_handler import (
-    sanitize_filename,
     classify_file,
     validate_file,
-    save_file,
-    extract_text,
+    receive_upload,
+    FileTooLargeError,
+    too_large_message,
 )
+from backend.services import blob_store, jobs, thumbnails
 
 router = APIRouter(prefix="/api/upload", tags=["upload"])
 
@@ -27,7 +29,24 @@ class FileOut(BaseModel):
     file_type: str | None
     mime_type: str | None
     size_bytes: int | None
+    sha256: str | None = None
     created_at: datetime
+    extraction_status: str | None = None
+    job_id: int | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class JobOut(BaseModel):
+    id: int
+    file_id: int
+    status: str
+    progress: int
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
 
     class Config:
         from_attributes = True
@@ -41,99 +60,154 @@ class FileOut(BaseModel):
 async def upload_file(
     conv_id: int,
     file: UploadFile,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    request: Request,
+    user: Principal = Depends(get_current_user),
 ):
     # Verify conversation belongs to user
-    conv = (
-        db.query(Conversation)
-        .filter(Conversation.id == conv_id, Conversation.user_id == user.id)
-        .first()
-    )
-    if not conv:
+    if not await run_in_session(_owns_conversation, conv_id, user.id):
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
 
-    # Read file bytes
-    data = await file.read()
-    original_name = file.filename or "archivo"
-    size = len(data)
+    # Reject by declared size before touching the body. Content-Length covers
+    # the whole multipart body, so allow some slack for the part headers.
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > settings.MAX_UPLOAD_SIZE + 64 * 1024:
+        raise HTTPException(status_code=413, detail=too_large_message())
 
-    # Validate
-    error = validate_file(original_name, size)
+    # Validate extension (and the parsed size, when known) before copying
+    original_name = file.filename or "archivo"
+    error = validate_file(original_name, file.size or 0)
     if error:
-        raise HTTPException(status_code=400, detail=error)
-
-    ext = os.path.splitext(original_name)[1].lower()
-    file_type = classify_file(ext)
-    safe_name = sanitize_filename(original_name)
-    mime_type = settings.MIME_TYPES.get(ext, "application/octet-stream")
+        status_code = 413 if file.size and file.size > settings.MAX_UPLOAD_SIZE else 400
+        raise HTTPException(status_code=status_code, detail=error)
+
+    # Stream to disk in chunks, hashing as we go, then store by content hash
+    try:
+        tmp_path, size, sha256 = await receive_upload(file)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    out = await run_in_session(_store_upload, conv_id, original_name, tmp_path, size, sha256)
+
+    if out.job_id:
+        jobs.submit(out.job_id)
+    if out.file_type == "image":
+        jobs.submit_thumbnails(sha256)
+    return out
+
+
+def _owns_conversation(db: Session, conv_id: int, user_id: int) -> bool:
+    return (
+        db.query(Conversation.id)
+        .filter(Conversation.id == conv_id, Conversation.user_id == user_id)
+        .first()
+    ) is not None
 
-    # Save to disk
-    filepath = save_file(data, safe_name, file_type)
 
-    # Extract text for documents
-    extracted = extract_text(filepath, ext)
+def _store_upload(
+    db: Session, conv_id: int, original_name: str, tmp_path: str, size: int, sha256: str
+) -> FileOut:
+    """Store an uploaded temp file and create its File row (and extraction job)."""
+    ext = os.path.splitext(original_name)[1].lower()
+    blob_store.store(db, tmp_path, sha256, size)
 
-    # Create DB record
     db_file = File(
         conversation_id=conv_id,
         filename=original_name,
-        filepath=filepath,
-        file_type=file_type,
-        mime_type=mime_type,
+        filepath=blob_store.blob_path(sha256),
+        file_type=classify_file(ext),
+        mime_type=settings.MIME_TYPES.get(ext, "application/octet-stream"),
         size_bytes=size,
-        extracted_text=extracted or None,
+        sha256=sha256,
     )
     db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
-
-    return db_file
+    db.flush()
+
+    # Documents: extract text in the background (see services/jobs.py),
+    # unless this content was already extracted
+    job = None
+    if ext in settings.DOCUMENT_EXTENSIONS:
+        job = jobs.enqueue_extraction(db, db_file)
+    db.flush()
+    out = FileOut.model_validate(db_file)
+    out.job_id = job.id if job else None
+    return out
+
+
+@router.get("/jobs/{job_id}", response_model=JobOut)
+def get_job(
+    job_id: int,
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    job = (
+        db.query(ExtractionJob)
+        .join(File, ExtractionJob.file_id == File.id)
+        .join(Conversation, File.conversation_id == Conversation.id)
+        .filter(ExtractionJob.id == job_id, Conversation.user_id == user.id)
+        .first()
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    return job
 
 
 @router.get("/files/{file_id}")
 def serve_file(
     file_id: int,
-    user: User = Depends(get_current_user),
+    request: Request,
+    size: str | None = Query(None, description="Image derivative: thumb or preview"),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     db_file = (
         db.query(File)
+        .options(defer(File.extracted_text))
         .join(Conversation)
         .filter(File.id == file_id, Conversation.user_id == user.id)
         .first()
     )
     if not db_file:
         raise HTTPException(status_code=404, detail="Archivo no encontrado")
-
-    if not os.path.exists(db_file.filepath):
-        # Attempt to recover from extracted_text (applies to uploaded text files)
-        if db_file.extracted_text and db_file.filepath:
+    if size is not None and size not in thumbnails.SIZES:
+        raise HTTPException(status_code=400, detail="Tamaño no válido")
+
+    # Images: a WebP derivative when one can be made, else the original
+    if size and db_file.file_type == "image" and db_file.sha256:
+        thumb = thumbnails.ensure(db_file.sha256, size)
+        if thumb:
+            name = os.path.splitext(db_file.filename)[0] + ".webp"
+            return send_file(
+                request, thumb, name, "image/webp", digest=f"{db_file.sha256}-{size}", inline=True
+            )
+
+    # Attempt to recover from extracted_text (applies to uploaded text files
+    # stored before the blob store; blob paths must only hold their content).
+    # Check the disk first: reading extracted_text loads the deferred column.
+    if not db_file.sha256 and db_file.filepath and not os.path.exists(db_file.filepath):
+        if db_file.extracted_text:
             os.makedirs(os.path.dirname(db_file.filepath), exist_ok=True)
             with open(db_file.filepath, "w", encoding="utf-8") as wf:
                 wf.write(db_file.extracted_text)
-        if not os.path.exists(db_file.filepath):
-            raise HTTPException(status_code=404, detail="Archivo no encontrado en disco")
 
     # Images inline, documents as download
-    if db_file.file_type == "image":
-        return FileResponse(
-            db_file.filepath,
-            media_type=db_file.mime_type,
-            headers={"Content-Disposition": f'inline; filename="{db_file.filename}"'},
-        )
-    else:
-        return FileResponse(
+    try:
+        return send_file(
+            request,
             db_file.filepath,
-            media_type=db_file.mime_type,
-            filename=db_file.filename,
+            db_file.filename,
+            db_file.mime_type,
+            digest=db_file.sha256,
+            inline=db_file.file_type == "image",
         )
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Archivo no encontrado en disco")
 
 
 @router.get("/conversations/{conv_id}/files", response_model=list[FileOut])
 def list_files(
     conv_id: int,
-    user: User = Depends(get_current_user),
+    response: Response,
+    page: PageParams = Depends(),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     conv = (
@@ -144,4 +218,5 @@ def list_files(
     if not conv:
         raise HTTPException(status_code=404, detail="Conversación no encontrada")
 
-    return db.query(File).filter(File.conversation_id == conv_id).all()
+    query = db.query(File).filter(File.conversation_id == conv_id)
+    return paginate(query, File.created_at, File.id, page, response)
@@ -0,0 +1,187 @@
+"""Content-addressed storage for uploaded files.
+
+Uploads are stored once under DATA_DIR/blobs/<aa>/<sha256> and shared by
+every File row with the same digest. `Blob.ref_count` tracks those rows:
+deleting a file only releases its reference, and `python -m backend.manage gc`
+removes blobs nobody references anymore. The extracted text is cached on the
+blob, so re-uploading a document skips extraction.
+"""
+
+import logging
+import os
+import time
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.models import Blob, File
+from backend.services.file_handler import Extraction, format_page_offsets, parse_page_offsets
+
+logger = logging.getLogger(__name__)
+
+STALE_TMP_SECONDS = 3600
+
+
+def blobs_dir() -> str:
+    return os.path.join(settings.DATA_DIR, "blobs")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(blobs_dir(), sha256[:2], sha256)
+
+
+def derivative_path(sha256: str, suffix: str) -> str:
+    """Path for a file derived from a blob (e.g. a thumbnail), removed with it by GC."""
+    return f"{blob_path(sha256)}.{suffix}"
+
+
+def _with_derivatives(sha256: str) -> list[str]:
+    path = blob_path(sha256)
+    directory, name = os.path.split(path)
+    try:
+        derived = [os.path.join(directory, n) for n in os.listdir(directory) if n.startswith(name + ".")]
+    except FileNotFoundError:
+        derived = []
+    return [path, *derived]
+
+
+def store(db: Session, tmp_path: str, sha256: str, size: int) -> Blob:
+    """Move a hashed temp file into the store and take a reference. Caller commits.
+
+    If the content is already stored the temp file is discarded.
+    """
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+
+    blob = db.get(Blob, sha256)
+    if blob is None:
+        try:
+            with db.begin_nested():
+                blob = Blob(sha256=sha256, size_bytes=size, ref_count=0)
+                db.add(blob)
+        except IntegrityError:
+            # Same content uploaded concurrently: the other request created the row
+            blob = db.get(Blob, sha256)
+    blob.ref_count = Blob.ref_count + 1
+    db.flush()
+    db.refresh(blob)
+    return blob
+
+
+def release(db: Session, f: File):
+    """Drop a File's reference to its content. Caller commits.
+
+    Blob files stay on disk until garbage collection. Files that predate the
+    blob store (or generated documents) are removed directly.
+    """
+    if f.sha256 and db.get(Blob, f.sha256) is not None:
+        db.query(Blob).filter(Blob.sha256 == f.sha256, Blob.ref_count > 0).update(
+            {Blob.ref_count: Blob.ref_count - 1}, synchronize_session=False
+        )
+        return
+    if f.filepath and os.path.exists(f.filepath):
+        try:
+            os.remove(f.filepath)
+        except OSError:
+            pass
+
+
+def cached_extraction(db: Session, sha256: str | None) -> Extraction | None:
+    """Return the cached extraction for a blob, or None if it was never extracted."""
+    if not sha256:
+        return None
+    row = db.query(Blob.extracted_text, Blob.page_offsets).filter(Blob.sha256 == sha256).first()
+    if row is None or row.extracted_text is None:
+        return None
+    return Extraction(row.extracted_text, parse_page_offsets(row.page_offsets))
+
+
+def remember_text(db: Session, sha256: str | None, extraction: Extraction):
+    """Cache an extraction result on the blob. Caller commits."""
+    if not sha256:
+        return
+    db.query(Blob).filter(Blob.sha256 == sha256).update(
+        {
+            Blob.extracted_text: extraction.text or "",
+            Blob.page_offsets: format_page_offsets(extraction.page_offsets),
+        },
+        synchronize_session=False,
+    )
+
+
+def collect_garbage(db: Session, dry_run: bool = False) -> dict:
+    """Delete unreferenced blobs, orphaned blob files and stale upload temp files.
+
+    Reference counts are recomputed from the File rows first, so counts that
+    drifted (e.g. rows deleted outside the API) are corrected.
+    """
+    stats = {"blobs_removed": 0, "bytes_freed": 0, "orphans_removed": 0, "tmp_removed": 0, "recounted": 0}
+
+    counts = dict(
+        db.query(File.sha256, func.count(File.id))
+        .filter(File.sha256.isnot(None))
+        .group_by(File.sha256)
+        .all()
+    )
+    known = set()
+    doomed = []
+    for blob in db.query(Blob).all():
+        known.add(blob.sha256)
+        refs = counts.get(blob.sha256, 0)
+        if blob.ref_count != refs:
+            stats["recounted"] += 1
+            blob.ref_count = refs
+        if refs == 0:
+            stats["blobs_removed"] += 1
+            stats["bytes_freed"] += blob.size_bytes or 0
+            if not dry_run:
+                doomed.extend(_with_derivatives(blob.sha256))
+                db.delete(blob)
+    if dry_run:
+        db.rollback()
+    else:
+        db.commit()
+        for path in doomed:
+            _remove(path)
+
+    # Files younger than the cutoff may belong to an upload still in flight
+    cutoff = time.time() - STALE_TMP_SECONDS
+    root = blobs_dir()
+    if os.path.isdir(root):
+        for prefix in os.listdir(root):
+            directory = os.path.join(root, prefix)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                # Derivatives are named "<sha256>.<suffix>"; ".part" files are unfinished writes
+                orphan = name.split(".", 1)[0] not in known or name.endswith(".part")
+                if orphan and os.path.getmtime(path) < cutoff:
+                    stats["orphans_removed"] += 1
+                    if not dry_run:
+                        _remove(path)
+
+    tmp_dir = os.path.join(settings.DATA_DIR, "tmp")
+    if os.path.isdir(tmp_dir):
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            if name.endswith(".part") and os.path.getmtime(path) < cutoff:
+                stats["tmp_removed"] += 1
+                if not dry_run:
+                    _remove(path)
+
+    logger.info("Blob GC%s: %s", " (dry run)" if dry_run else "", stats)
+    return stats
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,286 @@
+"""Local mirror of each user's primary Google Calendar.
+
+The mirror is kept current with the Calendar API's incremental sync: the
+first sync pages through the events between CALENDAR_MIRROR_PAST_DAYS ago
+and CALENDAR_MIRROR_FUTURE_DAYS ahead (recurring events are expanded into
+instances, so an unbounded sync never ends) and stores the returned
+`nextSyncToken`; later syncs send that token and only receive what changed
+(cancelled events are deleted). A 410 Gone means the token expired, so the
+mirror is wiped and fully resynced; so it is once half of the future window
+has elapsed, to move the window forward.
+
+Range queries inside the window are answered from `calendar_events`
+without a network call, syncing first when the mirror is older than
+CALENDAR_SYNC_INTERVAL seconds; queries outside it go to the API. A sync
+that hits MAX_PAGES without a sync token is rolled back and recorded in
+`sync_error`: reads then go to the API and the full sync is only retried
+every CALENDAR_RETRY_INTERVAL seconds. The functions here block and run on
+the Google thread pool.
+"""
+
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import CalendarEvent, CalendarSyncState
+from backend.services import google_calendar
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGES = 200  # safety net against runaway expansion of recurring events
+API_MAX_RESULTS = 250  # events.list page size for queries the mirror cannot answer
+
+_lock = threading.Lock()
+_user_locks: dict[int, threading.Lock] = {}
+
+
+def _lock_for(user_id: int) -> threading.Lock:
+    with _lock:
+        lock = _user_locks.get(user_id)
+        if lock is None:
+            lock = threading.Lock()
+            _user_locks[user_id] = lock
+        return lock
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def parse_time(value: str | None) -> datetime | None:
+    """Parse an RFC 3339 timestamp or a YYYY-MM-DD date into naive UTC."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00").replace("z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+class SyncIncomplete(Exception):
+    """The API stopped paging (MAX_PAGES) before returning a sync token."""
+
+
+def _upsert(db: Session, user_id: int, item: dict, fresh: bool):
+    """Apply one event from the API. `fresh` skips the lookup during a full sync."""
+    row = None
+    if not fresh:
+        row = (
+            db.query(CalendarEvent)
+            .filter(CalendarEvent.user_id == user_id, CalendarEvent.event_id == item["id"])
+            .first()
+        )
+    if item.get("status") == "cancelled":
+        if row:
+            db.delete(row)
+        return
+    ev = google_calendar.format_event(item)
+    if row is None:
+        row = CalendarEvent(user_id=user_id, event_id=item["id"])
+        db.add(row)
+    row.summary = ev["summary"]
+    row.description = ev["description"]
+    row.location = ev["location"]
+    row.start = ev["start"]
+    row.end = ev["end"]
+    row.start_at = parse_time(ev["start"])
+    row.end_at = parse_time(ev["end"]) or row.start_at
+    row.html_link = ev["html_link"]
+    row.attendees = json.dumps(ev["attendees"], ensure_ascii=False)
+    row.updated = item.get("updated")
+
+
+def sync(db: Session, user_id: int, creds: Credentials):
+    """Bring the user's mirror up to date (incremental when a sync token is stored)."""
+    state = db.get(CalendarSyncState, user_id)
+    if state is None:
+        state = CalendarSyncState(user_id=user_id)
+        db.add(state)
+
+    now = _utcnow()
+    full = not state.sync_token or _window_expiring(state, now)
+    try:
+        try:
+            next_token = _apply_pages(db, user_id, creds, None if full else state.sync_token, now)
+        except HttpError as e:
+            if e.resp.status != 410:
+                raise
+            # Sync token expired or invalidated: start over
+            logger.info("Calendar sync token expired for user %s, full resync", user_id)
+            db.rollback()
+            state = db.get(CalendarSyncState, user_id) or CalendarSyncState(user_id=user_id)
+            db.add(state)
+            full = True
+            next_token = _apply_pages(db, user_id, creds, None, now)
+    except SyncIncomplete as e:
+        # Keep the previous mirror rows, but stop trusting them until a full
+        # sync succeeds; reads go to the API meanwhile
+        logger.warning("Calendar sync for user %s failed: %s", user_id, e)
+        db.rollback()
+        state = db.get(CalendarSyncState, user_id) or CalendarSyncState(user_id=user_id)
+        db.add(state)
+        state.sync_token = None
+        state.sync_error = str(e)
+        state.last_synced_at = now
+        db.commit()
+        return
+
+    state.sync_token = next_token
+    state.sync_error = None
+    state.last_synced_at = now
+    if full:
+        state.full_synced_at = now
+        state.window_start, state.window_end = _window(now)
+    db.commit()
+
+
+def _window(now: datetime) -> tuple[datetime, datetime]:
+    return (
+        now - timedelta(days=settings.CALENDAR_MIRROR_PAST_DAYS),
+        now + timedelta(days=settings.CALENDAR_MIRROR_FUTURE_DAYS),
+    )
+
+
+def _window_expiring(state: CalendarSyncState, now: datetime) -> bool:
+    if state.window_start is None or state.window_end is None:
+        return True
+    return state.window_end - now < timedelta(days=settings.CALENDAR_MIRROR_FUTURE_DAYS / 2)
+
+
+def _apply_pages(
+    db: Session, user_id: int, creds: Credentials, sync_token: str | None, now: datetime
+) -> str:
+    time_min = time_max = None
+    if sync_token is None:
+        db.query(CalendarEvent).filter(CalendarEvent.user_id == user_id).delete(
+            synchronize_session=False
+        )
+        lo, hi = _window(now)
+        time_min, time_max = lo.isoformat() + "Z", hi.isoformat() + "Z"
+    next_token = None
+    for page in google_calendar.event_pages(creds, sync_token, MAX_PAGES, time_min, time_max):
+        for item in page.get("items", []):
+            _upsert(db, user_id, item, fresh=sync_token is None)
+        db.flush()
+        next_token = page.get("nextSyncToken") or next_token
+    if next_token is None:
+        raise SyncIncomplete(f"no sync token after {MAX_PAGES} pages")
+    return next_token
+
+
+def _is_stale(state: CalendarSyncState | None) -> bool:
+    if state is None or state.last_synced_at is None:
+        return True
+    age = _utcnow() - state.last_synced_at
+    if state.sync_error:
+        return age > timedelta(seconds=settings.CALENDAR_RETRY_INTERVAL)
+    if not state.sync_token:
+        return True
+    return age > timedelta(seconds=settings.CALENDAR_SYNC_INTERVAL)
+
+
+def _covers(state: CalendarSyncState, time_min: str | None, time_max: str | None) -> bool:
+    """Whether the mirror can answer a range query."""
+    if state.sync_error or state.window_start is None or state.window_end is None:
+        return False
+    lo, hi = parse_time(time_min), parse_time(time_max)
+    return lo is not None and hi is not None and state.window_start <= lo and hi <= state.window_end
+
+
+def query(
+    db: Session,
+    user_id: int,
+    time_min: str | None = None,
+    time_max: str | None = None,
+    max_results: int | None = None,
+) -> list[dict]:
+    """Events overlapping [time_min, time_max) from the mirror, ordered by start."""
+    q = db.query(CalendarEvent).filter(CalendarEvent.user_id == user_id)
+    lo, hi = parse_time(time_min), parse_time(time_max)
+    if lo is not None:
+        q = q.filter(CalendarEvent.end_at > lo)
+    if hi is not None:
+        q = q.filter(CalendarEvent.start_at < hi)
+    q = q.order_by(CalendarEvent.start_at, CalendarEvent.id)
+    if max_results:
+        q = q.limit(max_results)
+    return [
+        {
+            "id": r.event_id,
+            "summary": r.summary,
+            "description": r.description or "",
+            "location": r.location or "",
+            "start": r.start or "",
+            "end": r.end or "",
+            "html_link": r.html_link or "",
+            "attendees": json.loads(r.attendees) if r.attendees else [],
+        }
+        for r in q.all()
+    ]
+
+
+def list_events(
+    user_id: int,
+    creds: Credentials,
+    time_min: str | None = None,
+    time_max: str | None = None,
+    max_results: int | None = None,
+) -> list[dict]:
+    """Serve a range query from the mirror, syncing first if it is stale.
+
+    Ranges outside the mirrored window, and every range while the mirror is
+    in an error state, are fetched from the API instead.
+    """
+    db = SessionLocal()
+    try:
+        state = db.get(CalendarSyncState, user_id)
+        if _is_stale(state):
+            with _lock_for(user_id):
+                db.expire_all()
+                state = db.get(CalendarSyncState, user_id)
+                if _is_stale(state):
+                    sync(db, user_id, creds)
+                    state = db.get(CalendarSyncState, user_id)
+        if not _covers(state, time_min, time_max):
+            return google_calendar.list_events(
+                creds, time_min, time_max, max_results or API_MAX_RESULTS
+            )
+        return query(db, user_id, time_min, time_max, max_results)
+    finally:
+        db.close()
+
+
+def mark_stale(user_id: int):
+    """Force an incremental sync on the next read (after a write through the API).
+
+    A mirror in an error state keeps its retry schedule: its reads already go
+    to the API.
+    """
+    db = SessionLocal()
+    try:
+        state = db.get(CalendarSyncState, user_id)
+        if state is not None and not state.sync_error:
+            state.last_synced_at = None
+            db.commit()
+    finally:
+        db.close()
+
+
+def purge(db: Session, user_id: int):
+    """Delete a user's mirror (e.g. on disconnect). Caller commits."""
+    db.query(CalendarEvent).filter(CalendarEvent.user_id == user_id).delete(
+        synchronize_session=False
+    )
+    db.query(CalendarSyncState).filter(CalendarSyncState.user_id == user_id).delete(
+        synchronize_session=False
+    )
@@ -0,0 +1,224 @@
+"""Token-budgeted chat context builder.
+
+Walks the conversation from the newest message backwards, adding messages
+until the configured token budget is spent. Attachment text is included in
+full only while it fits; otherwise the chunks most relevant to the user's
+question are retrieved, falling back to a cached excerpt (or just a reference
+to the file). Token counts are cached on the rows so each message is only
+counted once.
+"""
+
+from dataclasses import dataclass, field
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, selectinload
+
+from backend.config import settings
+from backend.models import File, Message
+from backend.services.file_handler import TRUNCATED_MARKER
+from backend.services.retrieval import retrieve_chunks
+from backend.services.tokens import count_tokens
+
+HISTORY_BATCH = 20
+# Share of the remaining budget the current turn's attachments may use,
+# so at least some recent history always fits.
+CURRENT_ATTACHMENT_SHARE = 0.75
+
+
+def _chunk_label(chunk) -> str:
+    if chunk.page:
+        return f"Fragmento {chunk.chunk_index + 1}, pág. {chunk.page}"
+    return f"Fragmento {chunk.chunk_index + 1}"
+
+
+def _attachment_counts() -> dict:
+    return {"full": 0, "chunks": 0, "summary": 0, "ref": 0}
+
+
+@dataclass
+class ChatContext:
+    messages: list[dict]
+    tokens: int
+    history_messages: int = 0
+    attachments: dict = field(default_factory=_attachment_counts)
+    chunk_ids: list[int] = field(default_factory=list)
+
+    def report(self) -> dict:
+        return {
+            "tokens": self.tokens,
+            "budget": settings.CONTEXT_TOKEN_BUDGET,
+            "messages": self.history_messages,
+            "attachments": self.attachments,
+            "chunks": self.chunk_ids,
+        }
+
+
+def message_tokens(msg: Message) -> int:
+    if msg.token_count is None:
+        msg.token_count = count_tokens(msg.content)
+    return msg.token_count
+
+
+def file_tokens(f: File) -> int:
+    if f.extraction_status == "pending":
+        return 0  # not cached: the text is still being extracted
+    if f.token_count is None:
+        f.token_count = count_tokens(f.extracted_text)
+    return f.token_count
+
+
+def summarize_text(text: str, max_chars: int | None = None) -> str:
+    """Cheap extractive summary: the leading paragraphs up to max_chars."""
+    max_chars = max_chars or settings.CONTEXT_SUMMARY_CHARS
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return text
+    out = []
+    size = 0
+    for para in text.split("\n"):
+        para = para.strip()
+        if not para:
+            continue
+        if size + len(para) > max_chars:
+            if not out:
+                out.append(para[:max_chars])
+            break
+        out.append(para)
+        size += len(para) + 1
+    omitted = len(text) - size
+    return "\n".join(out) + f"\n...[extracto; {omitted} caracteres omitidos]"
+
+
+def file_summary(f: File) -> str:
+    if f.summary is None:
+        f.summary = summarize_text(f.extracted_text or "")
+    return f.summary
+
+
+def attachment_block(
+    db: Session, f: File, allowance: int, question: str
+) -> tuple[str, int, str, list[int]]:
+    """Render an attachment within `allowance` tokens.
+
+    Returns (text, tokens, kind, chunk_ids) where kind is "full", "chunks",
+    "summary" or "ref".
+    """
+    if f.extraction_status == "pending":
+        ref = f"[Archivo adjunto: {f.filename} (procesando; texto aún no disponible)]"
+        return ref, count_tokens(ref), "ref", []
+    if file_tokens(f) == 0:
+        ref = f"[Archivo adjunto: {f.filename} ({f.file_type})]"
+        return ref, count_tokens(ref), "ref", []
+
+    header = f"[Archivo adjunto: {f.filename}]"
+    full_tokens = f.token_count + count_tokens(header)
+    if full_tokens <= allowance and not f.extracted_text.endswith(TRUNCATED_MARKER):
+        return f"{header}\n{f.extracted_text}", full_tokens, "full", []
+
+    chunks_header = f"[Archivo adjunto: {f.filename} — fragmentos relevantes]"
+    chunks = retrieve_chunks(db, f.id, question, allowance - count_tokens(chunks_header))
+    if chunks:
+        body = "\n\n".join(f"[{_chunk_label(c)}]\n{c.content}" for c in chunks)
+        text = f"{chunks_header}\n{body}"
+        return text, count_tokens(text), "chunks", [c.id for c in chunks]
+
+    summary = file_summary(f)
+    summary_header = f"[Archivo adjunto: {f.filename} — extracto]"
+    summary_tokens = count_tokens(summary) + count_tokens(summary_header)
+    if summary and summary_tokens <= allowance:
+        return f"{summary_header}\n{summary}", summary_tokens, "summary", []
+
+    ref = f"[Archivo adjunto: {f.filename} (contenido omitido por longitud)]"
+    return ref, count_tokens(ref), "ref", []
+
+
+def _iter_history(db: Session, conv_id: int, before: Message):
+    """Yield messages older than `before`, newest first, in small batches."""
+    cursor = (before.created_at, before.id)
+    fetched = 0
+    while fetched < settings.CONTEXT_MAX_MESSAGES:
+        batch = (
+            db.query(Message)
+            .options(selectinload(Message.files).defer(File.extracted_text))
+            .filter(
+                Message.conversation_id == conv_id,
+                or_(
+                    Message.created_at < cursor[0],
+                    and_(Message.created_at == cursor[0], Message.id < cursor[1]),
+                ),
+            )
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(HISTORY_BATCH)
+            .all()
+        )
+        if not batch:
+            return
+        for m in batch:
+            yield m
+        fetched += len(batch)
+        cursor = (batch[-1].created_at, batch[-1].id)
+
+
+def build_context(
+    db: Session,
+    conv_id: int,
+    system_prompt: str,
+    current_msg: Message,
+    current_text: str,
+    attached_files: list[File],
+    budget: int | None = None,
+) -> ChatContext:
+    """Build the message list for the LLM within a token budget."""
+    budget = budget or settings.CONTEXT_TOKEN_BUDGET
+    used = count_tokens(system_prompt) + count_tokens(current_text)
+    attachments = _attachment_counts()
+    chunk_ids: list[int] = []
+
+    # Current turn: attachments first, then the user's text
+    parts = []
+    for f in attached_files:
+        allowance = int((budget - used) * CURRENT_ATTACHMENT_SHARE)
+        block, tokens, kind, ids = attachment_block(db, f, allowance, current_text)
+        parts.append(block)
+        used += tokens
+        attachments[kind] += 1
+        chunk_ids.extend(ids)
+    if current_text:
+        parts.append(current_text)
+    current_content = "\n\n".join(parts)
+
+    # History: newest first until the budget is spent
+    history = []
+    for m in _iter_history(db, conv_id, current_msg):
+        cost = message_tokens(m)
+        if used + cost > budget:
+            break
+        used += cost
+        content = m.content
+        if m.role == "user" and m.files:
+            file_parts = []
+            for f in m.files:
+                if file_tokens(f) == 0:
+                    continue
+                block, tokens, kind, ids = attachment_block(
+                    db, f, (budget - used) // 2, current_text
+                )
+                file_parts.append(block)
+                used += tokens
+                attachments[kind] += 1
+                chunk_ids.extend(ids)
+            if file_parts:
+                content = "\n\n".join(file_parts) + "\n\n" + m.content
+        history.append({"role": m.role, "content": content})
+    history.reverse()
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(history)
+    messages.append({"role": "user", "content": current_content})
+    return ChatContext(
+        messages=messages,
+        tokens=used,
+        history_messages=len(history),
+        attachments=attachments,
+        chunk_ids=chunk_ids,
+    )
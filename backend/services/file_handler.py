@@ -1,17 +1,33 @@
+import hashlib
 import os
-import re
 import uuid
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from typing import Iterator
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
 
 from backend.config import settings
 
-MAX_TEXT_CHARS = 50_000
+MAX_TEXT_CHARS = 50_000  # stored in File.extracted_text
+MAX_INDEX_CHARS = 5_000_000  # chunked for retrieval; effectively the whole document
+TRUNCATED_MARKER = "\n...[texto truncado]"
+EXTRACTION_ERROR_PREFIX = "[Error extrayendo texto"
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
+XLSX_STATS_MAX_ROWS = 20_000  # rows read per sheet for the column summary
+
+
+class FileTooLargeError(Exception):
+    pass
 
 
-def sanitize_filename(name: str) -> str:
-    """Add UUID prefix and remove unsafe characters."""
-    name = os.path.basename(name)
-    name = re.sub(r'[^\w.\-]', '_', name)
-    return f"{uuid.uuid4().hex[:12]}_{name}"
+@dataclass
+class Extraction:
+    text: str | None
+    page_offsets: list[int] | None = None  # PDFs: start of each page in `text`
 
 
 def classify_file(ext: str) -> str:
@@ -21,90 +37,304 @@ def classify_file(ext: str) -> str:
     return "image"
 
 
+def too_large_message() -> str:
+    return f"Archivo demasiado grande (max {settings.MAX_UPLOAD_SIZE // (1024*1024)} MB)"
+
+
 def validate_file(filename: str, size: int) -> str | None:
     """Return error message or None if valid."""
     ext = os.path.splitext(filename)[1].lower()
     if ext not in settings.ALLOWED_EXTENSIONS:
         return f"Tipo de archivo no permitido: {ext}"
     if size > settings.MAX_UPLOAD_SIZE:
-        return f"Archivo demasiado grande (max {settings.MAX_UPLOAD_SIZE // (1024*1024)} MB)"
+        return too_large_message()
     return None
 
 
-def save_file(data: bytes, safe_name: str, file_type: str) -> str:
-    """Save file to disk and return the full path."""
-    subdir = "documentos" if file_type == "document" else "imagenes"
-    directory = os.path.join(settings.DATA_DIR, subdir)
-    os.makedirs(directory, exist_ok=True)
-    filepath = os.path.join(directory, safe_name)
-    with open(filepath, "wb") as f:
-        f.write(data)
-    return filepath
+async def receive_upload(upload: UploadFile) -> tuple[str, int, str]:
+    """Stream an upload to a temp file in fixed-size chunks.
+
+    Hashes while copying and aborts with FileTooLargeError as soon as
+    MAX_UPLOAD_SIZE is exceeded. Returns (temp path, size, sha256 hex digest);
+    the caller moves the temp file into the blob store.
+    """
+    tmp_dir = os.path.join(settings.DATA_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_SIZE:
+                    raise FileTooLargeError(too_large_message())
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return tmp_path, size, digest.hexdigest()
 
 
-def extract_text(filepath: str, ext: str) -> str | None:
+def extract_text(filepath: str, ext: str, max_chars: int = MAX_TEXT_CHARS) -> str | None:
     """Extract text from document files. Returns None for images."""
+    return extract_document(filepath, ext, max_chars).text
+
+
+def extract_document(filepath: str, ext: str, max_chars: int = MAX_TEXT_CHARS) -> Extraction:
+    """Like extract_text, with page offsets for PDFs."""
     ext = ext.lower()
 
     if ext not in settings.DOCUMENT_EXTENSIONS:
-        return None
+        return Extraction(None)
 
     try:
         if ext == ".pdf":
-            return _extract_pdf(filepath)
+            return join_pages(extract_pdf_pages(filepath, 0, None, max_chars), max_chars)
         elif ext == ".docx":
-            return _extract_docx(filepath)
+            return Extraction(_extract_docx(filepath, max_chars))
         elif ext == ".xlsx":
-            return _extract_xlsx(filepath)
+            # Rows past the sheet summaries add little to retrieval: bound the
+            # budget even for the (near unlimited) indexing extraction
+            return Extraction(_extract_xlsx(filepath, min(max_chars, settings.XLSX_MAX_CHARS)))
         elif ext == ".txt":
-            return _extract_txt(filepath)
+            return Extraction(_extract_txt(filepath, max_chars))
     except Exception as e:
-        return f"[Error extrayendo texto: {e}]"
+        return Extraction(f"{EXTRACTION_ERROR_PREFIX}: {e}]")
 
-    return None
+    return Extraction(None)
 
 
-def _extract_pdf(filepath: str) -> str:
+def pdf_page_count(filepath: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(filepath).pages)
+
+
+def iter_pdf_pages(filepath: str, start: int = 0, stop: int | None = None) -> Iterator[str]:
+    """Yield the text of pages [start, stop), parsing each page only when requested."""
     from pypdf import PdfReader
     reader = PdfReader(filepath)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for i in range(start, stop):
+        yield reader.pages[i].extract_text() or ""
+
+
+def extract_pdf_pages(filepath: str, start: int, stop: int | None, max_chars: int) -> list[str]:
+    """Texts of pages [start, stop), stopping at the first page past max_chars.
+
+    Used directly and, for large PDFs, on page ranges fanned out across the
+    extraction pool (see jobs._extract).
+    """
+    pages = []
+    total = 0
+    for text in iter_pdf_pages(filepath, start, stop):
+        pages.append(text)
+        total += len(text) + 1
+        if total >= max_chars:
+            break
+    return pages
+
+
+def join_pages(pages: list[str], max_chars: int) -> Extraction:
+    """Join page texts like the other extractors, recording where each page starts."""
     parts = []
-    for page in reader.pages:
-        text = page.extract_text()
+    offsets = []
+    pos = 0
+    for text in pages:
+        text = text.strip()
+        offsets.append(pos)
         if text:
             parts.append(text)
-    return _cap("\n".join(parts))
+            pos += len(text) + 1
+    return Extraction(cap_text("\n".join(parts), max_chars), offsets)
 
 
-def _extract_docx(filepath: str) -> str:
+def page_at(page_offsets: list[int], pos: int) -> int:
+    """1-based page number of a character offset."""
+    return max(bisect_right(page_offsets, pos), 1)
+
+
+def format_page_offsets(page_offsets: list[int] | None) -> str | None:
+    return " ".join(map(str, page_offsets)) if page_offsets else None
+
+
+def parse_page_offsets(value: str | None) -> list[int] | None:
+    return [int(v) for v in value.split()] if value else None
+
+
+def _extract_docx(filepath: str, max_chars: int) -> str:
     from docx import Document
     doc = Document(filepath)
     parts = [p.text for p in doc.paragraphs if p.text.strip()]
-    return _cap("\n".join(parts))
+    return cap_text("\n".join(parts), max_chars)
+
+
+class _ColumnStats:
+    """Running type counts and numeric min/max/sum of one spreadsheet column."""
+
+    __slots__ = ("types", "count", "min", "max", "total")
 
+    def __init__(self):
+        self.types: dict[str, int] = {}
+        self.count = 0  # numeric values
+        self.min = self.max = self.total = 0.0
 
-def _extract_xlsx(filepath: str) -> str:
+    def add(self, value):
+        if isinstance(value, bool):
+            kind = "booleano"
+        elif isinstance(value, (int, float)):
+            kind = "número"
+            if self.count == 0:
+                self.min = self.max = value
+            elif value < self.min:
+                self.min = value
+            elif value > self.max:
+                self.max = value
+            self.total += value
+            self.count += 1
+        elif isinstance(value, (datetime, date, time)):
+            kind = "fecha"
+        else:
+            kind = "texto"
+        self.types[kind] = self.types.get(kind, 0) + 1
+
+    def describe(self) -> str:
+        if not self.types:
+            return "vacía"
+        kind, seen = max(self.types.items(), key=lambda kv: kv[1])
+        if seen < 0.9 * sum(self.types.values()):
+            kind = "mixto"
+        if kind == "número":
+            return f"número: min {self.min:g}, max {self.max:g}, media {self.total / self.count:g}"
+        return kind
+
+
+def _extract_xlsx(filepath: str, max_chars: int) -> str:
+    """Schema summary of every sheet, then the sheets' rows, within max_chars.
+
+    The summaries always come first and in full, so a large sheet cannot
+    crowd out a later sheet's schema; the rest of the budget is shared
+    between the sheets' rows (a sheet needing less than an equal share
+    leaves the remainder to the others). Rows are streamed and stop being
+    stringified once a sheet has max_chars worth of them; reading stops
+    after XLSX_STATS_MAX_ROWS rows of the sheet (the summary then covers
+    those rows and the row count comes from the sheet's dimensions).
+    """
     from openpyxl import load_workbook
-    wb = load_workbook(filepath, read_only=True, data_only=True)
-    parts = []
-    for sheet in wb.worksheets:
-        parts.append(f"[Hoja: {sheet.title}]")
-        for row in sheet.iter_rows(values_only=True):
-            cells = [str(c) if c is not None else "" for c in row]
-            if any(cells):
-                parts.append("\t".join(cells))
-    wb.close()
-    return _cap("\n".join(parts))
+    from openpyxl.utils import get_column_letter
+    summaries: list[str] = []
+    sheet_rows: list[tuple[str, list[str]]] = []  # (sheet title, rows) of sheets with rows
+    # Blobs are stored without an extension, which openpyxl rejects for paths
+    with open(filepath, "rb") as fh:
+        wb = load_workbook(fh, read_only=True, data_only=True)
+        try:
+            for sheet in wb.worksheets:
+                header: list[str] | None = None
+                stats: list[_ColumnStats] = []
+                rows: list[str] = []
+                kept = 0  # characters of rows kept for this sheet
+                scanned = 0
+                stopped = False
+                for row in sheet.iter_rows(values_only=True):
+                    if all(c is None or c == "" for c in row):
+                        continue
+                    if header is None:
+                        if all(isinstance(c, str) or c is None for c in row):
+                            header = [str(c) if c is not None else "" for c in row]
+                            rows.append("\t".join(header))
+                            kept += len(rows[-1]) + 1
+                            continue
+                        header = []
+                    scanned += 1
+                    while len(stats) < len(row):
+                        stats.append(_ColumnStats())
+                    for col, value in zip(stats, row):
+                        if value is not None and value != "":
+                            col.add(value)
+                    if kept < max_chars:
+                        rows.append("\t".join(str(c) if c is not None else "" for c in row))
+                        kept += len(rows[-1]) + 1
+                    elif scanned >= XLSX_STATS_MAX_ROWS:
+                        stopped = True
+                        break
+
+                if header is None:
+                    summaries.append(f"[Hoja: {sheet.title}] vacía")
+                    continue
+                total_rows = str(scanned)
+                if stopped:
+                    # Stopped early: the sheet's declared dimensions give the size, if present
+                    if sheet.max_row:
+                        total_rows = str(max(sheet.max_row - (1 if header else 0), scanned))
+                    else:
+                        total_rows = f"más de {scanned}"
+                # Read-only rows are padded to the sheet width: drop trailing empty columns
+                width = max(
+                    [i + 1 for i, col in enumerate(stats) if col.types]
+                    + [i + 1 for i, name in enumerate(header) if name],
+                    default=0,
+                )
+                stats += [_ColumnStats() for _ in range(width - len(stats))]
+                names = [
+                    (header[i] if i < len(header) and header[i] else get_column_letter(i + 1))
+                    for i in range(width)
+                ]
+                summary = [f"[Hoja: {sheet.title}] {total_rows} filas × {width} columnas"]
+                if stopped:
+                    summary.append(f"(tipos y estadísticas de las primeras {scanned} filas)")
+                summary.extend(f"- {name}: {col.describe()}" for name, col in zip(names, stats))
+                summaries.append("\n".join(summary))
+                if rows:
+                    sheet_rows.append((sheet.title, rows))
+        finally:
+            wb.close()
+
+    parts = summaries[:]
+    labelled = len(sheet_rows) > 1
+    blocks = [
+        ((f"[Filas de {title}]\n" if labelled else "") + "\n".join(rows), rows)
+        for title, rows in sheet_rows
+    ]
+    budget = max_chars - sum(len(p) + 1 for p in summaries)
+    # Equal shares, smallest sheets first so their unused share goes to the rest
+    shares: dict[int, int] = {}
+    order = sorted(range(len(blocks)), key=lambda i: len(blocks[i][0]))
+    for n, i in enumerate(order):
+        shares[i] = min(len(blocks[i][0]) + 1, max(budget, 0) // (len(order) - n))
+        budget -= shares[i]
+    for i, (text, rows) in enumerate(blocks):
+        if len(text) + 1 <= shares[i]:
+            parts.append(text)
+            continue
+        # Keep whole rows within the share
+        keep = [f"[Filas de {sheet_rows[i][0]}]"] if labelled else []
+        used = sum(len(k) + 1 for k in keep) + len(TRUNCATED_MARKER)
+        for row in rows:
+            if used + len(row) + 1 > shares[i]:
+                break
+            keep.append(row)
+            used += len(row) + 1
+        if len(keep) > (1 if labelled else 0):
+            parts.append("\n".join(keep) + TRUNCATED_MARKER)
+    return cap_text("\n".join(parts), max_chars)
 
 
-def _extract_txt(filepath: str) -> str:
+def _extract_txt(filepath: str, max_chars: int) -> str:
     with open(filepath, "r", encoding="utf-8", errors="replace") as f:
-        return _cap(f.read())
+        return cap_text(f.read(max_chars + 1), max_chars)
 
 
-def _cap(text: str) -> str:
+def cap_text(text: str, max_chars: int = MAX_TEXT_CHARS) -> str:
     text = text.strip()
     if not text:
         return ""
-    if len(text) > MAX_TEXT_CHARS:
-        return text[:MAX_TEXT_CHARS] + "\n...[texto truncado]"
+    if len(text) > max_chars:
+        return text[:max_chars] + TRUNCATED_MARKER
     return text
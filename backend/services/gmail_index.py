@@ -0,0 +1,364 @@
+"""Local per-user index of Gmail messages.
+
+The index holds headers, snippet, labels and the plain-text body of each
+message and is kept current with Gmail's history API: the first sync records
+the mailbox historyId and backfills the newest GMAIL_INDEX_MAX_MESSAGES
+messages plus up to GMAIL_INDEX_MAX_UNREAD unread ones; later syncs replay
+`users.history.list` from the stored historyId (new messages are fetched in
+batches, label changes and deletions are applied in place, and a message
+marked unread is pulled into the index). The full sync runs in a background
+thread, as does the rebuild after a 404 (historyId too old); until it
+finishes, listings go to the API.
+
+Recent lists are then local queries, and so are unread lists while every
+unread message fits in the backfill (`unread_complete`). Plain-text searches
+are local only when the backfill reached the oldest message (`complete`),
+i.e. for mailboxes of fewer than GMAIL_INDEX_MAX_MESSAGES messages, since
+older matches would otherwise be missed; they, and queries using Gmail
+search operators, go to the API through google_cache. The unread count
+always comes from the UNREAD label. The functions here block and run on the
+Google thread pool.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.errors import HttpError
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import GmailMessage, GmailSyncState
+from backend.services import google_cache, google_gmail
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_user_locks: dict[int, threading.Lock] = {}
+_backfilling: set[int] = set()  # users with a full sync running in the background
+
+
+def _lock_for(user_id: int) -> threading.Lock:
+    with _lock:
+        lock = _user_locks.get(user_id)
+        if lock is None:
+            lock = threading.Lock()
+            _user_locks[user_id] = lock
+        return lock
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _set_labels(row: GmailMessage, label_ids: list[str]):
+    row.labels = " ".join(label_ids)
+    row.unread = 1 if "UNREAD" in label_ids else 0
+
+
+def _upsert(db: Session, user_id: int, msg: dict, fresh: bool):
+    """Store one message fetched with format=full. `fresh` skips the lookup during a full sync."""
+    row = None
+    if not fresh:
+        row = (
+            db.query(GmailMessage)
+            .filter(GmailMessage.user_id == user_id, GmailMessage.message_id == msg["id"])
+            .first()
+        )
+    if row is None:
+        row = GmailMessage(user_id=user_id, message_id=msg["id"])
+        db.add(row)
+    full = google_gmail.format_message_full(msg)
+    row.thread_id = full["threadId"]
+    row.sender = full["from"]
+    row.recipients = full["to"]
+    row.subject = full["subject"]
+    row.date = full["date"]
+    row.internal_date = int(msg.get("internalDate") or 0)
+    row.snippet = full["snippet"]
+    row.body = full["body"][: settings.GMAIL_INDEX_BODY_CHARS]
+    _set_labels(row, msg.get("labelIds", []))
+
+
+def sync(db: Session, user_id: int, creds: Credentials):
+    """Bring the user's index up to date (incremental when a historyId is stored)."""
+    state = db.get(GmailSyncState, user_id)
+    if state is None:
+        state = GmailSyncState(user_id=user_id)
+        db.add(state)
+
+    full = not state.history_id
+    try:
+        if full:
+            history_id, complete, unread_complete = _full_sync(db, user_id, creds)
+        else:
+            history_id = _apply_history(db, user_id, creds, state.history_id)
+    except HttpError as e:
+        if full or e.resp.status != 404:
+            raise
+        # historyId no longer available (too old): rebuild in the background
+        logger.info("Gmail historyId expired for user %s, full resync", user_id)
+        db.rollback()
+        state = db.get(GmailSyncState, user_id)
+        state.history_id = None
+        db.commit()
+        return
+
+    now = _utcnow()
+    state.history_id = history_id
+    state.last_synced_at = now
+    if full:
+        state.full_synced_at = now
+        state.complete = 1 if complete else 0
+        state.unread_complete = 1 if unread_complete else 0
+    db.commit()
+
+
+def _full_sync(db: Session, user_id: int, creds: Credentials) -> tuple[str, bool, bool]:
+    """Rebuild the index.
+
+    Returns the historyId, whether the index holds every message and whether
+    it holds every unread message.
+    """
+    # Read the historyId before listing, so changes made during the backfill
+    # are replayed by the next incremental sync
+    history_id = google_gmail.mailbox_version(creds)
+    db.query(GmailMessage).filter(GmailMessage.user_id == user_id).delete(synchronize_session=False)
+    ids = google_gmail.list_message_ids(creds, settings.GMAIL_INDEX_MAX_MESSAGES)
+    unread = google_gmail.list_message_ids(creds, settings.GMAIL_INDEX_MAX_UNREAD, "is:unread")
+    newest = set(ids)
+    ids += [message_id for message_id in unread if message_id not in newest]
+    fetched = google_gmail.fetch_messages(creds, ids, "full")
+    for message_id in ids:
+        if message_id in fetched:
+            _upsert(db, user_id, fetched[message_id], fresh=True)
+    db.flush()
+    return (
+        history_id,
+        len(newest) < settings.GMAIL_INDEX_MAX_MESSAGES,
+        len(unread) < settings.GMAIL_INDEX_MAX_UNREAD,
+    )
+
+
+def _apply_history(db: Session, user_id: int, creds: Credentials, start_history_id: str) -> str:
+    records, history_id = google_gmail.history_since(creds, start_history_id)
+
+    added: set[str] = set()
+    deleted: set[str] = set()
+    labels: dict[str, list[str]] = {}  # message id -> latest label ids
+    for record in records:
+        for item in record.get("messagesAdded", []):
+            added.add(item["message"]["id"])
+            deleted.discard(item["message"]["id"])
+        for key in ("labelsAdded", "labelsRemoved"):
+            for item in record.get(key, []):
+                msg = item["message"]
+                labels[msg["id"]] = msg.get("labelIds", [])
+        for item in record.get("messagesDeleted", []):
+            deleted.add(item["message"]["id"])
+            added.discard(item["message"]["id"])
+
+    if deleted:
+        db.query(GmailMessage).filter(
+            GmailMessage.user_id == user_id, GmailMessage.message_id.in_(deleted)
+        ).delete(synchronize_session=False)
+
+    relabel = {k: v for k, v in labels.items() if k not in added and k not in deleted}
+    if relabel:
+        rows = (
+            db.query(GmailMessage)
+            .filter(GmailMessage.user_id == user_id, GmailMessage.message_id.in_(relabel))
+            .all()
+        )
+        for row in rows:
+            _set_labels(row, relabel.pop(row.message_id))
+    # Label changes on messages older than the backfill pull them into the
+    # index, so that e.g. an old mail marked unread is counted
+    to_fetch = list(added | set(relabel))
+    if to_fetch:
+        fetched = google_gmail.fetch_messages(creds, to_fetch, "full")
+        for msg in fetched.values():
+            _upsert(db, user_id, msg, fresh=False)
+    db.flush()
+    return history_id
+
+
+def _is_stale(state: GmailSyncState | None) -> bool:
+    if state is None or state.last_synced_at is None or not state.history_id:
+        return True
+    return _utcnow() - state.last_synced_at > timedelta(seconds=settings.GMAIL_SYNC_INTERVAL)
+
+
+def _ensure_fresh(db: Session, user_id: int, creds: Credentials) -> GmailSyncState | None:
+    """Sync the index incrementally if stale; None while it has not been built.
+
+    A missing index is built in the background, so the caller falls back to
+    the API instead of waiting for the full backfill.
+    """
+    state = db.get(GmailSyncState, user_id)
+    if state is not None and state.history_id and _is_stale(state):
+        with _lock_for(user_id):
+            db.expire_all()
+            state = db.get(GmailSyncState, user_id)
+            if state is not None and state.history_id and _is_stale(state):
+                sync(db, user_id, creds)
+                state = db.get(GmailSyncState, user_id)
+    if state is None or not state.history_id:
+        _start_backfill(user_id, creds)
+        return None
+    return state
+
+
+def _start_backfill(user_id: int, creds: Credentials):
+    with _lock:
+        if user_id in _backfilling:
+            return
+        _backfilling.add(user_id)
+    threading.Thread(
+        target=_backfill, args=(user_id, creds), name=f"gmail-backfill-{user_id}", daemon=True
+    ).start()
+
+
+def _backfill(user_id: int, creds: Credentials):
+    db = SessionLocal()
+    try:
+        with _lock_for(user_id):
+            state = db.get(GmailSyncState, user_id)
+            if state is None or not state.history_id:
+                sync(db, user_id, creds)
+    except Exception as e:
+        logger.warning("Gmail index backfill for user %s failed: %s", user_id, e)
+    finally:
+        db.close()
+        with _lock:
+            _backfilling.discard(user_id)
+
+
+def _without_label(label: str):
+    padded = " " + func.coalesce(GmailMessage.labels, "") + " "
+    return padded.notlike(f"% {label} %")
+
+
+def _summary(row: GmailMessage) -> dict:
+    return {
+        "id": row.message_id,
+        "threadId": row.thread_id or "",
+        "snippet": row.snippet or "",
+        "from": row.sender or "",
+        "subject": row.subject or "",
+        "date": row.date or "",
+        "unread": bool(row.unread),
+    }
+
+
+def _visible(db: Session, user_id: int):
+    """Messages Gmail lists by default (not in trash or spam)."""
+    return db.query(GmailMessage).filter(
+        GmailMessage.user_id == user_id, _without_label("TRASH"), _without_label("SPAM")
+    )
+
+
+def query(
+    db: Session,
+    user_id: int,
+    text: str = "",
+    unread_only: bool = False,
+    max_results: int = 20,
+) -> list[dict]:
+    """Newest indexed messages, optionally unread only and matching every term of `text`."""
+    q = _visible(db, user_id)
+    if unread_only:
+        q = q.filter(GmailMessage.unread == 1)
+    for term in text.split():
+        pattern = f"%{term}%"
+        q = q.filter(or_(
+            GmailMessage.subject.ilike(pattern),
+            GmailMessage.sender.ilike(pattern),
+            GmailMessage.snippet.ilike(pattern),
+            GmailMessage.body.ilike(pattern),
+        ))
+    q = q.order_by(GmailMessage.internal_date.desc(), GmailMessage.id.desc()).limit(max_results)
+    return [_summary(r) for r in q.all()]
+
+
+def is_local_query(gmail_query: str) -> bool:
+    """Whether a Gmail search string can be answered from the index at all.
+
+    Plain words are; anything using search operators (from:, label:, ...)
+    is left to the API.
+    """
+    q = gmail_query.strip()
+    return q in ("", "is:unread") or ":" not in q
+
+
+def messages(user_id: int, creds: Credentials, gmail_query: str = "", max_results: int = 20) -> list[dict]:
+    """Answer a Gmail message listing from the index when possible.
+
+    The newest messages are always indexed, and every unread one when they
+    fit in the backfill; text matches may be older than the backfill, so
+    searches are answered locally only from a complete index.
+    """
+    if not is_local_query(gmail_query):
+        return google_cache.gmail_messages(user_id, creds, query=gmail_query, max_results=max_results)
+    unread_only = gmail_query.strip() == "is:unread"
+    text = "" if unread_only else gmail_query
+    db = SessionLocal()
+    try:
+        state = _ensure_fresh(db, user_id, creds)
+        if state is None:
+            found = None
+        elif text.strip() and not state.complete:
+            found = None
+        elif unread_only and not (state.complete or state.unread_complete):
+            found = None
+        else:
+            found = query(db, user_id, text, unread_only, max_results)
+    finally:
+        db.close()
+    if found is None:
+        return google_cache.gmail_messages(user_id, creds, query=gmail_query, max_results=max_results)
+    return found
+
+
+def unread_count(user_id: int, creds: Credentials) -> int:
+    """The mailbox's unread count (the index may not hold every unread message)."""
+    return google_gmail.unread_count(creds)
+
+
+def get_message(user_id: int, creds: Credentials, message_id: str) -> dict:
+    """Full message from the index, or from the API if missing or its body was capped."""
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(GmailMessage)
+            .filter(GmailMessage.user_id == user_id, GmailMessage.message_id == message_id)
+            .first()
+        )
+        if row is not None and row.body is not None and len(row.body) < settings.GMAIL_INDEX_BODY_CHARS:
+            return {**_summary(row), "to": row.recipients or "", "body": row.body}
+    finally:
+        db.close()
+    return google_gmail.get_message(creds, message_id)
+
+
+def mark_stale(user_id: int):
+    """Force an incremental sync on the next read (after a write through the API)."""
+    db = SessionLocal()
+    try:
+        state = db.get(GmailSyncState, user_id)
+        if state is not None:
+            state.last_synced_at = None
+            db.commit()
+    finally:
+        db.close()
+
+
+def purge(db: Session, user_id: int):
+    """Delete a user's index (e.g. on disconnect). Caller commits."""
+    db.query(GmailMessage).filter(GmailMessage.user_id == user_id).delete(synchronize_session=False)
+    db.query(GmailSyncState).filter(GmailSyncState.user_id == user_id).delete(
+        synchronize_session=False
+    )
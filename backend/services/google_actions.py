@@ -5,14 +5,14 @@ import logging
 import re
 from datetime import datetime, timedelta, timezone
 
-import httpx
-
 logger = logging.getLogger(__name__)
 
 from backend.config import settings
-from backend.services.google_calendar import list_events, create_event
-from backend.services.google_gmail import list_messages, send_message
-from backend.services.google_drive import list_recent, list_files as drive_list_files
+from backend.services.http_client import get_client
+from backend.services import calendar_mirror, gmail_index, google_cache
+from backend.services.google_calendar import create_event
+from backend.services.google_gmail import send_message
+from backend.services.google_drive import list_files as drive_list_files
 
 # ---------------------------------------------------------------------------
 # Fast keyword filter — avoids LLM call for unrelated messages
@@ -101,21 +101,21 @@ async def detect_intent(message: str) -> dict | None:
     }
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.post(url, json=payload, headers=headers)
-            if resp.status_code != 200:
-                logger.warning("detect_intent bad status: %s", resp.status_code)
-                return None
-            data = resp.json()
-            content = data["choices"][0]["message"]["content"].strip()
-            # Strip <think>...</think> reasoning blocks (MiniMax M2.1+)
-            content = re.sub(r"<think>[\s\S]*?</think>", "", content).strip()
-            # Strip markdown code fences if present
-            content = re.sub(r"^```(?:json)?\s*", "", content)
-            content = re.sub(r"\s*```$", "", content)
-            result = json.loads(content)
-            if result.get("action"):
-                return result
+        client = get_client("minimax")
+        resp = await client.post(url, json=payload, headers=headers, timeout=15.0)
+        if resp.status_code != 200:
+            logger.warning("detect_intent bad status: %s", resp.status_code)
+            return None
+        data = resp.json()
+        content = data["choices"][0]["message"]["content"].strip()
+        # Strip <think>...</think> reasoning blocks (MiniMax M2.1+)
+        content = re.sub(r"<think>[\s\S]*?</think>", "", content).strip()
+        # Strip markdown code fences if present
+        content = re.sub(r"^```(?:json)?\s*", "", content)
+        content = re.sub(r"\s*```$", "", content)
+        result = json.loads(content)
+        if result.get("action"):
+            return result
     except Exception as e:
         logger.warning("detect_intent error: %s", e)
 
@@ -127,8 +127,12 @@ async def detect_intent(message: str) -> dict | None:
 # ---------------------------------------------------------------------------
 
 
-def execute_action(intent: dict, creds) -> dict | None:
-    """Execute a Google action based on detected intent. Returns structured result."""
+def execute_action(intent: dict, creds, user_id: int) -> dict | None:
+    """Execute a Google action based on detected intent. Returns structured result.
+
+    Blocking; calendar reads come from the local mirror, Gmail lists from the
+    local mail index and Drive lists from the per-user google_cache.
+    """
     action = intent.get("action")
     params = intent.get("params") or {}
 
@@ -137,14 +141,18 @@ def execute_action(intent: dict, creds) -> dict | None:
             now = datetime.now(timezone.utc)
             start = now.replace(hour=0, minute=0, second=0, microsecond=0)
             end = start + timedelta(days=1)
-            events = list_events(creds, time_min=start.isoformat(), time_max=end.isoformat())
+            events = calendar_mirror.list_events(
+                user_id, creds, time_min=start.isoformat(), time_max=end.isoformat()
+            )
             return {"type": "calendar_events", "period": "hoy", "events": events}
 
         elif action == "calendar_week":
             now = datetime.now(timezone.utc)
             start = now.replace(hour=0, minute=0, second=0, microsecond=0)
             end = start + timedelta(days=7)
-            events = list_events(creds, time_min=start.isoformat(), time_max=end.isoformat())
+            events = calendar_mirror.list_events(
+                user_id, creds, time_min=start.isoformat(), time_max=end.isoformat()
+            )
             return {"type": "calendar_events", "period": "esta semana", "events": events}
 
         elif action == "calendar_create":
@@ -166,15 +174,16 @@ def execute_action(intent: dict, creds) -> dict | None:
                 description=params.get("description"),
                 location=params.get("location"),
             )
+            calendar_mirror.mark_stale(user_id)
             return {"type": "calendar_created", "event": event}
 
         elif action == "gmail_unread":
-            messages = list_messages(creds, query="is:unread", max_results=10)
+            messages = gmail_index.messages(user_id, creds, "is:unread", max_results=10)
             return {"type": "gmail_messages", "filter": "no leidos", "messages": messages}
 
         elif action == "gmail_search":
             query = params.get("query", "")
-            messages = list_messages(creds, query=query, max_results=10)
+            messages = gmail_index.messages(user_id, creds, query, max_results=10)
             return {"type": "gmail_messages", "filter": query, "messages": messages}
 
         elif action == "gmail_send":
@@ -183,11 +192,13 @@ def execute_action(intent: dict, creds) -> dict | None:
             body = params.get("body", "")
             if to and body:
                 send_message(creds, to=to, subject=subject, body=body)
+                google_cache.invalidate(user_id, "gmail")
+                gmail_index.mark_stale(user_id)
                 return {"type": "gmail_sent", "to": to, "subject": subject}
             return None
 
         elif action == "drive_recent":
-            files = list_recent(creds, max_results=10)
+            files = google_cache.drive_recent(user_id, creds, max_results=10)
             return {"type": "drive_files", "filter": "recientes", "files": files}
 
         elif action == "drive_search":
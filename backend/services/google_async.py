@@ -0,0 +1,87 @@
+"""Async facade over the synchronous Google client stack.
+
+googleapiclient and google-auth are blocking (httplib2 / requests). Calls
+from async code go through `run`, which executes them on a bounded thread
+pool and limits how many calls a single user can have in flight, so one
+slow Google request never freezes the event loop or starves other users.
+A background task also refreshes the cached access tokens of recently
+active users shortly before they expire, so requests rarely pay for a
+refresh, and drops the credentials of idle users.
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from google.oauth2.credentials import Credentials
+
+from backend.config import settings
+from backend.services import google_credentials
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+_user_limits: dict[int, asyncio.Semaphore] = {}
+_refresher: asyncio.Task | None = None
+
+
+def start():
+    """Start the thread pool and, when called from the event loop, the token refresher."""
+    global _executor, _refresher
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.GOOGLE_WORKERS, thread_name_prefix="google"
+        )
+    if _refresher is None:
+        try:
+            _refresher = asyncio.get_running_loop().create_task(_refresh_loop())
+        except RuntimeError:
+            pass  # no running loop (e.g. CLI use): refresh on demand only
+
+
+async def shutdown():
+    global _executor, _refresher
+    if _refresher is not None:
+        _refresher.cancel()
+        await asyncio.gather(_refresher, return_exceptions=True)
+        _refresher = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _user_limits.clear()
+
+
+def _limit_for(user_id: int) -> asyncio.Semaphore:
+    sem = _user_limits.get(user_id)
+    if sem is None:
+        sem = asyncio.Semaphore(settings.GOOGLE_USER_CONCURRENCY)
+        _user_limits[user_id] = sem
+    return sem
+
+
+async def run(user_id: int, fn, *args, **kwargs):
+    """Run a blocking Google call for a user on the Google thread pool."""
+    if _executor is None:
+        start()
+    async with _limit_for(user_id):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def get_credentials(user_id: int) -> Credentials | None:
+    """Load (and refresh if expiring) a user's credentials without blocking the loop."""
+    return await run(user_id, google_credentials.get_credentials, user_id)
+
+
+async def _refresh_loop():
+    lead = timedelta(seconds=settings.GOOGLE_REFRESH_LEAD_SECONDS)
+    while True:
+        await asyncio.sleep(settings.GOOGLE_REFRESH_INTERVAL)
+        google_credentials.evict_idle()
+        for user_id in google_credentials.expiring_users(lead.total_seconds()):
+            try:
+                await run(user_id, google_credentials.refresh_ahead, user_id, lead)
+            except Exception as e:
+                logger.warning("Proactive Google token refresh failed for user %s: %s", user_id, e)
@@ -1,6 +1,8 @@
 import json
+from datetime import datetime
 
 from cryptography.fernet import Fernet
+from google.oauth2.credentials import Credentials
 from sqlalchemy.orm import Session
 
 from backend.config import settings
@@ -54,3 +56,30 @@ def delete_token(db: Session, user_id: int) -> bool:
     db.delete(row)
     db.commit()
     return True
+
+
+def credentials_to_dict(creds: Credentials) -> dict:
+    return {
+        "token": creds.token,
+        "refresh_token": creds.refresh_token,
+        "token_uri": creds.token_uri,
+        "client_id": creds.client_id,
+        "client_secret": creds.client_secret,
+        "scopes": list(creds.scopes) if creds.scopes else [],
+        "expiry": creds.expiry.isoformat() if creds.expiry else None,
+    }
+
+
+def dict_to_credentials(data: dict) -> Credentials:
+    # google-auth compares expiry against a naive UTC datetime
+    expiry = datetime.fromisoformat(data["expiry"]).replace(tzinfo=None) if data.get("expiry") else None
+    return Credentials(
+        token=data.get("token"),
+        refresh_token=data.get("refresh_token"),
+        token_uri=data.get("token_uri"),
+        client_id=data.get("client_id"),
+        client_secret=data.get("client_secret"),
+        scopes=data.get("scopes"),
+        expiry=expiry,
+    )
+
@@ -0,0 +1,105 @@
+"""Per-user read-through cache for Google list results.
+
+Dashboard widgets and chat actions poll the same Gmail and Drive lists
+(Calendar is served from a local mirror, see calendar_mirror). Results are
+served from memory for GOOGLE_CACHE_TTL seconds; after that they are
+revalidated instead of refetched when the API offers a cheap validator:
+
+- Gmail: the mailbox historyId from users.getProfile
+- Drive: the changes start page token
+
+Entries older than GOOGLE_CACHE_MAX_AGE are always refetched. Writes (send
+mail, upload) invalidate the user's namespace. The functions here block and
+run on the Google thread pool.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from google.oauth2.credentials import Credentials
+
+from backend.config import settings
+from backend.services import google_drive, google_gmail
+from backend.services.metrics import GOOGLE_LIST_CACHE
+
+
+@dataclass
+class _Entry:
+    value: list
+    validator: str | None
+    fetched_at: float
+    checked_at: float
+
+
+_lock = threading.Lock()
+_cache: OrderedDict[tuple, _Entry] = OrderedDict()
+# (user_id, namespace) -> generation; bumped on invalidation so that a fetch
+# which started before a write does not store its now-stale result
+_generations: dict[tuple[int, str], int] = {}
+
+
+def _cached(user_id: int, namespace: str, key: tuple, fetch) -> list:
+    """Serve `fetch(validator) -> (value | None, validator)` through the cache.
+
+    `fetch` returns None as the value when the validator shows no change.
+    """
+    cache_key = (user_id, namespace, key)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(cache_key)
+        generation = _generations.get((user_id, namespace), 0)
+        if entry is not None and now - entry.checked_at < settings.GOOGLE_CACHE_TTL:
+            _cache.move_to_end(cache_key)
+            GOOGLE_LIST_CACHE.inc(namespace=namespace, result="hit")
+            return entry.value
+
+    revalidate = entry is not None and now - entry.fetched_at < settings.GOOGLE_CACHE_MAX_AGE
+    value, validator = fetch(entry.validator if revalidate else None)
+
+    with _lock:
+        current = _generations.get((user_id, namespace), 0) == generation
+        if value is None and revalidate:
+            GOOGLE_LIST_CACHE.inc(namespace=namespace, result="revalidated")
+            if current:
+                entry.checked_at = now
+                _cache[cache_key] = entry
+                _cache.move_to_end(cache_key)
+            return entry.value
+        GOOGLE_LIST_CACHE.inc(namespace=namespace, result="miss")
+        if current:
+            _cache[cache_key] = _Entry(value, validator, now, now)
+            _cache.move_to_end(cache_key)
+            while len(_cache) > settings.GOOGLE_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return value
+
+
+def invalidate(user_id: int, namespace: str | None = None):
+    """Drop a user's cached lists (one namespace, or all of them)."""
+    with _lock:
+        for key in [k for k in _cache if k[0] == user_id and namespace in (None, k[1])]:
+            del _cache[key]
+        for ns in ("gmail", "drive") if namespace is None else (namespace,):
+            _generations[(user_id, ns)] = _generations.get((user_id, ns), 0) + 1
+
+
+def gmail_messages(user_id: int, creds: Credentials, query: str = "", max_results: int = 20) -> list[dict]:
+    def fetch(history_id):
+        current = google_gmail.mailbox_version(creds)
+        if history_id and current == history_id:
+            return None, current
+        return google_gmail.list_messages(creds, query=query, max_results=max_results), current
+
+    return _cached(user_id, "gmail", (query, max_results), fetch)
+
+
+def drive_recent(user_id: int, creds: Credentials, max_results: int = 20) -> list[dict]:
+    def fetch(page_token):
+        current = google_drive.changes_version(creds)
+        if page_token and current == page_token:
+            return None, current
+        return google_drive.list_recent(creds, max_results=max_results), current
+
+    return _cached(user_id, "drive", ("recent", max_results), fetch)
@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta, timezone
 
-from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 
+from backend.services.google_services import get_service
+
 
 def _get_service(creds: Credentials):
-    return build("calendar", "v3", credentials=creds)
+    return get_service("calendar", "v3", creds)
 
 
 def list_events(
@@ -28,13 +29,46 @@ def list_events(
 
     result = service.events().list(**params).execute()
     events = result.get("items", [])
-    return [_format_event(e) for e in events]
+    return [format_event(e) for e in events]
+
+
+def event_pages(
+    creds: Credentials,
+    sync_token: str | None = None,
+    max_pages: int = 200,
+    time_min: str | None = None,
+    time_max: str | None = None,
+):
+    """Yield raw events.list pages for a full or incremental (syncToken) sync.
+
+    time_min/time_max bound a full sync; the API rejects them together with
+    a sync token, so incremental syncs report changes to any event. The last
+    page carries `nextSyncToken`. An expired sync token raises HttpError 410.
+    """
+    service = _get_service(creds)
+    page_token = None
+    for _ in range(max_pages):
+        params: dict = {"calendarId": "primary", "singleEvents": True, "maxResults": 2500}
+        if sync_token:
+            params["syncToken"] = sync_token
+        else:
+            if time_min:
+                params["timeMin"] = time_min
+            if time_max:
+                params["timeMax"] = time_max
+        if page_token:
+            params["pageToken"] = page_token
+        page = service.events().list(**params).execute()
+        yield page
+        page_token = page.get("nextPageToken")
+        if not page_token:
+            return
 
 
 def get_event(creds: Credentials, event_id: str) -> dict:
     service = _get_service(creds)
     event = service.events().get(calendarId="primary", eventId=event_id).execute()
-    return _format_event(event)
+    return format_event(event)
 
 
 def create_event(
@@ -60,7 +94,7 @@ def create_event(
         body["attendees"] = [{"email": a} for a in attendees]
 
     event = service.events().insert(calendarId="primary", body=body).execute()
-    return _format_event(event)
+    return format_event(event)
 
 
 def delete_event(creds: Credentials, event_id: str) -> bool:
@@ -80,7 +114,7 @@ def _parse_datetime(dt_str: str) -> dict:
     return {"dateTime": dt_str}
 
 
-def _format_event(event: dict) -> dict:
+def format_event(event: dict) -> dict:
     start = event.get("start", {})
     end = event.get("end", {})
     return {
@@ -1,9 +1,10 @@
-from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 
+from backend.services.google_services import get_service
+
 
 def _get_service(creds: Credentials):
-    return build("people", "v1", credentials=creds)
+    return get_service("people", "v1", creds)
 
 
 def list_contacts(
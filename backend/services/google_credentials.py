@@ -0,0 +1,159 @@
+"""In-memory cache of decrypted Google credentials, with single-flight refresh.
+
+Loading credentials means a DB query, a Fernet decrypt and a JSON parse;
+refreshing them is a blocking HTTP call. Credentials are kept per user until
+shortly before the access token expires, and dropped once the user has not
+asked for them in GOOGLE_CREDENTIALS_IDLE_TTL seconds; only users seen in the
+last GOOGLE_REFRESH_ACTIVE_SECONDS are refreshed ahead of expiry (see
+google_async). Refreshes take a per-user lock, so
+concurrent callers with an expired token wait for one refresh instead of
+each refreshing and writing the token back. The functions here block and
+are meant to run on the Google thread pool (see google_async).
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from google.auth.transport.requests import Request as GoogleRequest
+from google.oauth2.credentials import Credentials
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.services import google_services
+from backend.services.google_auth import (
+    credentials_to_dict,
+    dict_to_credentials,
+    get_stored_token,
+    store_token,
+)
+
+logger = logging.getLogger(__name__)
+
+REFRESH_MARGIN = timedelta(seconds=60)  # refresh on demand when this close to expiry
+UNKNOWN_EXPIRY_TTL = 300  # seconds to cache credentials whose expiry is unknown
+
+_lock = threading.Lock()
+_user_locks: dict[int, threading.Lock] = {}
+# user_id -> (credentials, monotonic time the entry stops being served)
+_cache: dict[int, tuple[Credentials, float]] = {}
+_last_used: dict[int, float] = {}  # user_id -> monotonic time of the last get_credentials
+
+
+def _lock_for(user_id: int) -> threading.Lock:
+    with _lock:
+        lock = _user_locks.get(user_id)
+        if lock is None:
+            lock = threading.Lock()
+            _user_locks[user_id] = lock
+        return lock
+
+
+def _seconds_left(creds: Credentials) -> float | None:
+    if creds.expiry is None:
+        return None
+    # Credentials.expiry is a naive UTC datetime
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return (creds.expiry - now).total_seconds()
+
+
+def _needs_refresh(creds: Credentials, margin: timedelta = REFRESH_MARGIN) -> bool:
+    if not creds.refresh_token:
+        return False
+    left = _seconds_left(creds)
+    # Tokens stored before expiry was recorded are refreshed once to learn it
+    return left is None or left <= margin.total_seconds()
+
+
+def _cached(user_id: int, margin: timedelta = REFRESH_MARGIN) -> Credentials | None:
+    entry = _cache.get(user_id)
+    if entry is None:
+        return None
+    creds, valid_until = entry
+    if time.monotonic() >= valid_until or _needs_refresh(creds, margin):
+        return None
+    return creds
+
+
+def _remember(user_id: int, creds: Credentials):
+    left = _seconds_left(creds)
+    if left is None:
+        ttl = UNKNOWN_EXPIRY_TTL
+    else:
+        ttl = max(0.0, left - REFRESH_MARGIN.total_seconds())
+    _cache[user_id] = (creds, time.monotonic() + ttl)
+
+
+def get_credentials(user_id: int, margin: timedelta = REFRESH_MARGIN) -> Credentials | None:
+    """Return credentials for a user, refreshing them if they expire within `margin`."""
+    _last_used[user_id] = time.monotonic()
+    return _load(user_id, margin)
+
+
+def refresh_ahead(user_id: int, margin: timedelta):
+    """Refresh a user's credentials before they expire, without counting as a use."""
+    _load(user_id, margin)
+
+
+def _load(user_id: int, margin: timedelta) -> Credentials | None:
+    creds = _cached(user_id, margin)
+    if creds is not None:
+        return creds
+
+    with _lock_for(user_id):
+        # Another caller may have loaded or refreshed them while we waited
+        creds = _cached(user_id, margin)
+        if creds is not None:
+            return creds
+
+        db = SessionLocal()
+        try:
+            token_data = get_stored_token(db, user_id)
+            if not token_data:
+                _cache.pop(user_id, None)
+                return None
+            creds = dict_to_credentials(token_data)
+            if _needs_refresh(creds, margin):
+                creds.refresh(GoogleRequest())
+                google_services.invalidate(creds)
+                store_token(db, user_id, credentials_to_dict(creds), " ".join(creds.scopes or []))
+                logger.info("Refreshed Google token for user %s", user_id)
+        finally:
+            db.close()
+        _remember(user_id, creds)
+        return creds
+
+
+def expiring_users(lead_seconds: float) -> list[int]:
+    """Recently active users whose cached access token expires within lead_seconds."""
+    active_since = time.monotonic() - settings.GOOGLE_REFRESH_ACTIVE_SECONDS
+    users = []
+    for user_id, (creds, _) in list(_cache.items()):
+        if _last_used.get(user_id, 0.0) < active_since:
+            continue
+        left = _seconds_left(creds)
+        if creds.refresh_token and left is not None and left <= lead_seconds:
+            users.append(user_id)
+    return users
+
+
+def evict_idle() -> int:
+    """Drop credentials not asked for in GOOGLE_CREDENTIALS_IDLE_TTL seconds; returns how many."""
+    idle_since = time.monotonic() - settings.GOOGLE_CREDENTIALS_IDLE_TTL
+    evicted = 0
+    for user_id in list(_cache):
+        if _last_used.get(user_id, 0.0) < idle_since:
+            _cache.pop(user_id, None)
+            _last_used.pop(user_id, None)
+            evicted += 1
+    return evicted
+
+
+def invalidate(user_id: int):
+    """Forget a user's cached credentials (after connect, disconnect or revocation)."""
+    _cache.pop(user_id, None)
+
+
+def cache_size() -> int:
+    return len(_cache)
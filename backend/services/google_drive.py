@@ -1,12 +1,13 @@
 import io
 
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload
 from google.oauth2.credentials import Credentials
 
+from backend.services.google_services import get_service
+
 
 def _get_service(creds: Credentials):
-    return build("drive", "v3", credentials=creds)
+    return get_service("drive", "v3", creds)
 
 
 MIME_ICONS = {
@@ -62,6 +63,12 @@ def list_recent(creds: Credentials, max_results: int = 20) -> list[dict]:
     return [_format_file(f) for f in result.get("files", [])]
 
 
+def changes_version(creds: Credentials) -> str:
+    """Current change-log page token; it advances whenever any file changes."""
+    service = _get_service(creds)
+    return service.changes().getStartPageToken().execute().get("startPageToken", "")
+
+
 def get_file(creds: Credentials, file_id: str) -> dict:
     service = _get_service(creds)
     f = (
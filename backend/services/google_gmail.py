@@ -1,12 +1,19 @@
 import base64
+import logging
 from email.mime.text import MIMEText
 
-from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 
+from backend.services.google_services import get_service
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50  # Gmail recommends at most 50 calls per batch request
+METADATA_HEADERS = ["From", "Subject", "Date"]
+
 
 def _get_service(creds: Credentials):
-    return build("gmail", "v1", credentials=creds)
+    return get_service("gmail", "v1", creds)
 
 
 def list_messages(
@@ -22,23 +29,115 @@ def list_messages(
     messages = result.get("messages", [])
     if not messages:
         return []
-    # Fetch metadata for each message
-    out = []
-    for msg_stub in messages:
-        msg = (
-            service.users()
-            .messages()
-            .get(userId="me", id=msg_stub["id"], format="metadata", metadataHeaders=["From", "Subject", "Date"])
-            .execute()
+    ids = [m["id"] for m in messages]
+    fetched = _get_batch(service, ids, "metadata")
+    return [_format_message_summary(fetched[i]) for i in ids if i in fetched]
+
+
+def _message_request(service, message_id: str, fmt: str):
+    if fmt == "metadata":
+        return service.users().messages().get(
+            userId="me", id=message_id, format="metadata", metadataHeaders=METADATA_HEADERS
         )
-        out.append(_format_message_summary(msg))
-    return out
+    return service.users().messages().get(userId="me", id=message_id, format=fmt)
+
+
+def _get_batch(service, ids: list[str], fmt: str) -> dict[str, dict]:
+    """Fetch messages with batch requests (one round trip per BATCH_SIZE ids).
+
+    A failing message is logged and skipped; it does not fail the listing.
+    """
+    results: dict[str, dict] = {}
+
+    def _collect(request_id, response, exception):
+        if exception is not None:
+            logger.warning("Gmail %s fetch failed for %s: %s", fmt, request_id, exception)
+            return
+        results[request_id] = response
+
+    for start in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[start:start + BATCH_SIZE]
+        batch = service.new_batch_http_request(callback=_collect)
+        for message_id in chunk:
+            batch.add(_message_request(service, message_id, fmt), request_id=message_id)
+        try:
+            batch.execute()
+        except Exception as e:
+            # Batch endpoint itself failed: fall back to individual requests
+            logger.warning("Gmail batch request failed, fetching individually: %s", e)
+            for message_id in chunk:
+                if message_id in results:
+                    continue
+                try:
+                    results[message_id] = _message_request(service, message_id, fmt).execute()
+                except Exception as item_error:
+                    _collect(message_id, None, item_error)
+    return results
+
+
+def fetch_messages(creds: Credentials, ids: list[str], fmt: str = "full") -> dict[str, dict]:
+    """Raw messages by id, fetched in batches. Missing or failing ids are omitted."""
+    return _get_batch(_get_service(creds), ids, fmt)
+
+
+def list_message_ids(creds: Credentials, limit: int, query: str = "") -> list[str]:
+    """Ids of the newest messages matching `query`, following pagination up to `limit`."""
+    service = _get_service(creds)
+    ids: list[str] = []
+    page_token = None
+    while len(ids) < limit:
+        params: dict = {"userId": "me", "maxResults": min(500, limit - len(ids))}
+        if query:
+            params["q"] = query
+        if page_token:
+            params["pageToken"] = page_token
+        result = service.users().messages().list(**params).execute()
+        ids.extend(m["id"] for m in result.get("messages", []))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            break
+    return ids
+
+
+def history_since(creds: Credentials, start_history_id: str) -> tuple[list[dict], str]:
+    """All history records after start_history_id, and the mailbox's current historyId.
+
+    Raises HttpError 404 when start_history_id is too old to be replayed.
+    """
+    service = _get_service(creds)
+    records: list[dict] = []
+    latest = start_history_id
+    page_token = None
+    while True:
+        params: dict = {"userId": "me", "startHistoryId": start_history_id}
+        if page_token:
+            params["pageToken"] = page_token
+        result = service.users().history().list(**params).execute()
+        records.extend(result.get("history", []))
+        latest = str(result.get("historyId", latest))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return records, latest
+
+
+def mailbox_version(creds: Credentials) -> str:
+    """Current mailbox historyId; it changes whenever any message or label changes."""
+    service = _get_service(creds)
+    profile = service.users().getProfile(userId="me").execute()
+    return str(profile.get("historyId", ""))
+
+
+def unread_count(creds: Credentials) -> int:
+    """Unread messages in the mailbox, from the UNREAD system label."""
+    service = _get_service(creds)
+    label = service.users().labels().get(userId="me", id="UNREAD").execute()
+    return int(label.get("messagesUnread", 0))
 
 
 def get_message(creds: Credentials, message_id: str) -> dict:
     service = _get_service(creds)
     msg = service.users().messages().get(userId="me", id=message_id, format="full").execute()
-    return _format_message_full(msg)
+    return format_message_full(msg)
 
 
 def send_message(
@@ -112,7 +211,7 @@ def _extract_body(payload: dict) -> str:
     return ""
 
 
-def _format_message_full(msg: dict) -> dict:
+def format_message_full(msg: dict) -> dict:
     headers = msg.get("payload", {}).get("headers", [])
     labels = msg.get("labelIds", [])
     body = _extract_body(msg.get("payload", {}))
@@ -0,0 +1,93 @@
+"""Cache of googleapiclient service objects.
+
+`discovery.build` parses the discovery document and builds the whole
+resource tree on every call. Service objects are cached here per API,
+version and user grant, with a TTL and LRU eviction, so one user holds at
+most one entry per API. httplib2 connections are not thread-safe, so the
+services are built with a request builder that sends every request through
+the calling thread's own httplib2.Http (shared by all users on that thread,
+which keeps connections to Google alive between calls). Entries are rebuilt
+when the access token changes and dropped explicitly when credentials are
+refreshed.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import httplib2
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest, build_http
+
+from backend.config import settings
+from backend.services.metrics import GOOGLE_SERVICE_CACHE
+
+_lock = threading.Lock()
+# (api, version, grant) -> (service, access token, created at)
+_cache: OrderedDict[tuple, tuple] = OrderedDict()
+_local = threading.local()
+
+
+def grant_key(creds: Credentials) -> str:
+    """Stable identifier for a user's grant that survives token refreshes."""
+    basis = creds.refresh_token or creds.token or ""
+    return hashlib.sha256(basis.encode()).hexdigest()[:16]
+
+
+def _thread_http() -> httplib2.Http:
+    """The calling thread's connection pool."""
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = _local.http = build_http()
+    return http
+
+
+def _request_builder(creds: Credentials):
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(AuthorizedHttp(creds, http=_thread_http()), *args, **kwargs)
+    return build_request
+
+
+def get_service(api: str, version: str, creds: Credentials):
+    key = (api, version, grant_key(creds))
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            service, token, created = entry
+            if token == creds.token and now - created < settings.GOOGLE_SERVICE_CACHE_TTL:
+                _cache.move_to_end(key)
+                GOOGLE_SERVICE_CACHE.inc(api=api, result="hit")
+                return service
+            del _cache[key]
+    GOOGLE_SERVICE_CACHE.inc(api=api, result="miss")
+
+    service = build(
+        api,
+        version,
+        http=AuthorizedHttp(creds, http=_thread_http()),
+        requestBuilder=_request_builder(creds),
+        cache_discovery=False,
+    )
+    with _lock:
+        _cache[key] = (service, creds.token, now)
+        _cache.move_to_end(key)
+        while len(_cache) > settings.GOOGLE_SERVICE_CACHE_SIZE:
+            evicted, _ = _cache.popitem(last=False)
+            GOOGLE_SERVICE_CACHE.inc(api=evicted[0], result="evict")
+    return service
+
+
+def invalidate(creds: Credentials):
+    """Drop every cached service built for this grant (e.g. after a refresh)."""
+    grant = grant_key(creds)
+    with _lock:
+        for key in [k for k in _cache if k[2] == grant]:
+            del _cache[key]
+
+
+def cache_size() -> int:
+    return len(_cache)
@@ -0,0 +1,118 @@
+"""Shared, app-scoped httpx.AsyncClient registry.
+
+One keep-alive pool per upstream host (MINIMAX, Perplexity, Telegram,
+Google OAuth) so chat turns, intent checks and Telegram sends reuse open
+TCP/TLS connections instead of handshaking on every call. Each client's
+base_url is its upstream's URL, so callers may pass absolute URLs or paths
+relative to it.
+"""
+
+import logging
+
+import httpx
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+_clients: dict[str, httpx.AsyncClient] = {}
+_stats: dict[str, dict[str, int]] = {}
+
+
+def _upstreams() -> dict[str, str]:
+    """Map client name -> base URL of the upstream it talks to."""
+    return {
+        "minimax": settings.MINIMAX_API_URL,
+        "perplexity": settings.PERPLEXITY_API_URL,
+        "telegram": "https://api.telegram.org",
+        "google": "https://oauth2.googleapis.com",
+    }
+
+
+def _http2_available() -> bool:
+    if not settings.HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP2_ENABLED is set but the 'h2' package is missing; using HTTP/1.1")
+        return False
+    return True
+
+
+def _make_client(name: str) -> httpx.AsyncClient:
+    stats = _stats.setdefault(name, {"requests": 0, "responses": 0, "errors": 0})
+    http2 = _http2_available()
+    stats["http2"] = int(http2)
+
+    async def on_request(request: httpx.Request):
+        stats["requests"] += 1
+
+    async def on_response(response: httpx.Response):
+        stats["responses"] += 1
+        if response.status_code >= 400:
+            stats["errors"] += 1
+
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        base_url=_upstreams()[name],
+        limits=limits,
+        timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+        http2=http2,
+        event_hooks={"request": [on_request], "response": [on_response]},
+    )
+
+
+def init_clients():
+    """Create one pooled client per upstream. Called from the app lifespan."""
+    for name in _upstreams():
+        if name not in _clients:
+            _clients[name] = _make_client(name)
+
+
+async def close_clients():
+    """Close every pooled client, releasing their keep-alive connections."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.warning("Error closing HTTP client: %s", e)
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Return the pooled client for an upstream, creating it lazily if needed."""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        if name not in _upstreams():
+            raise KeyError(f"Unknown HTTP upstream: {name}")
+        client = _make_client(name)
+        _clients[name] = client
+    return client
+
+
+def pool_stats() -> dict[str, dict]:
+    """Per-upstream request counters plus current pool usage.
+
+    The counters come from the clients' event hooks. The connection counts
+    are best-effort: httpx has no public pool API, so they are read from
+    private transport attributes and drop to 0 if those change.
+    """
+    out = {}
+    for name, counters in _stats.items():
+        entry = dict(counters)
+        client = _clients.get(name)
+        # httpx does not expose the pool publicly; read it defensively
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        entry["connections"] = len(connections)
+        entry["idle_connections"] = sum(
+            1 for c in connections if getattr(c, "is_idle", lambda: False)()
+        )
+        out[name] = entry
+    return out
@@ -0,0 +1,406 @@
+"""In-process background jobs for document text extraction.
+
+Uploads return immediately with extraction_status="pending"; the CPU-bound
+extraction (pypdf, python-docx, openpyxl) runs in a process pool so it never
+blocks the event loop, and job status is persisted in `extraction_jobs`.
+With several app workers, each one tries to claim every pending job with a
+conditional UPDATE, so exactly one runs it. The owner refreshes the job's
+heartbeat (and, for PDFs split into page ranges, its progress) while it
+runs; running jobs whose heartbeat is older than JOB_STALE_SECONDS belong to
+a dead worker and are requeued at startup and by a periodic sweep.
+Image thumbnails are generated in a separate, smaller pool so that a burst
+of photo uploads never delays extraction; they are not persisted as jobs
+since missing ones are regenerated on request. A pool whose worker process
+died (e.g. killed for memory) is replaced, failing only the tasks it held.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.database import SessionLocal
+from backend.models import Conversation, ExtractionJob, File
+from backend.services import blob_store, search_index, thumbnails
+from backend.services.file_handler import (
+    EXTRACTION_ERROR_PREFIX,
+    MAX_INDEX_CHARS,
+    Extraction,
+    cap_text,
+    extract_document,
+    extract_pdf_pages,
+    join_pages,
+    pdf_page_count,
+)
+
+logger = logging.getLogger(__name__)
+
+_pool: ProcessPoolExecutor | None = None
+_thumb_pool: ProcessPoolExecutor | None = None
+_tasks: set[asyncio.Task] = set()
+_done_events: dict[int, asyncio.Event] = {}  # file_id -> set when extraction finishes
+_progress: dict[int, int] = {}  # job_id -> percent, written with the next heartbeat
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _new_pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _replace_broken(pool: ProcessPoolExecutor):
+    """Swap out a pool that raised BrokenProcessPool, unless already replaced."""
+    global _pool, _thumb_pool
+    if pool is _pool:
+        _pool = _new_pool(settings.EXTRACTION_WORKERS)
+    elif pool is _thumb_pool:
+        _thumb_pool = _new_pool(settings.THUMBNAIL_WORKERS)
+    else:
+        return
+    logger.warning("A background worker process died, pool restarted")
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def start():
+    """Start the process pools and resume unfinished jobs."""
+    global _pool, _thumb_pool
+    if _pool is None:
+        _pool = _new_pool(settings.EXTRACTION_WORKERS)
+    if _thumb_pool is None:
+        _thumb_pool = _new_pool(settings.THUMBNAIL_WORKERS)
+    _requeue_stale()
+    db = SessionLocal()
+    try:
+        pending = db.query(ExtractionJob.id).filter(ExtractionJob.status == "pending").all()
+    finally:
+        db.close()
+    for (job_id,) in pending:
+        submit(job_id)
+    _track(asyncio.get_running_loop().create_task(_sweep_loop()))
+
+
+def _requeue_stale() -> list[int]:
+    """Return running jobs with a stale heartbeat to pending; returns their ids."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    stale = or_(ExtractionJob.heartbeat_at.is_(None), ExtractionJob.heartbeat_at < cutoff)
+    db = SessionLocal()
+    try:
+        ids = [
+            job_id
+            for (job_id,) in db.query(ExtractionJob.id)
+            .filter(ExtractionJob.status == "running", stale)
+            .all()
+        ]
+        if ids:
+            db.query(ExtractionJob).filter(
+                ExtractionJob.id.in_(ids), ExtractionJob.status == "running", stale
+            ).update({"status": "pending", "worker": None}, synchronize_session=False)
+            db.commit()
+            logger.warning("Requeued %d extraction jobs of dead workers", len(ids))
+        return ids
+    finally:
+        db.close()
+
+
+async def _sweep_loop():
+    while True:
+        await asyncio.sleep(settings.JOB_STALE_SECONDS)
+        try:
+            for job_id in await asyncio.to_thread(_requeue_stale):
+                submit(job_id)
+        except Exception as e:
+            logger.warning("Extraction job sweep failed: %s", e)
+
+
+async def shutdown():
+    global _pool, _thumb_pool
+    for task in list(_tasks):
+        task.cancel()
+    if _tasks:
+        await asyncio.gather(*_tasks, return_exceptions=True)
+    for pool in (_pool, _thumb_pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    _pool = _thumb_pool = None
+
+
+def enqueue_extraction(db: Session, f: File) -> ExtractionJob | None:
+    """Create a pending job for a file. Caller commits, then calls submit().
+
+    Returns None when the same content was already extracted: the cached
+    text from the blob store is applied immediately instead.
+    """
+    cached = blob_store.cached_extraction(db, f.sha256)
+    if cached is not None:
+        _apply_text(db, f, cached)
+        return None
+    f.extraction_status = "pending"
+    job = ExtractionJob(file_id=f.id, status="pending", progress=0)
+    db.add(job)
+    db.flush()
+    return job
+
+
+def _track(task: asyncio.Task):
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def submit(job_id: int):
+    """Schedule a persisted job on the running event loop; it runs if this worker claims it."""
+    _track(asyncio.get_running_loop().create_task(_run_job(job_id)))
+
+
+def submit_thumbnails(sha256: str):
+    """Generate the WebP derivatives of an uploaded image in the background."""
+    _track(asyncio.get_running_loop().create_task(_run_thumbnails(sha256)))
+
+
+async def _run_thumbnails(sha256: str):
+    pool = _thumb_pool
+    try:
+        if pool is None:
+            raise RuntimeError("thumbnail pool not started")
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(pool, thumbnails.generate, sha256)
+    except asyncio.CancelledError:
+        raise
+    except BrokenProcessPool:
+        logger.warning("Thumbnails for blob %s failed: worker process died", sha256)
+        _replace_broken(pool)
+    except ImportError:
+        logger.info("Pillow not installed, images are served without thumbnails")
+    except Exception as e:
+        logger.warning("Thumbnails for blob %s failed: %s", sha256, e)
+
+
+def _event_for(file_id: int) -> asyncio.Event:
+    event = _done_events.get(file_id)
+    if event is None:
+        event = asyncio.Event()
+        _done_events[file_id] = event
+    return event
+
+
+async def _run_job(job_id: int):
+    info = await asyncio.to_thread(_claim, job_id)
+    if info is None:
+        return
+    file_id, filepath, ext = info
+    event = _event_for(file_id)
+    heartbeat = asyncio.get_running_loop().create_task(_heartbeat(job_id))
+    pool = _pool
+    try:
+        if pool is None:
+            raise RuntimeError("extraction pool not started")
+        extraction = await _extract(pool, job_id, filepath, ext)
+        await asyncio.to_thread(_finish, job_id, extraction, None)
+    except asyncio.CancelledError:
+        raise
+    except BrokenProcessPool:
+        logger.warning("Extraction job %s failed: worker process died", job_id)
+        _replace_broken(pool)
+        await asyncio.to_thread(_finish, job_id, None, "extraction worker process died")
+    except Exception as e:
+        logger.warning("Extraction job %s failed: %s", job_id, e)
+        await asyncio.to_thread(_finish, job_id, None, str(e))
+    finally:
+        heartbeat.cancel()
+        _progress.pop(job_id, None)
+        event.set()
+        _done_events.pop(file_id, None)
+
+
+async def _heartbeat(job_id: int):
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+        try:
+            await asyncio.to_thread(_beat, job_id, _progress.get(job_id, 0))
+        except Exception as e:
+            logger.warning("Heartbeat of extraction job %s failed: %s", job_id, e)
+
+
+def _beat(job_id: int, progress: int):
+    db = SessionLocal()
+    try:
+        db.query(ExtractionJob).filter(
+            ExtractionJob.id == job_id,
+            ExtractionJob.status == "running",
+            ExtractionJob.worker == WORKER_ID,
+        ).update(
+            {"heartbeat_at": datetime.now(timezone.utc), "progress": progress},
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _extract(pool: ProcessPoolExecutor, job_id: int, filepath: str, ext: str) -> Extraction:
+    """Extract a document on the pool, fanning large PDFs out by page range.
+
+    Page ranges are submitted one window (a range per worker) at a time and
+    joined in order, so no further pages are parsed once MAX_INDEX_CHARS is
+    reached. The share of pages parsed is reported as the job's progress.
+    """
+    loop = asyncio.get_running_loop()
+    if ext != ".pdf" or settings.EXTRACTION_WORKERS < 2:
+        return await loop.run_in_executor(pool, extract_document, filepath, ext, MAX_INDEX_CHARS)
+    try:
+        page_count = await loop.run_in_executor(pool, pdf_page_count, filepath)
+    except BrokenProcessPool:
+        raise
+    except Exception as e:
+        return Extraction(f"{EXTRACTION_ERROR_PREFIX}: {e}]")
+    if page_count < settings.PDF_PARALLEL_MIN_PAGES:
+        return await loop.run_in_executor(pool, extract_document, filepath, ext, MAX_INDEX_CHARS)
+
+    step = settings.PDF_PAGES_PER_TASK
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    pages: list[str] = []
+    total = 0
+    try:
+        for i in range(0, len(ranges), settings.EXTRACTION_WORKERS):
+            budget = MAX_INDEX_CHARS - total
+            window = [
+                loop.run_in_executor(pool, extract_pdf_pages, filepath, start, stop, budget)
+                for start, stop in ranges[i : i + settings.EXTRACTION_WORKERS]
+            ]
+            for texts in await asyncio.gather(*window):
+                pages.extend(texts)
+                total += sum(len(t) + 1 for t in texts)
+            done = ranges[min(i + settings.EXTRACTION_WORKERS, len(ranges)) - 1][1]
+            _progress[job_id] = min(99, done * 100 // page_count)
+            if total >= MAX_INDEX_CHARS:
+                break
+    except BrokenProcessPool:
+        raise
+    except Exception as e:
+        return Extraction(f"{EXTRACTION_ERROR_PREFIX}: {e}]")
+    return join_pages(pages, MAX_INDEX_CHARS)
+
+
+def _claim(job_id: int) -> tuple[int, str, str] | None:
+    """Mark a pending job as running in this worker; None if another worker got it."""
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        claimed = (
+            db.query(ExtractionJob)
+            .filter(ExtractionJob.id == job_id, ExtractionJob.status == "pending")
+            .update(
+                {
+                    "status": "running",
+                    "worker": WORKER_ID,
+                    "heartbeat_at": now,
+                    "started_at": now,
+                    "progress": 0,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if not claimed:
+            return None
+        job = db.get(ExtractionJob, job_id)
+        if not job.file:
+            job.status = "error"
+            job.error = "file deleted"
+            job.finished_at = now
+            db.commit()
+            return None
+        ext = os.path.splitext(job.file.filename)[1].lower()
+        return job.file_id, job.file.filepath, ext
+    finally:
+        db.close()
+
+
+def _finish(job_id: int, extraction: Extraction | None, error: str | None):
+    db = SessionLocal()
+    try:
+        job = db.query(ExtractionJob).filter(ExtractionJob.id == job_id).first()
+        if not job:
+            return
+        f = job.file
+        job.finished_at = datetime.now(timezone.utc)
+        job.progress = 100
+        if error:
+            job.status = "error"
+            job.error = error
+            if f:
+                f.extraction_status = "error"
+        elif (extraction.text or "").startswith(EXTRACTION_ERROR_PREFIX):
+            # The extractor caught the failure: keep its note for the chat
+            # context, but report the job as failed and don't index or cache it
+            job.status = "error"
+            job.error = extraction.text
+            if f:
+                f.extracted_text = extraction.text
+                f.extraction_status = "error"
+        else:
+            job.status = "done"
+            job.error = None
+            if f:
+                _apply_text(db, f, extraction)
+                blob_store.remember_text(db, f.sha256, extraction)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _apply_text(db: Session, f: File, extraction: Extraction):
+    """Store extracted text on a file and re-index it. Caller commits."""
+    full_text = extraction.text
+    f.extracted_text = cap_text(full_text) if full_text else None
+    f.token_count = None
+    f.summary = None
+    f.extraction_status = "done"
+    user_id = (
+        db.query(Conversation.user_id)
+        .filter(Conversation.id == f.conversation_id)
+        .scalar()
+    )
+    if user_id is not None:
+        search_index.remove_file(db, f.id)
+        search_index.index_file(db, f, user_id, full_text=full_text, page_offsets=extraction.page_offsets)
+
+
+async def wait_for_files(pending: list[int], timeout: float | None = None) -> bool:
+    """Wait until the given files (ids of pending ones) finish extraction. Returns False on timeout."""
+    if not pending:
+        return True
+    timeout = settings.EXTRACTION_WAIT_SECONDS if timeout is None else timeout
+    deadline = asyncio.get_running_loop().time() + timeout
+    for file_id in pending:
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return False
+        if file_id in _done_events:
+            try:
+                await asyncio.wait_for(_done_events[file_id].wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        else:
+            # Job owned by another worker process (or already done): poll the row
+            while await asyncio.to_thread(_is_pending, file_id):
+                if asyncio.get_running_loop().time() >= deadline:
+                    return False
+                await asyncio.sleep(0.25)
+    return True
+
+
+def _is_pending(file_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        status = db.query(File.extraction_status).filter(File.id == file_id).scalar()
+        return status == "pending"
+    finally:
+        db.close()
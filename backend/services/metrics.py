@@ -0,0 +1,225 @@
+"""In-process metrics with Prometheus text exposition.
+
+Per-request timing spans for the chat pipeline (intent detection, Google
+credentials, history query, upstream connect, first chunk, document
+generation) plus stream throughput per model label.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from backend.services import http_client
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with _lock:
+            data = self._values.get(key)
+            if data is None:
+                data = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = data
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, data in sorted(self._values.items()):
+            for i, bound in enumerate(self.buckets):
+                le = _format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {data[i]}")
+            inf = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {data[-1]}")
+            lbl = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{lbl} {data[-2]}")
+            lines.append(f"{self.name}_count{lbl} {data[-1]}")
+        return lines
+
+
+CHAT_STAGE_SECONDS = Histogram(
+    "secretaria_chat_stage_seconds",
+    "Duration of each /api/chat pipeline stage in seconds.",
+    ("stage",),
+)
+CONTEXT_TOKENS = Histogram(
+    "secretaria_chat_context_tokens",
+    "Approximate prompt tokens sent to the LLM per chat turn.",
+    (),
+    (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+CHAT_REQUESTS = Counter(
+    "secretaria_chat_requests_total",
+    "Chat completions streamed, by model label.",
+    ("model",),
+)
+STREAM_TOKENS = Counter(
+    "secretaria_stream_tokens_total",
+    "Approximate tokens streamed from the LLM, by model label.",
+    ("model",),
+)
+STREAM_TOKENS_PER_SECOND = Histogram(
+    "secretaria_stream_tokens_per_second",
+    "Approximate LLM stream throughput in tokens per second.",
+    ("model",),
+    RATE_BUCKETS,
+)
+STREAM_CHUNKS_PER_SECOND = Histogram(
+    "secretaria_stream_chunks_per_second",
+    "LLM stream throughput in chunks per second.",
+    ("model",),
+    RATE_BUCKETS,
+)
+
+GOOGLE_SERVICE_CACHE = Counter(
+    "secretaria_google_service_cache_total",
+    "Google API service object cache lookups (hit, miss) and evictions, by API.",
+    ("api", "result"),
+)
+GOOGLE_LIST_CACHE = Counter(
+    "secretaria_google_list_cache_total",
+    "Google list cache lookups: hit (fresh), revalidated (unchanged upstream) or miss.",
+    ("namespace", "result"),
+)
+
+REGISTRY: list = [
+    CHAT_STAGE_SECONDS,
+    CONTEXT_TOKENS,
+    CHAT_REQUESTS,
+    STREAM_TOKENS,
+    STREAM_TOKENS_PER_SECOND,
+    STREAM_CHUNKS_PER_SECOND,
+    GOOGLE_SERVICE_CACHE,
+    GOOGLE_LIST_CACHE,
+]
+
+
+class RequestTimer:
+    """Collects named timing spans for one request.
+
+    Spans are recorded both on the timer (for logging) and in the
+    CHAT_STAGE_SECONDS histogram.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: dict[str, float] = {}
+        self._open: dict[str, float] = {}
+
+    def begin(self, stage: str):
+        self._open[stage] = time.perf_counter()
+
+    def end(self, stage: str):
+        started = self._open.pop(stage, None)
+        if started is not None:
+            self.record(stage, time.perf_counter() - started)
+
+    @contextmanager
+    def span(self, stage: str):
+        self.begin(stage)
+        try:
+            yield
+        finally:
+            self.end(stage)
+
+    def mark(self, stage: str):
+        """Record the time elapsed since the request started."""
+        self.record(stage, time.perf_counter() - self.start)
+
+    def record(self, stage: str, seconds: float):
+        self.spans[stage] = seconds
+        CHAT_STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def summary(self) -> str:
+        return " ".join(f"{k}={v * 1000:.1f}ms" for k, v in self.spans.items())
+
+
+def record_stream(model: str, tokens: int, chunks: int, seconds: float):
+    """Record throughput for one completed LLM stream."""
+    CHAT_REQUESTS.inc(model=model)
+    STREAM_TOKENS.inc(tokens, model=model)
+    if seconds > 0:
+        STREAM_TOKENS_PER_SECOND.observe(tokens / seconds, model=model)
+        STREAM_CHUNKS_PER_SECOND.observe(chunks / seconds, model=model)
+
+
+def _render_http_pools() -> list[str]:
+    stats = http_client.pool_stats()
+    series = [
+        ("secretaria_http_requests_total", "counter", "Outbound HTTP requests by upstream.", "requests"),
+        ("secretaria_http_errors_total", "counter", "Outbound HTTP responses with status >= 400.", "errors"),
+        ("secretaria_http_pool_connections", "gauge", "Open pooled connections by upstream.", "connections"),
+        ("secretaria_http_pool_idle_connections", "gauge", "Idle keep-alive connections by upstream.", "idle_connections"),
+    ]
+    lines = []
+    for name, kind, help_text, field in series:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for upstream, entry in sorted(stats.items()):
+            lines.append(f'{name}{{upstream="{upstream}"}} {entry.get(field, 0)}')
+    return lines
+
+
+def render_metrics() -> str:
+    """Render every registered metric in Prometheus text format."""
+    lines: list[str] = []
+    with _lock:
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+    lines.extend(_render_http_pools())
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,8 @@
 import json
 from typing import AsyncGenerator
 
-import httpx
-
 from backend.config import settings
+from backend.services.http_client import get_client
 
 SYSTEM_PROMPT = "Eres Secretaria, un asistente personal eficiente y amable."
 
@@ -56,7 +55,7 @@ def _filter_think_blocks(text: str, inside_think: bool) -> tuple[str, str, bool]
 
 
 async def chat_completion_stream(
-    messages: list[dict], model: str | None = None
+    messages: list[dict], model: str | None = None, timer=None
 ) -> AsyncGenerator[str, None]:
     """Stream chat completion from MINIMAX AI (OpenAI-compatible API)."""
     if not settings.MINIMAX_API_KEY:
@@ -80,36 +79,40 @@ async def chat_completion_stream(
     inside_think = False
     buffer = ""
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        async with client.stream(
-            "POST", url, json=payload, headers=headers
-        ) as response:
-            if response.status_code != 200:
-                body = await response.aread()
-                try:
-                    detail = json.loads(body).get("error", {}).get("message", body.decode())
-                except Exception:
-                    detail = body.decode()
-                yield f"Error de MINIMAX AI ({response.status_code}): {detail}"
-                return
-
-            async for line in response.aiter_lines():
-                if not line.startswith("data: "):
-                    continue
-                data = line[6:]
-                if data == "[DONE]":
-                    break
-                try:
-                    chunk = json.loads(data)
-                    delta = chunk["choices"][0].get("delta", {})
-                    content = delta.get("content", "")
-                    if content:
-                        text = buffer + content
-                        output, buffer, inside_think = _filter_think_blocks(text, inside_think)
-                        if output:
-                            yield output
-                except (json.JSONDecodeError, KeyError, IndexError):
-                    continue
+    if timer:
+        timer.begin("upstream_connect")
+    client = get_client("minimax")
+    async with client.stream(
+        "POST", url, json=payload, headers=headers
+    ) as response:
+        if timer:
+            timer.end("upstream_connect")
+        if response.status_code != 200:
+            body = await response.aread()
+            try:
+                detail = json.loads(body).get("error", {}).get("message", body.decode())
+            except Exception:
+                detail = body.decode()
+            yield f"Error de MINIMAX AI ({response.status_code}): {detail}"
+            return
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+                delta = chunk["choices"][0].get("delta", {})
+                content = delta.get("content", "")
+                if content:
+                    text = buffer + content
+                    output, buffer, inside_think = _filter_think_blocks(text, inside_think)
+                    if output:
+                        yield output
+            except (json.JSONDecodeError, KeyError, IndexError):
+                continue
 
     # Flush any remaining buffer (only if it's not part of a think block)
     if buffer and not inside_think:
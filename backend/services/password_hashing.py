@@ -0,0 +1,90 @@
+"""Async facade over bcrypt for the login path.
+
+A bcrypt check takes hundreds of milliseconds of CPU. Run on the request
+threadpool, a burst of logins would hold every worker thread and delay
+all other sync routes, so hashing runs on its own small thread pool
+(HASH_WORKERS threads; bcrypt releases the GIL). Per username, at most
+LOGIN_USER_CONCURRENCY checks run at once and at most LOGIN_MAX_ATTEMPTS
+failed checks are allowed per LOGIN_ATTEMPT_WINDOW seconds, so hammering
+one account cannot monopolise the pool.
+"""
+
+import asyncio
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.auth import hash_password, verify_password
+from backend.config import settings
+
+_executor: ThreadPoolExecutor | None = None
+_user_limits: dict[str, asyncio.Semaphore] = {}
+_failures: dict[str, deque[float]] = {}  # username -> monotonic times of failed checks
+
+
+class TooManyAttempts(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many login attempts, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def start():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.HASH_WORKERS, thread_name_prefix="bcrypt")
+
+
+async def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+    _user_limits.clear()
+    _failures.clear()
+
+
+async def _run(fn, *args):
+    if _executor is None:
+        start()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args))
+
+
+def _limit_for(username: str) -> asyncio.Semaphore:
+    sem = _user_limits.get(username)
+    if sem is None:
+        sem = asyncio.Semaphore(settings.LOGIN_USER_CONCURRENCY)
+        _user_limits[username] = sem
+    return sem
+
+
+def _check_rate(username: str):
+    failures = _failures.get(username)
+    if not failures:
+        return
+    cutoff = time.monotonic() - settings.LOGIN_ATTEMPT_WINDOW
+    while failures and failures[0] <= cutoff:
+        failures.popleft()
+    if not failures:
+        del _failures[username]
+    elif len(failures) >= settings.LOGIN_MAX_ATTEMPTS:
+        raise TooManyAttempts(failures[0] - cutoff)
+
+
+async def verify(username: str, password: str, password_hash: str) -> bool:
+    """Check a password for an existing user. Raises TooManyAttempts when rate limited."""
+    _check_rate(username)
+    async with _limit_for(username):
+        # Re-check: attempts queued behind the semaphore may have failed meanwhile
+        _check_rate(username)
+        ok = await _run(verify_password, password, password_hash)
+    if ok:
+        _failures.pop(username, None)
+    else:
+        _failures.setdefault(username, deque()).append(time.monotonic())
+    return ok
+
+
+async def compute_hash(password: str) -> str:
+    return await _run(hash_password, password)
@@ -1,9 +1,8 @@
 import json
 from typing import AsyncGenerator
 
-import httpx
-
 from backend.config import settings
+from backend.services.http_client import get_client
 
 SEARCH_SYSTEM_PROMPT = (
     "Eres Secretaria. Busca informacion actualizada en internet y "
@@ -12,7 +11,7 @@ SEARCH_SYSTEM_PROMPT = (
 
 
 async def search_completion_stream(
-    messages: list[dict], model: str | None = None
+    messages: list[dict], model: str | None = None, timer=None
 ) -> AsyncGenerator[str, None]:
     """Stream search completion from Perplexity AI (OpenAI-compatible API)."""
     if not settings.PERPLEXITY_API_KEY:
@@ -33,30 +32,34 @@ async def search_completion_stream(
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        async with client.stream(
-            "POST", url, json=payload, headers=headers
-        ) as response:
-            if response.status_code != 200:
-                body = await response.aread()
-                try:
-                    detail = json.loads(body).get("error", {}).get("message", body.decode())
-                except Exception:
-                    detail = body.decode()
-                yield f"Error de Perplexity ({response.status_code}): {detail}"
-                return
-
-            async for line in response.aiter_lines():
-                if not line.startswith("data: "):
-                    continue
-                data = line[6:]
-                if data == "[DONE]":
-                    break
-                try:
-                    chunk = json.loads(data)
-                    delta = chunk["choices"][0].get("delta", {})
-                    content = delta.get("content", "")
-                    if content:
-                        yield content
-                except (json.JSONDecodeError, KeyError, IndexError):
-                    continue
+    if timer:
+        timer.begin("upstream_connect")
+    client = get_client("perplexity")
+    async with client.stream(
+        "POST", url, json=payload, headers=headers
+    ) as response:
+        if timer:
+            timer.end("upstream_connect")
+        if response.status_code != 200:
+            body = await response.aread()
+            try:
+                detail = json.loads(body).get("error", {}).get("message", body.decode())
+            except Exception:
+                detail = body.decode()
+            yield f"Error de Perplexity ({response.status_code}): {detail}"
+            return
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+                delta = chunk["choices"][0].get("delta", {})
+                content = delta.get("content", "")
+                if content:
+                    yield content
+            except (json.JSONDecodeError, KeyError, IndexError):
+                continue
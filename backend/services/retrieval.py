@@ -0,0 +1,97 @@
+"""Select the chunks of attached documents most relevant to a question.
+
+Documents are chunked at upload time (see search_index.index_file). When an
+attachment does not fit in the prompt, the chunks are ranked with BM25 —
+through the FTS5 index on SQLite, or an in-memory BM25 over the file's
+chunks elsewhere — and the top ones are sent instead of the full text.
+"""
+
+import math
+import re
+from collections import Counter
+
+from sqlalchemy.orm import Session
+
+from backend.config import settings
+from backend.models import SearchChunk
+from backend.services import search_index
+from backend.services.tokens import count_tokens
+
+STOPWORDS = {
+    # Spanish
+    "a", "al", "algo", "como", "con", "cual", "cuando", "de", "del", "donde", "el",
+    "ella", "en", "es", "esa", "ese", "esta", "este", "esto", "hay", "la", "las",
+    "le", "les", "lo", "los", "me", "mi", "mis", "muy", "no", "nos", "o", "para",
+    "pero", "por", "que", "qué", "se", "si", "sin", "sobre", "son", "su", "sus",
+    "te", "tu", "un", "una", "uno", "y", "ya", "dime", "decime",
+    # English
+    "an", "and", "are", "for", "in", "is", "it", "of", "on", "or", "the", "to",
+    "what", "with",
+}
+
+
+def query_terms(question: str) -> list[str]:
+    terms = re.findall(r"\w+", (question or "").lower(), flags=re.UNICODE)
+    return [t for t in terms if t not in STOPWORDS and len(t) > 1]
+
+
+def _bm25_rank(chunks: list[SearchChunk], terms: list[str], k1: float = 1.5, b: float = 0.75):
+    """Plain BM25 over a small set of chunks (used when FTS5 is unavailable)."""
+    docs = [Counter(re.findall(r"\w+", c.content.lower())) for c in chunks]
+    n = len(docs)
+    avgdl = sum(sum(d.values()) for d in docs) / n if n else 0
+    scored = []
+    for chunk, doc in zip(chunks, docs):
+        dl = sum(doc.values())
+        score = 0.0
+        for t in terms:
+            tf = doc.get(t, 0)
+            if not tf:
+                continue
+            df = sum(1 for d in docs if t in d)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / (avgdl or 1)))
+        if score > 0:
+            scored.append((chunk.id, score))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored
+
+
+def retrieve_chunks(
+    db: Session,
+    file_id: int,
+    question: str,
+    max_tokens: int,
+    top_k: int | None = None,
+) -> list[SearchChunk]:
+    """Return the most relevant chunks of a file that fit in max_tokens, in document order."""
+    top_k = top_k or settings.RETRIEVAL_TOP_K
+    terms = query_terms(question)
+    if not terms or max_tokens <= 0:
+        return []
+
+    if search_index.fts_enabled():
+        ranked = search_index.match_file_chunks(db, [file_id], terms, top_k)
+    else:
+        chunks = db.query(SearchChunk).filter(SearchChunk.file_id == file_id).all()
+        ranked = _bm25_rank(chunks, terms)[:top_k]
+    if not ranked:
+        return []
+
+    by_id = {
+        c.id: c
+        for c in db.query(SearchChunk).filter(SearchChunk.id.in_([cid for cid, _ in ranked])).all()
+    }
+    selected = []
+    used = 0
+    for chunk_id, _score in ranked:
+        chunk = by_id.get(chunk_id)
+        if chunk is None:
+            continue
+        cost = count_tokens(chunk.content)
+        if used + cost > max_tokens:
+            continue
+        selected.append(chunk)
+        used += cost
+    selected.sort(key=lambda c: c.chunk_index)
+    return selected
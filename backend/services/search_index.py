@@ -0,0 +1,314 @@
+"""Full-text search over messages and extracted file text.
+
+Text is split into paragraph-sized chunks stored in `search_chunks`. On
+SQLite an FTS5 external-content table (`search_chunks_fts`) mirrors that
+table through triggers, so inserts and deletes keep the index current
+without rebuilding it, and queries are answered from the inverted index
+ranked with BM25 instead of scanning rows with LIKE. On PostgreSQL a GIN
+index over `to_tsvector('simple', content)` plays the same role, ranked
+with ts_rank. The index itself is created by a migration.
+"""
+
+import logging
+import re
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from backend.models import Blob, Conversation, File, Message, SearchChunk
+from backend.services.file_handler import parse_page_offsets
+
+logger = logging.getLogger(__name__)
+
+CHUNK_MAX_CHARS = 1200
+SNIPPET_TOKENS = 16
+
+_backend: str | None = None  # "fts5", "postgres" or None (search disabled)
+
+_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_chunks_fts USING fts5(
+        content,
+        content='search_chunks',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_chunks_ai AFTER INSERT ON search_chunks BEGIN
+        INSERT INTO search_chunks_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_chunks_ad AFTER DELETE ON search_chunks BEGIN
+        INSERT INTO search_chunks_fts(search_chunks_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_chunks_au AFTER UPDATE ON search_chunks BEGIN
+        INSERT INTO search_chunks_fts(search_chunks_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO search_chunks_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+
+_PG_DDL = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_search_chunks_tsv
+    ON search_chunks USING gin (to_tsvector('simple', content))
+    """,
+]
+
+_TSVECTOR = "to_tsvector('simple', c.content)"
+
+
+def create_search_index(conn: Connection):
+    """Create the full-text index for the connection's dialect (run by a migration)."""
+    if conn.dialect.name == "postgresql":
+        for ddl in _PG_DDL:
+            conn.execute(text(ddl))
+    elif conn.dialect.name == "sqlite":
+        try:
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+        except Exception as e:
+            logger.warning("FTS5 not available, search disabled: %s", e)
+
+
+def _detect_backend(engine: Engine) -> str | None:
+    if engine.dialect.name == "postgresql":
+        return "postgres"
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            found = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_chunks_fts'"
+            )).first()
+        return "fts5" if found else None
+    return None
+
+
+def init_search_index(engine: Engine):
+    """Detect the full-text backend and backfill existing rows once."""
+    global _backend
+    _backend = _detect_backend(engine)
+    if _backend is None:
+        return
+
+    from backend.database import SessionLocal
+    db = SessionLocal()
+    try:
+        if db.query(SearchChunk.id).first() is None and db.query(Message.id).first() is not None:
+            rebuild_index(db)
+    finally:
+        db.close()
+
+
+def split_paragraphs(content: str, max_chars: int = CHUNK_MAX_CHARS) -> list[str]:
+    """Split text into paragraph chunks, merging short paragraphs up to max_chars."""
+    chunks: list[str] = []
+    current = ""
+    for para in re.split(r"\n\s*\n|\n", content or ""):
+        para = para.strip()
+        if not para:
+            continue
+        while len(para) > max_chars:
+            cut = para.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(para[:cut].strip())
+            para = para[cut:].strip()
+        if current and len(current) + len(para) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{para}" if current else para
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def index_message(db: Session, msg: Message, user_id: int):
+    """Index a message's content. Caller commits."""
+    for i, chunk in enumerate(split_paragraphs(msg.content)):
+        db.add(SearchChunk(
+            user_id=user_id,
+            conversation_id=msg.conversation_id,
+            message_id=msg.id,
+            chunk_index=i,
+            content=chunk,
+        ))
+
+
+def index_file(
+    db: Session,
+    f: File,
+    user_id: int,
+    full_text: str | None = None,
+    page_offsets: list[int] | None = None,
+):
+    """Index a file's text. Caller commits.
+
+    `full_text` is the untruncated extraction when available; the chunks are
+    also what attachment retrieval selects from. With `page_offsets` (PDFs)
+    each page is chunked separately and chunks record their page number.
+    """
+    content = full_text or f.extracted_text
+    if not content:
+        return
+    for i, (page, chunk) in enumerate(_page_chunks(content, page_offsets)):
+        db.add(SearchChunk(
+            user_id=user_id,
+            conversation_id=f.conversation_id,
+            file_id=f.id,
+            chunk_index=i,
+            page=page,
+            content=chunk,
+        ))
+
+
+def _page_chunks(content: str, page_offsets: list[int] | None):
+    if not page_offsets:
+        for chunk in split_paragraphs(content):
+            yield None, chunk
+        return
+    bounds = [*page_offsets, len(content)]
+    for n in range(len(page_offsets)):
+        for chunk in split_paragraphs(content[bounds[n] : bounds[n + 1]]):
+            yield n + 1, chunk
+
+
+def remove_file(db: Session, file_id: int):
+    db.query(SearchChunk).filter(SearchChunk.file_id == file_id).delete(
+        synchronize_session=False
+    )
+
+
+def remove_conversation(db: Session, conv_id: int):
+    db.query(SearchChunk).filter(SearchChunk.conversation_id == conv_id).delete(
+        synchronize_session=False
+    )
+
+
+def rebuild_index(db: Session):
+    """Re-index every message and file from scratch."""
+    db.query(SearchChunk).delete(synchronize_session=False)
+    owners = dict(db.query(Conversation.id, Conversation.user_id).all())
+    for msg in db.query(Message).yield_per(500):
+        if msg.conversation_id in owners:
+            index_message(db, msg, owners[msg.conversation_id])
+    files = (
+        db.query(File, Blob.page_offsets)
+        .outerjoin(Blob, Blob.sha256 == File.sha256)
+        .filter(File.extracted_text.isnot(None))
+        .yield_per(100)
+    )
+    for f, page_offsets in files:
+        if f.conversation_id in owners:
+            index_file(db, f, owners[f.conversation_id], page_offsets=parse_page_offsets(page_offsets))
+    db.commit()
+    logger.info("Search index rebuilt")
+
+
+def fts_enabled() -> bool:
+    return _backend is not None
+
+
+def match_file_chunks(
+    db: Session, file_ids: list[int], terms: list[str], limit: int
+) -> list[tuple[int, float]]:
+    """Return (chunk id, score) for the best chunks of the given files matching any term.
+
+    Scores are higher-is-better.
+    """
+    match = build_match_query(" ".join(terms), any_term=True)
+    if not match:
+        return []
+    if _backend == "postgres":
+        sql = f"""
+            SELECT c.id, ts_rank({_TSVECTOR}, to_tsquery('simple', :match)) AS score
+            FROM search_chunks c
+            WHERE {_TSVECTOR} @@ to_tsquery('simple', :match) AND c.file_id IN :file_ids
+            ORDER BY score DESC
+            LIMIT :limit
+        """
+    else:
+        sql = """
+            SELECT c.id, -bm25(search_chunks_fts) AS score
+            FROM search_chunks_fts
+            JOIN search_chunks c ON c.id = search_chunks_fts.rowid
+            WHERE search_chunks_fts MATCH :match AND c.file_id IN :file_ids
+            ORDER BY score DESC
+            LIMIT :limit
+        """
+    stmt = text(sql).bindparams(bindparam("file_ids", expanding=True))
+    rows = db.execute(stmt, {"match": match, "file_ids": list(file_ids), "limit": limit}).all()
+    return [(r[0], r[1]) for r in rows]
+
+
+def build_match_query(query: str, any_term: bool = False) -> str:
+    """Turn free text into a safe prefix-match query for the active backend.
+
+    Every term must match unless `any_term` is set.
+    """
+    terms = re.findall(r"\w+", query, flags=re.UNICODE)
+    if _backend == "postgres":
+        return (" | " if any_term else " & ").join(f"{t}:*" for t in terms)
+    return (" OR " if any_term else " ").join(f'"{t}"*' for t in terms)
+
+
+def search(
+    db: Session,
+    user_id: int,
+    query: str,
+    limit: int = 20,
+    conversation_id: int | None = None,
+) -> list[dict]:
+    """Return ranked snippets for the user's messages and files."""
+    match = build_match_query(query)
+    if not match or _backend is None:
+        return []
+
+    if _backend == "postgres":
+        sql = f"""
+            SELECT c.conversation_id, c.message_id, c.file_id, c.page,
+                   ts_headline('simple', c.content, to_tsquery('simple', :match),
+                               'StartSel=[, StopSel=], MinWords=5, MaxWords=' || :snippet_tokens
+                               ) AS snippet,
+                   -ts_rank({_TSVECTOR}, to_tsquery('simple', :match)) AS score
+            FROM search_chunks c
+            WHERE {_TSVECTOR} @@ to_tsquery('simple', :match) AND c.user_id = :user_id
+        """
+    else:
+        sql = """
+            SELECT c.conversation_id, c.message_id, c.file_id, c.page,
+                   snippet(search_chunks_fts, 0, '[', ']', '…', :snippet_tokens) AS snippet,
+                   bm25(search_chunks_fts) AS score
+            FROM search_chunks_fts
+            JOIN search_chunks c ON c.id = search_chunks_fts.rowid
+            WHERE search_chunks_fts MATCH :match AND c.user_id = :user_id
+        """
+    params = {"match": match, "user_id": user_id, "limit": limit, "snippet_tokens": SNIPPET_TOKENS}
+    if conversation_id is not None:
+        sql += " AND c.conversation_id = :conversation_id"
+        params["conversation_id"] = conversation_id
+    sql += " ORDER BY score LIMIT :limit"
+
+    rows = db.execute(text(sql), params).mappings().all()
+    return [
+        {
+            "conversation_id": r["conversation_id"],
+            "message_id": r["message_id"],
+            "file_id": r["file_id"],
+            "page": r["page"],
+            "snippet": r["snippet"],
+            # bm25() (and the negated ts_rank) is lower-is-better; expose higher-is-better
+            "score": round(-r["score"], 4),
+        }
+        for r in rows
+    ]
@@ -1,6 +1,5 @@
-import httpx
-
 from backend.config import settings
+from backend.services.http_client import get_client
 
 BASE_URL = "https://api.telegram.org/bot{token}/"
 
@@ -14,9 +13,9 @@ async def get_me() -> dict:
     if not settings.TELEGRAM_BOT_TOKEN:
         return {"ok": False, "description": "TELEGRAM_BOT_TOKEN no configurado"}
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.get(_url("getMe"))
-        return resp.json()
+    client = get_client("telegram")
+    resp = await client.get(_url("getMe"), timeout=10.0)
+    return resp.json()
 
 
 async def send_message(chat_id: str, text: str) -> dict:
@@ -24,15 +23,16 @@ async def send_message(chat_id: str, text: str) -> dict:
     if not settings.TELEGRAM_BOT_TOKEN:
         return {"ok": False, "description": "TELEGRAM_BOT_TOKEN no configurado"}
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.post(
-            _url("sendMessage"),
-            json={
-                "chat_id": chat_id,
-                "text": text,
-            },
-        )
-        return resp.json()
+    client = get_client("telegram")
+    resp = await client.post(
+        _url("sendMessage"),
+        json={
+            "chat_id": chat_id,
+            "text": text,
+        },
+        timeout=30.0,
+    )
+    return resp.json()
 
 
 async def send_document(
@@ -42,11 +42,11 @@ async def send_document(
     if not settings.TELEGRAM_BOT_TOKEN:
         return {"ok": False, "description": "TELEGRAM_BOT_TOKEN no configurado"}
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        with open(filepath, "rb") as f:
-            files = {"document": (filename, f)}
-            data = {"chat_id": chat_id}
-            if caption:
-                data["caption"] = caption[:1024]
-            resp = await client.post(_url("sendDocument"), data=data, files=files)
-            return resp.json()
+    client = get_client("telegram")
+    with open(filepath, "rb") as f:
+        files = {"document": (filename, f)}
+        data = {"chat_id": chat_id}
+        if caption:
+            data["caption"] = caption[:1024]
+        resp = await client.post(_url("sendDocument"), data=data, files=files, timeout=60.0)
+        return resp.json()
@@ -0,0 +1,73 @@
+"""WebP derivatives of image uploads.
+
+Each stored image gets one WebP per entry in SIZES (longest side in
+pixels), written next to its blob as `<sha256>.<size>.webp`. Because blobs
+are content-addressed, so are the derivatives: identical uploads share
+them, and blob GC removes them with the blob. They are generated in the
+thumbnail process pool right after the upload (see jobs.submit_thumbnails)
+and regenerated on demand when missing, e.g. after SIZES changes or a
+restore without derivatives.
+
+Pillow is imported lazily; without it, for an image it cannot decode, or
+for one larger than THUMBNAIL_MAX_PIXELS (checked from the header, before
+decoding) no derivative is produced and the original is served instead.
+"""
+
+import logging
+import os
+import uuid
+
+from backend.config import settings
+from backend.services import blob_store
+
+logger = logging.getLogger(__name__)
+
+SIZES = {"thumb": 512, "preview": 1280}
+
+
+def thumbnail_path(sha256: str, size: str) -> str:
+    return blob_store.derivative_path(sha256, f"{size}.webp")
+
+
+def generate(sha256: str, sizes: list[str] | None = None) -> list[str]:
+    """Write the missing derivatives of a blob; returns the sizes written.
+
+    Blocking and CPU-bound: runs in the process pool or a worker thread.
+    """
+    wanted = [s for s in (sizes or SIZES) if not os.path.exists(thumbnail_path(sha256, s))]
+    if not wanted:
+        return []
+    from PIL import Image, ImageOps
+
+    # Pillow only warns below twice its default limit; refuse outright instead
+    Image.MAX_IMAGE_PIXELS = settings.THUMBNAIL_MAX_PIXELS
+    with Image.open(blob_store.blob_path(sha256)) as src:
+        if src.width * src.height > settings.THUMBNAIL_MAX_PIXELS:
+            raise ValueError(f"image too large ({src.width}x{src.height})")
+        largest = max(SIZES[s] for s in wanted)
+        src.draft("RGB", (largest, largest))  # JPEG: decode at reduced scale
+        img = ImageOps.exif_transpose(src)
+        img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+        # Largest first, so each smaller size is resampled from the previous one
+        for size in sorted(wanted, key=SIZES.get, reverse=True):
+            img.thumbnail((SIZES[size], SIZES[size]), Image.Resampling.LANCZOS)
+            path = thumbnail_path(sha256, size)
+            tmp = f"{path}.{uuid.uuid4().hex}.part"
+            img.save(tmp, "WEBP", quality=settings.THUMBNAIL_QUALITY, method=4)
+            os.replace(tmp, path)
+    return wanted
+
+
+def ensure(sha256: str, size: str) -> str | None:
+    """Path of a derivative, generating it if missing; None if it cannot be made."""
+    path = thumbnail_path(sha256, size)
+    if os.path.exists(path):
+        return path
+    try:
+        generate(sha256, [size])
+    except ImportError:
+        return None
+    except Exception as e:
+        logger.warning("Thumbnail %s of blob %s failed: %s", size, sha256, e)
+        return None
+    return path
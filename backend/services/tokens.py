@@ -0,0 +1,18 @@
+import math
+import re
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def count_tokens(text: str | None) -> int:
+    """Approximate the LLM token count of a text.
+
+    MINIMAX and Perplexity do not ship a local tokenizer, so we use the usual
+    ~4 characters per token estimate, never going below the number of words
+    and punctuation marks (short-word Spanish text tokenizes densely).
+    """
+    if not text:
+        return 0
+    by_chars = math.ceil(len(text) / 4)
+    by_words = len(_WORD_RE.findall(text))
+    return max(by_chars, int(by_words * 0.75), 1)
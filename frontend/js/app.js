@@ -44,7 +44,7 @@ function authHeaders() {
 
 function authUrl(url) {
     const t = getToken();
-    return t ? url + '?token=' + encodeURIComponent(t) : url;
+    return t ? url + (url.includes('?') ? '&' : '?') + 'token=' + encodeURIComponent(t) : url;
 }
 
 async function apiPost(path, body) {
@@ -67,6 +67,31 @@ async function apiGet(path) {
     return data;
 }
 
+// Paginated lists return a page of items; the next page's cursor comes in a header
+async function apiGetPage(path, cursor) {
+    if (cursor) path += (path.includes('?') ? '&' : '?') + 'cursor=' + encodeURIComponent(cursor);
+    const res = await fetch(API + path, { headers: authHeaders() });
+    if (res.status === 401) { clearAuth(); showScreen('login'); throw new Error('Sesion expirada'); }
+    const data = await res.json();
+    if (!res.ok) throw new Error(data.detail || 'Error del servidor');
+    return { items: data, next: res.headers.get('X-Next-Cursor') };
+}
+
+function createLoadMoreButton(label, onClick) {
+    const btn = document.createElement('button');
+    btn.className = 'load-more';
+    btn.textContent = label;
+    btn.addEventListener('click', async () => {
+        btn.disabled = true;
+        try {
+            await onClick();
+        } finally {
+            btn.disabled = false;
+        }
+    });
+    return btn;
+}
+
 async function apiDelete(path) {
     const res = await fetch(API + path, { method: 'DELETE', headers: authHeaders() });
     if (res.status === 401) { clearAuth(); showScreen('login'); throw new Error('Sesion expirada'); }
@@ -135,6 +160,8 @@ form.addEventListener('submit', (e) => {
 
 let currentConversationId = null;
 let conversations = [];
+let conversationsCursor = null;
+let messagesCursor = null;
 let isStreaming = false;
 let searchMode = false;
 let docMode = false;
@@ -153,6 +180,7 @@ let googleConnected = false;
 // --- File explorer state ---
 let activeTab = 'conversations';
 let explorerFiles = [];
+let explorerCursor = null;
 
 // --- Selection mode state ---
 let selectionMode = false;
@@ -241,9 +269,11 @@ sidebarTabs.forEach(tab => {
 
 // --- File Explorer ---
 
-async function loadExplorerFiles() {
+async function loadExplorerFiles(more = false) {
     try {
-        explorerFiles = await apiGet('/api/files');
+        const page = await apiGetPage('/api/files', more ? explorerCursor : null);
+        explorerFiles = more ? explorerFiles.concat(page.items) : page.items;
+        explorerCursor = page.next;
         renderFileExplorer();
     } catch (err) {
         console.error('Error loading files:', err);
@@ -345,6 +375,13 @@ function renderFileExplorer() {
             });
         }
     }
+
+    let loadMore = fileExplorer.querySelector('.load-more');
+    if (!loadMore) {
+        loadMore = createLoadMoreButton('Cargar mas archivos', () => loadExplorerFiles(true));
+        fileExplorer.appendChild(loadMore);
+    }
+    loadMore.hidden = !explorerCursor;
 }
 
 // Collapse/expand file groups
@@ -380,9 +417,17 @@ function updateInputPlaceholder() {
 
 // --- Conversations ---
 
-async function loadConversations() {
+async function loadConversations(more = false) {
     try {
-        conversations = await apiGet('/api/chat/conversations');
+        const page = await apiGetPage('/api/chat/conversations', more ? conversationsCursor : null);
+        if (more) {
+            // Conversations updated meanwhile may reappear in a later page
+            const seen = new Set(conversations.map(c => c.id));
+            conversations = conversations.concat(page.items.filter(c => !seen.has(c.id)));
+        } else {
+            conversations = page.items;
+        }
+        conversationsCursor = page.next;
         renderConversationList();
     } catch (err) {
         console.error('Error loading conversations:', err);
@@ -411,6 +456,9 @@ function renderConversationList() {
         });
         convList.appendChild(el);
     });
+    if (conversationsCursor) {
+        convList.appendChild(createLoadMoreButton('Cargar mas conversaciones', () => loadConversations(true)));
+    }
 }
 
 async function createConversation() {
@@ -435,11 +483,15 @@ async function selectConversation(id) {
     renderConversationList();
     clearPendingFile();
 
-    // Load messages
+    // Load the newest page of messages
     chatMessages.innerHTML = '';
+    messagesCursor = null;
     try {
-        const messages = await apiGet(`/api/chat/conversations/${id}/messages`);
-        messages.forEach(m => renderMessage(m.role, m.content, m.created_at, m.files, m.id));
+        const page = await apiGetPage(`/api/chat/conversations/${id}/messages`);
+        if (currentConversationId !== id) return;
+        page.items.forEach(m => renderMessage(m.role, m.content, m.created_at, m.files, m.id));
+        messagesCursor = page.next;
+        renderOlderMessagesButton();
         scrollToBottom();
     } catch (err) {
         console.error('Error loading messages:', err);
@@ -448,6 +500,29 @@ async function selectConversation(id) {
     msgInput.focus();
 }
 
+function renderOlderMessagesButton() {
+    const existing = chatMessages.querySelector('.load-more');
+    if (existing) existing.remove();
+    if (!messagesCursor) return;
+    chatMessages.prepend(createLoadMoreButton('Cargar mensajes anteriores', loadOlderMessages));
+}
+
+async function loadOlderMessages() {
+    const id = currentConversationId;
+    const page = await apiGetPage(`/api/chat/conversations/${id}/messages`, messagesCursor);
+    if (currentConversationId !== id) return;
+    // Insert above the current first message, keeping the visible messages in place
+    const anchor = chatMessages.querySelector('.msg-bubble');
+    const previousHeight = chatMessages.scrollHeight;
+    page.items.forEach(m => {
+        const bubble = renderMessage(m.role, m.content, m.created_at, m.files, m.id);
+        if (anchor) chatMessages.insertBefore(bubble, anchor);
+    });
+    messagesCursor = page.next;
+    renderOlderMessagesButton();
+    chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+}
+
 async function deleteConversation(id) {
     if (!confirm('Eliminar esta conversacion?')) return;
     try {
@@ -1733,7 +1808,7 @@ function renderMessage(role, content, timestamp, files, messageId) {
             } else if (f.file_type === 'image') {
                 const img = document.createElement('img');
                 img.className = 'msg-file-image';
-                img.src = authUrl(API + `/api/upload/files/${f.id}`);
+                img.src = authUrl(API + `/api/upload/files/${f.id}?size=thumb`);
                 img.alt = f.filename;
                 img.loading = 'lazy';
                 img.addEventListener('click', () => {
@@ -1912,6 +1987,15 @@ async function sendMessage() {
                     continue;
                 }
 
+                // Detect context usage report (prompt tokens for this turn)
+                if (data.startsWith('[CONTEXT:') && data.endsWith(']')) {
+                    try {
+                        const ctx = JSON.parse(data.slice(9, -1));
+                        userBubble.dataset.contextTokens = ctx.tokens;
+                    } catch (e) { /* ignore parse error */ }
+                    continue;
+                }
+
                 // Detect generated document event
                 if (data.startsWith('[FILE:') && data.endsWith(']')) {
                     try {
@@ -1998,6 +2082,8 @@ $('#btn-new-conv').addEventListener('click', createConversation);
 // --- Logout ---
 $('#btn-logout').addEventListener('click', () => {
     exitSelectionMode();
+    // Revoke the token server-side; the UI logs out regardless
+    fetch(API + '/api/auth/logout', { method: 'POST', headers: authHeaders() }).catch(() => {});
     clearAuth();
     currentConversationId = null;
     conversations = [];